@@ -0,0 +1,126 @@
+import os
+import threading
+import zipfile
+
+ARCHIVE_EXTENSIONS = (".zip",)
+# separates the archive path from the member name, e.g. export.zip!/images/frame_000001.png
+ARCHIVE_MEMBER_SEPARATOR = "!/"
+ARCHIVE_ANNOTATIONS_FILE_NAME = "annotations.xml"
+ARCHIVE_IMAGES_FOLDER_NAME = "images"
+
+_archives = {}
+_archives_lock = threading.Lock()
+
+
+def is_archive(file_path):
+    return file_path.lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+def make_member_path(archive_file, member_name):
+    return f"{archive_file}{ARCHIVE_MEMBER_SEPARATOR}{member_name}"
+
+
+def split_member_path(file_path):
+    """
+    Returns (archive file, member name) of an archive member path or (None, file_path) of a regular file path.
+    """
+    if ARCHIVE_MEMBER_SEPARATOR not in file_path:
+        return None, file_path
+    archive_file, member_name = file_path.split(ARCHIVE_MEMBER_SEPARATOR, 1)
+    return archive_file, member_name
+
+
+def is_member_path(file_path):
+    return ARCHIVE_MEMBER_SEPARATOR in file_path
+
+
+def get_archive(archive_file):
+    """
+    Returns an open ZipFile of the archive, shared by all threads of the process. Archives are opened once per
+    process - a ZipFile inherited by a forked worker process would share the file offset with its parent.
+    """
+    key = (os.getpid(), os.path.abspath(archive_file))
+    archive = _archives.get(key)
+    if archive is None:
+        with _archives_lock:
+            archive = _archives.get(key)
+            if archive is None:
+                archive = zipfile.ZipFile(archive_file, "r")
+                _archives[key] = archive
+    return archive
+
+
+def close_archives():
+    with _archives_lock:
+        for (pid, _), archive in list(_archives.items()):
+            if pid == os.getpid():
+                archive.close()
+        _archives.clear()
+
+
+def open_file(file_path):
+    """
+    Opens a regular file or an archive member for binary reading, members are decompressed while being read.
+    """
+    archive_file, member_name = split_member_path(file_path)
+    if archive_file is None:
+        return open(file_path, "rb")
+    return get_archive(archive_file).open(member_name, "r")
+
+
+def read_file(file_path):
+    with open_file(file_path) as f:
+        return f.read()
+
+
+def get_file_size(file_path):
+    archive_file, member_name = split_member_path(file_path)
+    if archive_file is None:
+        return os.path.getsize(file_path)
+    return get_archive(archive_file).getinfo(member_name).file_size
+
+
+def get_file_fingerprint(file_path):
+    """
+    Returns a dict that changes whenever the file does - absolute path, size and modification time of regular files,
+    size and CRC32 of archive members (the archive itself can be rewritten without changing them).
+    """
+    archive_file, member_name = split_member_path(file_path)
+    if archive_file is None:
+        stat = os.stat(file_path)
+        return {"source": os.path.abspath(file_path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    info = get_archive(archive_file).getinfo(member_name)
+    return {"source": get_absolute_path(file_path), "size": info.file_size, "crc32": info.CRC}
+
+
+def get_absolute_path(file_path):
+    archive_file, member_name = split_member_path(file_path)
+    if archive_file is None:
+        return os.path.abspath(file_path)
+    return make_member_path(os.path.abspath(archive_file), member_name)
+
+
+def get_annotations_path(annotations_file):
+    """
+    Returns path of the annotations to parse - annotations.xml in the root of an archive or the file itself.
+    """
+    if not is_archive(annotations_file):
+        return annotations_file
+    if ARCHIVE_ANNOTATIONS_FILE_NAME not in get_archive(annotations_file).NameToInfo:
+        raise ValueError(f"Archive {annotations_file} does not contain {ARCHIVE_ANNOTATIONS_FILE_NAME}")
+    return make_member_path(annotations_file, ARCHIVE_ANNOTATIONS_FILE_NAME)
+
+
+def list_archive_files(archive_file, extensions):
+    """
+    Returns {name: member path} of archive members with the given extensions. Members of the images folder
+    (CVAT export layout) are named relative to it, others relative to the archive root.
+    """
+    images_prefix = ARCHIVE_IMAGES_FOLDER_NAME + "/"
+    files = {}
+    for info in get_archive(archive_file).infolist():
+        if info.is_dir() or not info.filename.lower().endswith(extensions):
+            continue
+        name = info.filename[len(images_prefix):] if info.filename.startswith(images_prefix) else info.filename
+        files[name] = make_member_path(archive_file, info.filename)
+    return files
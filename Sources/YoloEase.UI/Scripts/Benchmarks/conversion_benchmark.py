@@ -0,0 +1,270 @@
+import os
+import sys
+import argparse
+import contextlib
+import io
+import json
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ConvertCVATtoYolo8 as converter
+import ConvertCVATtoYolo8_cls as cls_converter
+from generate_cvat_dataset import generate_dataset
+
+# Measurements below these values are dominated by noise and are not reported as regressions
+MIN_COMPARED_SECONDS = 0.05
+MIN_COMPARED_PEAK_BYTES = 1024 * 1024
+# reference results of the default benchmark options, regenerate it on the target machine with
+# python conversion_benchmark.py --output conversion_baseline.json
+DEFAULT_BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "conversion_baseline.json")
+
+
+class BenchmarkCase:
+    def __init__(self, name, setup, run):
+        """
+        setup(dataset) prepares the input once, run(input) is the measured call and returns the number of processed items.
+        """
+        self.name = name
+        self.setup = setup
+        self.run = run
+
+
+def setup_masks(dataset):
+    annotations = converter.parse_annotations(dataset.annotations_file)
+    return [mask for image in annotations.images for mask in image.masks]
+
+
+def setup_decoded_masks(dataset):
+    return [converter.CvatMaskConverter.rle_to_mask(mask.rle, mask.height, mask.width) for mask in setup_masks(dataset)]
+
+
+def setup_box_batches(dataset):
+    images = converter.parse_annotations(dataset.annotations_file).images
+    batch_size = converter.MASK_BATCH_IMAGE_COUNT
+    return [images[start:start + batch_size] for start in range(0, len(images), batch_size)]
+
+
+def setup_prepared_images(dataset):
+    return converter.prepare_images(dataset.annotations_file)
+
+
+def run_rle_to_mask(masks):
+    for mask in masks:
+        converter.CvatMaskConverter.rle_to_mask(mask.rle, mask.height, mask.width)
+    return len(masks)
+
+
+def run_mask_to_polygons(masks):
+    for mask in masks:
+        converter.CvatMaskConverter.mask_to_polygons(mask)
+    return len(masks)
+
+
+def run_convert_boxes_to_yolo(batches):
+    for images in batches:
+        converter.convert_boxes_to_yolo(images)
+    return sum(len(image.boxes) for images in batches for image in images)
+
+
+def run_split_collection(images):
+    converter.split_collection(images, 80, 20, 0)
+    return len(images)
+
+
+def run_save(dataset, images):
+    output_folder = dataset.create_output_folder("save")
+    writer = converter.FolderDatasetWriter(output_folder, converter.FileMaterializer("symlink"))
+    with writer:
+        converter.save(output_folder, images, writer, 80)
+    return len(images)
+
+
+def run_cls_conversion(dataset):
+    output_folder = dataset.create_output_folder("cls")
+    with contextlib.redirect_stdout(io.StringIO()):
+        cls_converter.convert_annotations_to_yolo([dataset.annotations_file], output_folder)
+    return dataset.image_count
+
+
+BENCHMARK_CASES = [
+    BenchmarkCase("parse_annotations", lambda dataset: dataset.annotations_file,
+                  lambda annotations_file: len(converter.parse_annotations(annotations_file).images)),
+    BenchmarkCase("rle_to_mask", setup_masks, run_rle_to_mask),
+    BenchmarkCase("mask_to_polygons", setup_decoded_masks, run_mask_to_polygons),
+    BenchmarkCase("convert_boxes_to_yolo", setup_box_batches, run_convert_boxes_to_yolo),
+    BenchmarkCase("split_collection", lambda dataset: list(range(dataset.image_count)), run_split_collection),
+    BenchmarkCase("save", lambda dataset: (dataset, setup_prepared_images(dataset)), lambda args: run_save(*args)),
+    BenchmarkCase("cls_parse_annotations", lambda dataset: dataset.annotations_file,
+                  lambda annotations_file: len(cls_converter.parse_annotations(annotations_file).images)),
+    BenchmarkCase("cls_conversion", lambda dataset: dataset, run_cls_conversion),
+]
+
+
+class BenchmarkDataset:
+    def __init__(self, work_folder, image_count, generator_options):
+        self.image_count = image_count
+        self.dataset_folder = os.path.join(work_folder, f"dataset-{image_count}")
+        self.output_folder = os.path.join(work_folder, f"output-{image_count}")
+        self.annotations_file = os.path.join(self.dataset_folder, "annotations.xml")
+        self.generator_options = generator_options
+
+    def generate(self):
+        options_file = os.path.join(self.dataset_folder, "generator-options.json")
+        options = dict(self.generator_options, image_count=self.image_count)
+        try:
+            with open(options_file, "r") as f:
+                if json.load(f) == options:
+                    return
+        except FileNotFoundError:
+            pass
+
+        shutil.rmtree(self.dataset_folder, ignore_errors=True)
+        started_at = time.perf_counter()
+        generate_dataset(self.dataset_folder, **options)
+        with open(options_file, "w") as f:
+            json.dump(options, f)
+        print(f"Generated {self.image_count} image(s) in {time.perf_counter() - started_at:.1f}s")
+
+    def create_output_folder(self, name):
+        output_folder = os.path.join(self.output_folder, name)
+        shutil.rmtree(output_folder, ignore_errors=True)
+        return output_folder
+
+
+def measure(case, dataset, repeat):
+    """
+    Returns the best wall time of repeat runs and peak traced memory of a separate run, so tracing does not skew timings.
+    """
+    case_input = case.setup(dataset)
+    best_seconds = None
+    item_count = 0
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        item_count = case.run(case_input)
+        elapsed = time.perf_counter() - started_at
+        best_seconds = elapsed if best_seconds is None else min(best_seconds, elapsed)
+
+    tracemalloc.start()
+    try:
+        case.run(case_input)
+        _, peak_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "seconds": best_seconds,
+        "items": item_count,
+        "items_per_second": item_count / best_seconds if best_seconds > 0 else None,
+        "peak_bytes": peak_bytes,
+    }
+
+
+def compare_with_baseline(results, baseline, tolerance, benchmark_names):
+    """
+    Prints time and memory ratios against the baseline, returns a list of regressions exceeding the tolerance
+    and mismatches - benchmarks of the run missing from the baseline and baseline benchmarks of the run scales
+    (among benchmark_names) missing from the run, e.g. after a benchmark was renamed.
+    Measurements smaller than MIN_COMPARED_SECONDS/MIN_COMPARED_PEAK_BYTES are printed, but never reported.
+    """
+    regressions = []
+    print(f"{'scale':>7} {'benchmark':<24} {'seconds':>10} {'baseline':>10} {'ratio':>7} {'peak MB':>9} {'ratio':>7}")
+    for scale, scale_results in results.items():
+        baseline_results = baseline.get(scale, {})
+        for name in baseline_results:
+            if name in benchmark_names and name not in scale_results:
+                regressions.append(f"{name} @ {scale} image(s) is in the baseline, but was not measured")
+        for name, result in scale_results.items():
+            expected = baseline_results.get(name)
+            if expected is None:
+                print(f"{scale:>7} {name:<24} {result['seconds']:>10.4f} {'-':>10}")
+                regressions.append(f"{name} @ {scale} image(s) is missing from the baseline")
+                continue
+            time_ratio = result["seconds"] / expected["seconds"] if expected["seconds"] > 0 else 1.0
+            memory_ratio = result["peak_bytes"] / expected["peak_bytes"] if expected["peak_bytes"] > 0 else 1.0
+            print(
+                f"{scale:>7} {name:<24} {result['seconds']:>10.4f} {expected['seconds']:>10.4f} {time_ratio:>6.2f}x "
+                f"{result['peak_bytes'] / (1024 * 1024):>9.1f} {memory_ratio:>6.2f}x"
+            )
+            if time_ratio > 1 + tolerance and result["seconds"] >= MIN_COMPARED_SECONDS:
+                regressions.append(f"{name} @ {scale} image(s) is {time_ratio:.2f}x slower")
+            if memory_ratio > 1 + tolerance and result["peak_bytes"] >= MIN_COMPARED_PEAK_BYTES:
+                regressions.append(f"{name} @ {scale} image(s) uses {memory_ratio:.2f}x more memory")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmarks stages of ConvertCVATtoYolo8.py and ConvertCVATtoYolo8_cls.py on synthetic CVAT datasets"
+    )
+    parser.add_argument("--scales", type=int, nargs="+", default=[100, 1000], help="Image counts of generated datasets")
+    parser.add_argument("--benchmarks", nargs="+", choices=[case.name for case in BENCHMARK_CASES],
+                        help="Benchmarks to run, all by default")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--boxesPerImage", type=int, default=4)
+    parser.add_argument("--masksPerImage", type=int, default=2)
+    parser.add_argument("--maskSize", type=int, default=128)
+    parser.add_argument("--holesPerMask", type=int, default=1)
+    parser.add_argument("--classCount", type=int, default=8)
+    parser.add_argument("--tagsPerImage", type=int, default=1)
+    parser.add_argument("--workDirectory", help="Folder for generated datasets, reused between runs. Temporary by default")
+    parser.add_argument("--output", help="Path to JSON file to write results to")
+    parser.add_argument("--baseline", nargs="?", const=DEFAULT_BASELINE_FILE,
+                        help="Path to JSON results of a previous run to compare with, "
+                             f"{os.path.basename(DEFAULT_BASELINE_FILE)} next to the script if no path is given")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Relative slowdown or memory growth against the baseline that is reported as a regression")
+    args = parser.parse_args()
+    if args.baseline and not os.path.exists(args.baseline):
+        parser.error(
+            f"baseline {args.baseline} does not exist, create it by running the benchmarks with the same options "
+            f"and --output {args.baseline}"
+        )
+
+    generator_options = {
+        "boxes_per_image": args.boxesPerImage,
+        "masks_per_image": args.masksPerImage,
+        "mask_size": args.maskSize,
+        "holes_per_mask": args.holesPerMask,
+        "class_count": args.classCount,
+        "tags_per_image": args.tagsPerImage,
+    }
+    cases = [case for case in BENCHMARK_CASES if not args.benchmarks or case.name in args.benchmarks]
+
+    with contextlib.ExitStack() as stack:
+        work_folder = args.workDirectory or stack.enter_context(tempfile.TemporaryDirectory(prefix="conversion-benchmark-"))
+        results = {}
+        for image_count in args.scales:
+            dataset = BenchmarkDataset(work_folder, image_count, generator_options)
+            dataset.generate()
+            scale_results = {}
+            for case in cases:
+                scale_results[case.name] = measure(case, dataset, args.repeat)
+                result = scale_results[case.name]
+                print(
+                    f"{image_count:>7} {case.name:<24} {result['seconds']:.4f}s, {result['items']} item(s), "
+                    f"peak {result['peak_bytes'] / (1024 * 1024):.1f} MB"
+                )
+            shutil.rmtree(dataset.output_folder, ignore_errors=True)
+            results[str(image_count)] = scale_results
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=1)
+        print(f"Results saved to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(results, baseline, args.tolerance, [case.name for case in cases])
+        if regressions:
+            print("Regressions and baseline mismatches:\n" + "\n".join(regressions))
+            sys.exit(1)
+        print("No regressions")
+
+
+if __name__ == "__main__":
+    main()
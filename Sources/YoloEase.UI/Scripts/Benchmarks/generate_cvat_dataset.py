@@ -0,0 +1,142 @@
+import os
+import argparse
+import cv2
+import numpy as np
+from xml.sax.saxutils import quoteattr
+
+
+def mask_to_rle(mask):
+    """Encodes a binary mask as CVAT RLE - alternating background/foreground run lengths, starting with background."""
+    flat = (mask.reshape(-1) > 0).astype(np.int8)
+    changes = np.flatnonzero(np.diff(np.concatenate(([0], flat, [0]))))
+    boundaries = np.concatenate(([0], changes))
+    if boundaries[-1] != len(flat):
+        boundaries = np.concatenate((boundaries, [len(flat)]))
+    return ", ".join(str(int(run)) for run in np.diff(boundaries))
+
+
+def create_mask(rng, width, height, hole_count):
+    """Creates an elliptic mask with hole_count circular holes that do not touch the outer boundary."""
+    mask = np.zeros((height, width), dtype=np.uint8)
+    center = (width // 2, height // 2)
+    axes = (max(1, width // 2 - 1), max(1, height // 2 - 1))
+    cv2.ellipse(mask, center, axes, 0, 0, 360, 255, -1)
+    if hole_count > 0:
+        hole_radius = max(1, min(width, height) // (4 * (hole_count + 1)))
+        for hole_index in range(hole_count):
+            angle = 2 * np.pi * hole_index / hole_count + rng.uniform(0, 0.3)
+            distance = 0 if hole_count == 1 else min(axes) / 2
+            hole_center = (int(center[0] + distance * np.cos(angle)), int(center[1] + distance * np.sin(angle)))
+            cv2.circle(mask, hole_center, hole_radius, 0, -1)
+    return mask
+
+
+def create_image(rng, width, height):
+    """Creates a cheap to encode image - a gradient with a few rectangles, so image encoding does not dominate generation."""
+    image = np.zeros((height, width, 3), dtype=np.uint8)
+    image[:, :, 0] = np.linspace(0, 255, width, dtype=np.uint8)[np.newaxis, :]
+    image[:, :, 1] = np.linspace(0, 255, height, dtype=np.uint8)[:, np.newaxis]
+    for _ in range(3):
+        left, top = int(rng.integers(0, width)), int(rng.integers(0, height))
+        color = tuple(int(c) for c in rng.integers(0, 255, 3))
+        cv2.rectangle(image, (left, top), (left + width // 4, top + height // 4), color, -1)
+    return image
+
+
+def generate_dataset(
+        output_folder,
+        image_count,
+        boxes_per_image=2,
+        masks_per_image=1,
+        mask_size=64,
+        holes_per_mask=0,
+        class_count=4,
+        tags_per_image=0,
+        image_width=640,
+        image_height=480,
+        image_format="png",
+        seed=0,
+):
+    """
+    Writes a synthetic CVAT 1.1 dataset - annotations.xml and the images it references - to output_folder.
+
+    Every image gets boxes_per_image boxes, masks_per_image masks of mask_size x mask_size pixels with holes_per_mask
+    holes and tags_per_image tags (used by the classification converter), labels are picked from class_count classes.
+    Boxes and masks always lie within the image. The same seed produces the same dataset.
+    Returns the path to annotations.xml.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(output_folder, exist_ok=True)
+    class_names = [f"class{class_index}" for class_index in range(class_count)]
+    mask_size = min(mask_size, image_width, image_height)
+    # all masks have the same shape, so the RLE is computed once
+    mask_rle = quoteattr(mask_to_rle(create_mask(rng, mask_size, mask_size, holes_per_mask)))
+
+    annotations_file = os.path.join(output_folder, "annotations.xml")
+    with open(annotations_file, "w", encoding="utf-8") as f:
+        f.write('<?xml version="1.0" encoding="utf-8"?>\n<annotations>\n  <version>1.1</version>\n')
+        for image_index in range(image_count):
+            image_name = f"image_{image_index:06d}.{image_format}"
+            image = create_image(rng, image_width, image_height)
+            cv2.imwrite(os.path.join(output_folder, image_name), image)
+
+            f.write(f'  <image id="{image_index}" name="{image_name}" width="{image_width}" height="{image_height}">\n')
+            for _ in range(boxes_per_image):
+                left, top = rng.uniform(0, image_width - 2), rng.uniform(0, image_height - 2)
+                right = rng.uniform(left + 1, image_width)
+                bottom = rng.uniform(top + 1, image_height)
+                label = class_names[rng.integers(0, class_count)]
+                f.write(
+                    f'    <box label="{label}" source="manual" occluded="0" '
+                    f'xtl="{left:.2f}" ytl="{top:.2f}" xbr="{right:.2f}" ybr="{bottom:.2f}" z_order="0">\n    </box>\n'
+                )
+            for _ in range(masks_per_image):
+                left = int(rng.integers(0, image_width - mask_size + 1))
+                top = int(rng.integers(0, image_height - mask_size + 1))
+                label = class_names[rng.integers(0, class_count)]
+                f.write(
+                    f'    <mask label="{label}" source="manual" occluded="0" rle={mask_rle} '
+                    f'left="{left}" top="{top}" width="{mask_size}" height="{mask_size}" z_order="0">\n    </mask>\n'
+                )
+            for tag_index in rng.choice(class_count, size=min(tags_per_image, class_count), replace=False):
+                f.write(f'    <tag label="{class_names[tag_index]}" source="manual">\n    </tag>\n')
+            f.write("  </image>\n")
+        f.write("</annotations>\n")
+    return annotations_file
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generates a synthetic CVAT 1.1 dataset (annotations.xml and images)")
+    parser.add_argument("--outputDirectory", required=True)
+    parser.add_argument("--imageCount", type=int, default=100)
+    parser.add_argument("--boxesPerImage", type=int, default=2)
+    parser.add_argument("--masksPerImage", type=int, default=1)
+    parser.add_argument("--maskSize", type=int, default=64, help="Width and height of every mask in pixels")
+    parser.add_argument("--holesPerMask", type=int, default=0)
+    parser.add_argument("--classCount", type=int, default=4)
+    parser.add_argument("--tagsPerImage", type=int, default=0)
+    parser.add_argument("--imageWidth", type=int, default=640)
+    parser.add_argument("--imageHeight", type=int, default=480)
+    parser.add_argument("--imageFormat", choices=["png", "jpg", "bmp"], default="png")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    annotations_file = generate_dataset(
+        args.outputDirectory,
+        args.imageCount,
+        boxes_per_image=args.boxesPerImage,
+        masks_per_image=args.masksPerImage,
+        mask_size=args.maskSize,
+        holes_per_mask=args.holesPerMask,
+        class_count=args.classCount,
+        tags_per_image=args.tagsPerImage,
+        image_width=args.imageWidth,
+        image_height=args.imageHeight,
+        image_format=args.imageFormat,
+        seed=args.seed,
+    )
+    print(f"Generated {args.imageCount} image(s), annotations: {annotations_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+import os
+import sys
+import argparse
+import json
+import subprocess
+
+SCRIPTS_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVIEST_IMPORT_COUNT = 5
+
+
+class ImportBudget:
+    def __init__(self, module, budget_ms, deferred_modules=()):
+        """
+        budget_ms limits cumulative import time of the module, deferred_modules must not be loaded by importing it.
+        """
+        self.module = module
+        self.budget_ms = budget_ms
+        self.deferred_modules = list(deferred_modules)
+
+
+# numpy alone takes ~100 ms, so the converter budget leaves room for it and its own module-level code only
+IMPORT_BUDGETS = [
+    ImportBudget("ConvertCVATtoYolo8", 250, ["cv2", "matplotlib", "shapely"]),
+    ImportBudget("ConvertCVATtoYolo8_cls", 50, ["cv2", "numpy"]),
+    ImportBudget("DatasetShards", 200, ["cv2"]),
+    ImportBudget("OnnxExport", 50, ["numpy", "cv2", "onnx", "onnxruntime"]),
+    ImportBudget("Yolo8Wrapper", 50, ["ultralytics", "torch"]),
+    ImportBudget("Yolo8_cls_pipeline", 50, ["ultralytics", "torch"]),
+]
+
+
+def parse_import_times(output):
+    """
+    Parses -X importtime output into (level, name, self us, cumulative us) tuples in the order they were reported -
+    nested imports are reported before the module that imported them.
+    """
+    entries = []
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue  # header line
+        name_part = parts[2][1:]
+        name = name_part.lstrip()
+        entries.append(((len(name_part) - len(name)) // 2, name, int(parts[0]), int(parts[1])))
+    return entries
+
+
+def measure_import(module):
+    """
+    Imports the module in a fresh interpreter, returns its cumulative import time, heaviest direct imports and
+    names of all modules loaded by it.
+    """
+    code = f"import sys; sys.path.insert(0, {SCRIPTS_FOLDER!r}); import {module}"
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True)
+    if process.returncode != 0:
+        raise RuntimeError(f"Failed to import {module}: {process.stderr.strip().splitlines()[-1]}")
+
+    entries = parse_import_times(process.stderr)
+    module_index = next(index for index, entry in enumerate(entries) if entry[0] == 0 and entry[1] == module)
+    module_start = module_index
+    while module_start > 0 and entries[module_start - 1][0] > 0:
+        module_start -= 1
+    nested = entries[module_start:module_index]
+    direct_imports = sorted((entry for entry in nested if entry[0] == 1), key=lambda entry: -entry[3])
+    return {
+        "cumulative_ms": entries[module_index][3] / 1000,
+        "heaviest_imports": {entry[1]: entry[3] / 1000 for entry in direct_imports[:HEAVIEST_IMPORT_COUNT]},
+        "loaded_modules": {entry[1] for entry in nested},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measures import time of the Scripts with -X importtime and checks it against per-script budgets"
+    )
+    parser.add_argument("--modules", nargs="+", choices=[budget.module for budget in IMPORT_BUDGETS],
+                        help="Modules to measure, all by default")
+    parser.add_argument("--repeat", type=int, default=5, help="Imports per module, the fastest one is reported")
+    parser.add_argument("--budgetScale", type=float, default=1.0,
+                        help="Multiplier of all budgets, for machines slower than a development workstation")
+    parser.add_argument("--output", help="Path to JSON file to write results to")
+    args = parser.parse_args()
+
+    results = {}
+    violations = []
+    for budget in IMPORT_BUDGETS:
+        if args.modules and budget.module not in args.modules:
+            continue
+        try:
+            measurements = [measure_import(budget.module) for _ in range(args.repeat)]
+        except RuntimeError as ex:
+            print(f"{budget.module:<24} skipped: {ex}")
+            continue
+        result = min(measurements, key=lambda measurement: measurement["cumulative_ms"])
+        budget_ms = budget.budget_ms * args.budgetScale
+        loaded_deferred = sorted(
+            module for module in budget.deferred_modules
+            if any(name == module or name.startswith(module + ".") for name in result["loaded_modules"])
+        )
+        heaviest = ", ".join(f"{name} {ms:.1f}" for name, ms in result["heaviest_imports"].items())
+        print(f"{budget.module:<24} {result['cumulative_ms']:>8.1f} ms (budget {budget_ms:.0f} ms), heaviest: {heaviest}")
+
+        if result["cumulative_ms"] > budget_ms:
+            violations.append(f"{budget.module} imports in {result['cumulative_ms']:.1f} ms, budget is {budget_ms:.0f} ms")
+        if loaded_deferred:
+            violations.append(f"{budget.module} loads deferred module(s) on import: {', '.join(loaded_deferred)}")
+        results[budget.module] = {
+            "cumulative_ms": result["cumulative_ms"],
+            "budget_ms": budget_ms,
+            "heaviest_imports": result["heaviest_imports"],
+            "loaded_deferred_modules": loaded_deferred,
+        }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=1)
+        print(f"Results saved to {args.output}")
+
+    if violations:
+        print("Budget violations:\n" + "\n".join(violations))
+        sys.exit(1)
+    print("All imports are within budget")
+
+
+if __name__ == "__main__":
+    main()
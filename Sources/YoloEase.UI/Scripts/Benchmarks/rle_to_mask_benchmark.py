@@ -0,0 +1,65 @@
+import os
+import sys
+import argparse
+import timeit
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ConvertCVATtoYolo8 import CvatMaskConverter
+from generate_cvat_dataset import mask_to_rle
+
+
+def legacy_rle_to_mask(rle_string, height, width):
+    """Per-pixel decoder that CvatMaskConverter.rle_to_mask used before it was vectorized."""
+    rle_numbers = [int(num_string) for num_string in rle_string.split(',')]
+    if len(rle_numbers) % 2 != 0:
+        rle_numbers = rle_numbers[:-1]
+    rle_pairs = np.array(rle_numbers).reshape(-1, 2)
+    img = np.zeros([height, width], dtype=np.uint8)
+    start = 0
+    for index, length in rle_pairs:
+        start += index
+        for j in range(length):
+            img[start // width, start % width] = 255
+            start += 1
+    return img
+
+
+def create_mask(size, seed):
+    rng = np.random.default_rng(seed)
+    mask = np.zeros((size, size), dtype=np.uint8)
+    yy, xx = np.mgrid[0:size, 0:size]
+    for _ in range(8):
+        cx, cy = rng.integers(0, size, 2)
+        radius = rng.integers(size // 10, size // 3)
+        mask[(xx - cx) ** 2 + (yy - cy) ** 2 <= radius ** 2] = 255
+    return mask
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares vectorized and legacy CVAT RLE mask decoders")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[64, 256, 1024])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'size':>6} {'foreground':>11} {'legacy, ms':>11} {'vectorized, ms':>15} {'speedup':>8}")
+    for size in args.sizes:
+        mask = create_mask(size, seed=size)
+        rle = mask_to_rle(mask)
+
+        expected = legacy_rle_to_mask(rle, size, size)
+        actual = CvatMaskConverter.rle_to_mask(rle, size, size)
+        if not np.array_equal(expected, actual):
+            raise AssertionError(f"Decoders produced different masks for size {size}")
+
+        legacy_time = min(timeit.repeat(lambda: legacy_rle_to_mask(rle, size, size), number=1, repeat=args.repeat))
+        vectorized_time = min(timeit.repeat(lambda: CvatMaskConverter.rle_to_mask(rle, size, size), number=1, repeat=args.repeat))
+        print(
+            f"{size:>6} {int(np.count_nonzero(mask)):>11} {legacy_time * 1000:>11.2f} "
+            f"{vectorized_time * 1000:>15.2f} {legacy_time / vectorized_time:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
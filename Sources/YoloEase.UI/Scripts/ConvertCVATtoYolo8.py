@@ -1,24 +1,80 @@
 import os
 import argparse
+import contextlib
+import cProfile
+import errno
+import hashlib
+import io
+import json
+import pickle
+import sys
+import time
 import xml.etree.ElementTree as ET
 import shutil
-import cv2
 import logging
+import tempfile
 import numpy as np
-import matplotlib.pyplot as plt
-from collections import defaultdict
-from shapely.geometry import Polygon, LineString, GeometryCollection
-from dataclasses import dataclass
-from shapely.ops import split
-
-# Set up logging
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from ArchiveFiles import (
+    close_archives, get_absolute_path, get_annotations_path, get_file_fingerprint, get_file_size, is_archive,
+    is_member_path, list_archive_files, open_file, read_file
+)
+from DatasetShards import DEFAULT_MAX_SHARD_SIZE, ShardWriter, write_shard_index
+from DatasetStatistics import STATISTICS_FILE_NAME, DatasetStatistics
+from ImageDeduplication import (
+    DEDUP_KEEP_POLICIES, DEDUP_MODES, DEDUP_REPORT_FILE_NAME, DEFAULT_NEAR_DUPLICATE_DISTANCE, deduplicate_images,
+    hash_file_content
+)
+from PolygonCache import DEFAULT_MAX_CACHE_SIZE, PolygonCache
+
+# cv2, matplotlib and pstats are imported by the functions that use them - box-only conversions never load them,
+# see Benchmarks/import_time_benchmark.py
+
 logger = logging.getLogger(__name__)
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
 
 YOLO_EPSILON = 1e-9
+DEFAULT_LABEL_PRECISION = 16
+MASK_BATCH_IMAGE_COUNT = 256
+MASK_BATCH_CHUNK_COUNT = 64
+# Must be incremented whenever conversion produces different labels for the same input,
+# this invalidates cached conversion results of incremental runs
+CONVERTER_VERSION = 5
+MIN_SIMPLIFICATION_TOLERANCE = 0.5
+MAX_SIMPLIFICATION_ITERATIONS = 32
+# nearest ring vertices checked for visibility before all of them are sorted, see CvatMaskConverter.find_visible_vertex
+VISIBLE_VERTEX_CANDIDATE_COUNT = 16
+LINK_MODES = ["copy", "symlink", "relative-symlink", "hardlink", "reflink", "auto"]
+# Modes tried by "auto" from the cheapest one, copy always works and is the last resort
+AUTO_LINK_MODES = ["hardlink", "reflink", "copy"]
+DEFAULT_IO_THREAD_COUNT = 8
+OUTPUT_FORMATS = ["folders", "shards"]
+TASKS = ["detect", "segment", "classify", "crops"]
+# split folders of classification datasets are named as YOLO classification expects them
+CLASSIFY_SPLIT_NAMES = {"valid": "val"}
+PROFILE_SUMMARY_FUNCTION_COUNT = 25
+PROGRESS_MODES = ["none", "json"]
+DEFAULT_PROGRESS_RATE = 2.0
+TILES_FOLDER_NAME = "tiles"
+TILE_MANIFEST_FILE_NAME = "tiles.json"
+DEFAULT_TILE_MIN_VISIBILITY = 0.25
+# crops match the image size Yolo8_cls_pipeline.py trains classifiers at
+DEFAULT_CROP_SIZE = 100
+DEFAULT_CROP_PADDING = 0.1
+# gray used by YOLO to fill letterbox borders
+LETTERBOX_FILL_VALUE = 114
+IMAGE_FORMATS = ["keep", "jpg", "webp"]
+DEFAULT_IMAGE_QUALITY = 90
+DEFAULT_IMAGE_CACHE_DIRECTORY = os.path.join(tempfile.gettempdir(), "YoloEase", "image-cache")
+UNCHANGED_IMAGE_MARKER_EXTENSION = ".unchanged"
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp")
 
 
 def main():
+    # Logs go to stderr, stdout is reserved for progress events
+    logging.basicConfig(level=logging.INFO, format=LOG_FORMAT)
     try:
         main_internal()
     except Exception as ex:
@@ -28,117 +84,882 @@ def main():
 
 def main_internal():
     script_options = parse_options()
+    if script_options.worker:
+        run_worker(sys.stdin, sys.stdout)
+    else:
+        run_script(script_options)
+
+
+def convert(annotations_files, output_directory, options=None):
+    """
+    Library entry point - converts CVAT annotation files to a YOLO dataset in output_directory and returns ConversionStats.
+
+    Options is a dict of ScriptOptions arguments (e.g. {"train_val_percentage": 80, "link_mode": "hardlink"}),
+    unspecified ones have the same defaults as command-line options. Unlike the script, it does not configure logging
+    of the calling process and does not report progress, whatever an earlier run in the process has configured.
+    """
+    progress_reporter.configure(None)
+    return run_conversion(ScriptOptions(annotations_files, output_directory, **(options or {})))
+
+
+def run_script(script_options, progress_stream=None, request_id=None):
+    """
+    Runs a conversion requested through command-line arguments - applies logging, progress and profiling options.
+    Progress events are written to progress_stream (stdout by default), tagged with request_id if it is specified.
+    """
+    logging.getLogger().setLevel(logging.DEBUG if script_options.verbose else logging.INFO)
+    progress_stream = progress_stream or sys.stdout
+    progress_reporter.configure(
+        progress_stream if script_options.progress == "json" else None, script_options.progress_rate, request_id
+    )
     logger.info(f"Options: {script_options}")
 
+    profiler = None
+    if script_options.profile_file:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        return run_conversion(script_options)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            save_profile(profiler, script_options.profile_file)
+
+
+def run_worker(input_stream, output_stream):
+    """
+    Runs a long-lived worker that keeps modules imported between conversions.
+
+    Reads one JSON request per line from input_stream, e.g. {"id": 1, "arguments": ["--inputAnnotationsFiles", "a.xml",
+    "--outputDirectory", "out", "--trainPercentage", "80"]}, arguments are the same as command-line arguments
+    of the script. Writes one JSON line per request to output_stream - {"event": "result", "id": 1, "result": {...}}
+    with ConversionStats or {"event": "error", "id": 1, "error": "..."}. Progress events of a request, if enabled
+    by its arguments, are written to output_stream before its result and carry its id as well.
+    {"command": "shutdown"} or end of input stops the worker.
+    """
+    def write_event(event):
+        output_stream.write(json.dumps(event, separators=(",", ":")) + "\n")
+        output_stream.flush()
+
+    write_event({"event": "ready", "converter_version": CONVERTER_VERSION})
+    for line in input_stream:
+        if not line.strip():
+            continue
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get("id")
+            if request.get("command") == "shutdown":
+                break
+            argument_errors = io.StringIO()
+            try:
+                with contextlib.redirect_stderr(argument_errors):
+                    script_options = parse_options(request["arguments"])
+            except SystemExit:
+                raise ValueError(f"Invalid arguments: {argument_errors.getvalue().strip()}")
+            if script_options.worker:
+                raise ValueError("Worker mode can not be requested from a worker")
+            stats = run_script(script_options, output_stream, request_id)
+            write_event({"event": "result", "id": request_id, "result": asdict(stats)})
+        except Exception as ex:
+            logger.exception(f"Request {request_id} has failed")
+            write_event({"event": "error", "id": request_id, "error": str(ex)})
+        finally:
+            # the next request configures progress reporting of its own
+            progress_reporter.configure(None)
+    logger.info("Worker has stopped")
+
+
+def run_conversion(script_options):
+    """
+    Converts annotation files to the output directory according to the options, returns ConversionStats.
+    Per-stage timings of the run are collected to conversion_metrics and saved to the metrics file, if it is specified.
+    """
+    conversion_metrics.reset()
+    box_conversion_summary.reset()
+    # stages left unfinished by a failed run of a worker
+    progress_reporter.reset()
+    run_started_at = ConversionMetrics.now()
+    # archives left open by a failed run of a worker may have changed since
+    close_archives()
+
     output_folder = os.path.abspath(script_options.output_directory)
-    if os.path.exists(output_folder):
+    manifest = None
+    if script_options.incremental:
+        manifest = ConversionManifest.load(output_folder)
+    elif os.path.exists(output_folder):
         shutil.rmtree(output_folder)
     os.makedirs(output_folder, exist_ok=True)
 
-    images_by_path = []
-    for annotations_file in script_options.input_annotations_files:
-        images_by_path.extend(prepare_images(annotations_file))
+    mask_options = MaskConversionOptions(
+        polygon_tolerance=script_options.polygon_tolerance,
+        max_polygon_points=script_options.max_polygon_points,
+    )
+    polygon_cache = None
+    if script_options.polygon_cache_file:
+        polygon_cache = PolygonCache(script_options.polygon_cache_file, script_options.polygon_cache_size)
+        mask_options.polygon_cache = polygon_cache
+    tile_options = None
+    if script_options.tile_size > 0:
+        tile_options = TileOptions(script_options.tile_size, script_options.tile_stride, script_options.tile_min_visibility)
+    with create_mask_executor(script_options.workers) as mask_executor, polygon_cache or contextlib.nullcontext():
+        def prepare(annotations_file):
+            if manifest is None:
+                return iter_prepared_images(annotations_file, mask_executor, mask_options) if script_options.streaming \
+                    else prepare_images(annotations_file, mask_executor, mask_options)
+            return manifest.prepare_images(annotations_file, mask_executor, mask_options, script_options.streaming)
+
+        if script_options.streaming:
+            image_count = sum(
+                manifest.count_matching_images(annotations_file, mask_options) if manifest is not None
+                else count_matching_images(annotations_file)
+                for annotations_file in script_options.input_annotations_files
+            )
+            logger.info(f"Streaming {image_count} image(s) from {len(script_options.input_annotations_files)} annotation file(s)")
+            progress_reporter.start("convert", image_count)
+            images_by_path = (
+                image
+                for annotations_file in script_options.input_annotations_files
+                for image in prepare(annotations_file)
+            )
+        else:
+            progress_reporter.start("convert")
+            images_by_path = []
+            for annotations_file in script_options.input_annotations_files:
+                images_by_path.extend(prepare(annotations_file))
+            progress_reporter.finish("convert")
+            if script_options.dedup != "none":
+                images_by_path = deduplicate_prepared_images(images_by_path, script_options, output_folder)
+            if tile_options is not None:
+                images_by_path = tile_prepared_images(images_by_path, output_folder, tile_options, script_options.io_threads)
+            if script_options.image_size > 0 or script_options.image_format != "keep":
+                images_by_path = resize_prepared_images(images_by_path, script_options, mask_executor)
+            image_count = len(images_by_path)
+
+        dataset_statistics = DatasetStatistics()
+        with create_dataset_writer(script_options, output_folder, manifest, mask_executor) as dataset_writer:
+            class_names = save(
+                output_folder, images_by_path, dataset_writer, script_options.train_val_percentage, image_count, dataset_statistics
+            )
+        if script_options.streaming:
+            # streamed images are prepared while they are written, the stage ends with the last of them
+            progress_reporter.finish("convert")
+    close_archives()
+
+    if tile_options is not None and script_options.link_mode not in ("symlink", "relative-symlink"):
+        # tiles are hard links (or copies) in the dataset now, the folder is needed only as a target of symbolic links
+        shutil.rmtree(os.path.join(output_folder, TILES_FOLDER_NAME))
+
+    if manifest is not None:
+        manifest.save(script_options.input_annotations_files)
+
+    with conversion_metrics.measure("statistics"):
+        statistics = dataset_statistics.save(os.path.join(output_folder, STATISTICS_FILE_NAME), class_names)
+    logger.info(
+        f"Dataset statistics saved to {STATISTICS_FILE_NAME}: {statistics['total']['boxes']} box(es), "
+        f"{statistics['total']['masks']} mask(s), {statistics['total']['empty_images']} empty image(s)"
+    )
+
+    if box_conversion_summary.skipped_count > 0:
+        logger.warning(f"Box conversion: {box_conversion_summary}")
+    elif box_conversion_summary.clipped_count > 0:
+        logger.info(f"Box conversion: {box_conversion_summary}")
+    if mask_options.is_simplification_enabled:
+        logger.info(f"Polygon simplification: {mask_options.simplification_summary}")
+    if polygon_cache is not None:
+        logger.info(f"Polygon cache: {polygon_cache}")
+
+    run_wall_seconds, run_cpu_seconds = ConversionMetrics.elapsed(run_started_at)
+    conversion_metrics.add("total", run_wall_seconds, run_cpu_seconds, image_count)
+    logger.info(f"Stage timings: {conversion_metrics}")
+    if script_options.metrics_file:
+        conversion_metrics.save(script_options.metrics_file, image_count)
+        logger.info(f"Conversion metrics saved to {script_options.metrics_file}")
+
+    logger.info(f"Processing completed, images: {image_count}")
+    return ConversionStats(
+        output_directory=output_folder,
+        image_count=image_count,
+        class_names=class_names,
+        elapsed_seconds=run_wall_seconds,
+        stages=conversion_metrics.stages,
+        statistics=statistics,
+    )
+
+
+def deduplicate_prepared_images(images, script_options, output_folder):
+    """
+    Drops duplicate images according to dedup options (see deduplicate_images), writes the report of dropped
+    images to the output folder and returns kept images.
+    """
+    with conversion_metrics.measure("deduplication", len(images)):
+        kept_indices, report = deduplicate_images(
+            [image.image_file for image in images],
+            [len(image.bboxes) + len(image.masks) for image in images],
+            script_options.dedup,
+            script_options.dedup_distance,
+            script_options.dedup_keep,
+            script_options.io_threads,
+        )
+    report_file = os.path.join(output_folder, DEDUP_REPORT_FILE_NAME)
+    report.save(report_file)
+    logger.info(f"Deduplication: {report}, report saved to {report_file}")
+    return [images[index] for index in kept_indices]
+
+
+def tile_prepared_images(images, output_folder, tile_options, thread_count):
+    """
+    Replaces every image with its tiles (see cut_image_to_tiles), written to the tiles folder of the output folder
+    on a thread pool. Writes tiles.json that maps each tile back to its source image and position for stitching
+    of predictions. Returns tile images in the order of source images.
+    """
+    tiles_folder = os.path.join(output_folder, TILES_FOLDER_NAME)
+    os.makedirs(tiles_folder, exist_ok=True)
+    started_at = ConversionMetrics.now()
+    progress_reporter.start("tile", len(images))
+    tile_images = []
+    tile_entries = {}
+    with ThreadPoolExecutor(max_workers=thread_count) as executor:
+        for tiles, stage_timing in executor.map(lambda image: cut_image_to_tiles(image, tiles_folder, tile_options), images):
+            conversion_metrics.add("tile_cutting", *stage_timing, len(tiles))
+            for tile_image, tile_entry in tiles:
+                tile_images.append(tile_image)
+                tile_entries[os.path.basename(tile_image.image_file)] = tile_entry
+            progress_reporter.advance("tile")
+    progress_reporter.finish("tile")
+    conversion_metrics.add("tiling", *ConversionMetrics.elapsed(started_at), len(tile_images))
+
+    with open(os.path.join(output_folder, TILE_MANIFEST_FILE_NAME), "w") as f:
+        json.dump(
+            {
+                "tile_size": tile_options.tile_size,
+                "stride": tile_options.stride,
+                "min_visibility": tile_options.min_visibility,
+                "tiles": tile_entries,
+            },
+            f,
+            indent=1,
+        )
+    logger.info(f"Cut {len(images)} image(s) to {len(tile_images)} tile(s) of {tile_options}")
+    return tile_images
+
 
-    save(output_folder, images_by_path, script_options.use_symlinks, script_options.train_val_percentage)
+def cut_image_to_tiles(image, tiles_folder, tile_options):
+    """
+    Cuts an image to overlapping tiles, returns (tiles, (wall time, CPU time)), where tiles are (YoloImage,
+    tiles.json entry) pairs. Tiles cover the whole image, the last tile of a row or column is aligned to the image
+    edge, images smaller than the tile size become a single tile. Boxes and mask polygons are clipped to each tile,
+    objects with less than min_visibility of their area inside the tile are dropped.
+    """
+    import cv2
+
+    started_at = ConversionMetrics.now()
+    source = cv2.imdecode(np.frombuffer(read_file(image.image_file), dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+    if source is None:
+        raise ValueError(f"Failed to decode image {image.image_file}")
+    source_height, source_width = source.shape[:2]
+    stem, extension = os.path.splitext(os.path.basename(image.image_file))
+
+    tiles = []
+    for top in tile_origins(source_height, tile_options.tile_size, tile_options.stride):
+        for left in tile_origins(source_width, tile_options.tile_size, tile_options.stride):
+            width = min(tile_options.tile_size, source_width)
+            height = min(tile_options.tile_size, source_height)
+            tile_file = os.path.join(tiles_folder, f"{stem}_{left}_{top}{extension}")
+            success, encoded_tile = cv2.imencode(extension, source[top:top + height, left:left + width])
+            if not success:
+                raise ValueError(f"Failed to encode tile {tile_file}")
+            encoded_tile.tofile(tile_file)
+
+            tile_image = YoloImage(
+                image_file=tile_file,
+                bboxes=clip_boxes_to_tile(image.bboxes, left, top, width, height, tile_options.min_visibility),
+                masks=clip_masks_to_tile(image.masks, left, top, width, height, tile_options.min_visibility),
+            )
+            tile_entry = {
+                "source": get_absolute_path(image.image_file),
+                "left": left,
+                "top": top,
+                "width": width,
+                "height": height,
+                "source_width": source_width,
+                "source_height": source_height,
+            }
+            tiles.append((tile_image, tile_entry))
+    return tiles, ConversionMetrics.elapsed(started_at)
+
+
+def tile_origins(length, tile_size, stride):
+    if length <= tile_size:
+        return [0]
+    origins = list(range(0, length - tile_size, stride))
+    origins.append(length - tile_size)
+    return origins
+
+
+def clip_boxes_to_tile(bboxes, left, top, width, height, min_visibility):
+    unscaled_boxes = bboxes.unscaled_boxes - (left, top, left, top)
+    box_left, box_top, box_right, box_bottom = unscaled_boxes.T
+    clipped_left, clipped_top, clipped_right, clipped_bottom = clip_boxes(box_left, box_top, box_right, box_bottom, width, height)
+    box_areas = (box_right - box_left) * (box_bottom - box_top)
+    clipped_areas = (clipped_right - clipped_left) * (clipped_bottom - clipped_top)
+    kept = (clipped_right - clipped_left > YOLO_EPSILON) & (clipped_bottom - clipped_top > YOLO_EPSILON) & (box_areas > 0)
+    kept[kept] = clipped_areas[kept] / box_areas[kept] >= min_visibility
+    tile_boxes = np.stack((clipped_left, clipped_top, clipped_right, clipped_bottom), axis=1)[kept]
+    return YoloBoxes(
+        class_names=[class_name for class_name, is_kept in zip(bboxes.class_names, kept.tolist()) if is_kept],
+        boxes=scale_boxes_to_yolo(tile_boxes, float(width), float(height)),
+        unscaled_boxes=tile_boxes,
+    )
 
-    logger.info(f"Processing completed, images: {len(images_by_path)}")
 
+def clip_masks_to_tile(masks, left, top, width, height, min_visibility):
+    tile_masks = []
+    for mask in masks:
+        polygon = mask.unscaled_mask.reshape(-1, 2).astype(np.float64) - (left, top)
+        polygon_area = calculate_polygon_area(polygon)
+        if polygon_area <= 0:
+            continue
+        clipped = clip_polygon_to_rectangle(polygon, width, height)
+        if len(clipped) < 3 or calculate_polygon_area(clipped) / polygon_area < min_visibility:
+            continue
+        scaled = clipped / (width, height)
+        tile_masks.append(
+            YoloLabeledMask(
+                class_name=mask.class_name,
+                unscaled_mask=clipped.astype(np.float32).reshape(-1, 1, 2),
+                mask=scaled.astype(np.float32).reshape(-1, 1, 2),
+            )
+        )
+    return tile_masks
+
+
+def calculate_polygon_area(points):
+    """
+    Shoelace area of an N x 2 polygon, bridge seams of polygons with holes have zero area, so holes are subtracted.
+    """
+    x, y = points[:, 0], points[:, 1]
+    return abs(float(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1)))) / 2
+
+
+def clip_polygon_to_rectangle(points, width, height):
+    """
+    Clips an N x 2 polygon to the 0..width x 0..height rectangle (Sutherland-Hodgman). Concave polygons stay
+    a single ring, parts connected only along the rectangle edge are joined by zero-area seams, as bridges of holes are.
+    """
+    closed = len(points) > 1 and np.array_equal(points[0], points[-1])
+    if closed:
+        points = points[:-1]
+    for axis, limit, keep_below in ((0, 0.0, False), (0, float(width), True), (1, 0.0, False), (1, float(height), True)):
+        if len(points) == 0:
+            break
+        inside = points[:, axis] <= limit if keep_below else points[:, axis] >= limit
+        if inside.all():
+            continue
+        clipped = []
+        previous, previous_inside = points[-1], inside[-1]
+        for point, point_inside in zip(points, inside):
+            if point_inside != previous_inside:
+                ratio = (limit - previous[axis]) / (point[axis] - previous[axis])
+                intersection = previous + (point - previous) * ratio
+                intersection[axis] = limit
+                clipped.append(intersection)
+            if point_inside:
+                clipped.append(point)
+            previous, previous_inside = point, point_inside
+        points = np.array(clipped, dtype=np.float64).reshape(-1, 2)
+    if closed and len(points) > 0:
+        points = np.concatenate((points, points[:1]))
+    return points
+
+
+def resize_prepared_images(images, script_options, executor=None):
+    """
+    Replaces images with copies downsized to image_size (longest side, never upscaled) and/or transcoded
+    to image_format, so training does not decode and resize full-resolution originals every epoch.
+    Labels are normalized, so they stay valid.
+
+    Copies are cached in the image cache directory by source content hash and target size, format and quality -
+    later runs, including runs for other output directories, reuse them. Missing copies are created on the executor
+    (the mask conversion process pool) or serially. Images that would not change are used as they are.
+    """
+    cache_folder = script_options.image_cache_directory
+    os.makedirs(cache_folder, exist_ok=True)
+    started_at = ConversionMetrics.now()
+    progress_reporter.start("resize", len(images))
+
+    with ThreadPoolExecutor(max_workers=script_options.io_threads) as hash_executor:
+        source_hashes = list(hash_executor.map(hash_file_content, [image.image_file for image in images]))
+
+    resized_images = []
+    pending_jobs = []
+    for image, source_hash in zip(images, source_hashes):
+        stem, extension = os.path.splitext(os.path.basename(image.image_file))
+        output_extension = extension if script_options.image_format == "keep" else f".{script_options.image_format}"
+        cache_file = os.path.join(
+            cache_folder,
+            # 128 bits of the hash are enough and keep cache paths short on Windows
+            f"{source_hash[:32]}_{script_options.image_size}_{script_options.image_quality}{output_extension.lower()}",
+        )
+        resized_images.append(
+            YoloImage(cache_file, image.bboxes, image.masks, output_name=f"{stem}{output_extension}", tags=image.tags)
+        )
+        if os.path.exists(cache_file + UNCHANGED_IMAGE_MARKER_EXTENSION):
+            resized_images[-1] = image
+        elif not os.path.exists(cache_file):
+            pending_jobs.append((image.image_file, cache_file))
+
+    logger.info(
+        f"Resizing images to {script_options.image_size or 'original size'} "
+        f"({script_options.image_format}, quality {script_options.image_quality}), "
+        f"cached: {len(images) - len(pending_jobs)}, to convert: {len(pending_jobs)}"
+    )
+    progress_reporter.advance("resize", len(images) - len(pending_jobs))
+    job_arguments = (
+        [source_file for source_file, _ in pending_jobs],
+        [cache_file for _, cache_file in pending_jobs],
+        [script_options.image_size] * len(pending_jobs),
+        [script_options.image_quality] * len(pending_jobs),
+    )
+    if executor is None:
+        job_results = map(resize_image_file, *job_arguments)
+    else:
+        chunk_size = max(1, len(pending_jobs) // MASK_BATCH_CHUNK_COUNT)
+        job_results = executor.map(resize_image_file, *job_arguments, chunksize=chunk_size)
+    unchanged_files = set()
+    for (source_file, cache_file), (is_changed, wall_seconds, cpu_seconds) in zip(pending_jobs, job_results):
+        conversion_metrics.add("image_resizing", wall_seconds, cpu_seconds, 1)
+        if not is_changed:
+            unchanged_files.add(cache_file)
+        progress_reporter.advance("resize")
+    progress_reporter.finish("resize")
+
+    if unchanged_files:
+        for index, image in enumerate(resized_images):
+            if image.image_file in unchanged_files:
+                resized_images[index] = images[index]
+    conversion_metrics.add("resizing", *ConversionMetrics.elapsed(started_at), len(images))
+    return resized_images
+
+
+def resize_image_file(source_file, cache_file, max_size, quality):
+    """
+    Writes the source image downsized so its longest side is at most max_size (0 keeps the size) and encoded
+    according to the cache file extension. Returns (whether the image was written, wall time, CPU time) -
+    if the image is not downsized and keeps its format, only an empty marker file is written, so later runs
+    do not decode it again.
+    Takes only plain values, so it can be executed in a worker process.
+    """
+    import cv2
+
+    started_at = ConversionMetrics.now()
+    output_extension = os.path.splitext(cache_file)[1]
+    is_transcoded = normalize_image_extension(output_extension) != normalize_image_extension(os.path.splitext(source_file)[1])
+    # JPEG has neither alpha nor 16-bit channels, other formats keep the image as it is
+    read_flags = cv2.IMREAD_COLOR if output_extension.lower() == ".jpg" else cv2.IMREAD_UNCHANGED
+    image = cv2.imdecode(np.frombuffer(read_file(source_file), dtype=np.uint8), read_flags)
+    if image is None:
+        raise ValueError(f"Failed to decode image {source_file}")
+
+    height, width = image.shape[:2]
+    scale = max_size / max(width, height) if max_size > 0 else 1.0
+    if scale >= 1.0 and not is_transcoded:
+        open(cache_file + UNCHANGED_IMAGE_MARKER_EXTENSION, "wb").close()
+        return False, *ConversionMetrics.elapsed(started_at)
+    if scale < 1.0:
+        size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+    encode_parameters = {
+        ".jpg": [cv2.IMWRITE_JPEG_QUALITY, quality],
+        ".webp": [cv2.IMWRITE_WEBP_QUALITY, quality],
+    }.get(output_extension.lower(), [])
+    success, encoded_image = cv2.imencode(output_extension, image, encode_parameters)
+    if not success:
+        raise ValueError(f"Failed to encode image {source_file} as {output_extension}")
+    # other runs can share the cache, so the file is renamed into place only when it is complete
+    temporary_file = f"{cache_file}.{os.getpid()}.tmp"
+    encoded_image.tofile(temporary_file)
+    os.replace(temporary_file, cache_file)
+    return True, *ConversionMetrics.elapsed(started_at)
+
+
+def cut_box_crops(image_file, boxes, crop_files, crop_size, padding):
+    """
+    Decodes an image once and writes a crop of each of its boxes (N x 4 array of center x, center y, width, height
+    normalized by the image size) to the matching crop file. Boxes are enlarged by padding of their size on every side
+    and clipped to the image, crops are letterboxed to crop_size x crop_size squares. Returns (wall time, CPU time).
+    Takes only plain values, so it can be executed in a worker process.
+    """
+    import cv2
+
+    started_at = ConversionMetrics.now()
+    source = cv2.imdecode(np.frombuffer(read_file(image_file), dtype=np.uint8), cv2.IMREAD_COLOR)
+    if source is None:
+        raise ValueError(f"Failed to decode image {image_file}")
+    height, width = source.shape[:2]
+    for (center_x, center_y, box_width, box_height), crop_file in zip(boxes.tolist(), crop_files):
+        left = max(0, int(np.floor((center_x - box_width * (0.5 + padding)) * width)))
+        top = max(0, int(np.floor((center_y - box_height * (0.5 + padding)) * height)))
+        right = min(width, max(left + 1, int(np.ceil((center_x + box_width * (0.5 + padding)) * width))))
+        bottom = min(height, max(top + 1, int(np.ceil((center_y + box_height * (0.5 + padding)) * height))))
+        crop = letterbox_image(source[top:bottom, left:right], crop_size)
+        success, encoded_crop = cv2.imencode(os.path.splitext(crop_file)[1], crop)
+        if not success:
+            raise ValueError(f"Failed to encode crop {crop_file}")
+        encoded_crop.tofile(crop_file)
+    return ConversionMetrics.elapsed(started_at)
+
+
+def letterbox_image(image, size):
+    """
+    Resizes an image to fit a size x size square keeping its aspect ratio, the rest of the square is filled with gray.
+    """
+    import cv2
+
+    height, width = image.shape[:2]
+    scale = size / max(width, height)
+    resized_width = min(size, max(1, round(width * scale)))
+    resized_height = min(size, max(1, round(height * scale)))
+    resized = cv2.resize(
+        image, (resized_width, resized_height), interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+    )
+    letterboxed = np.full((size, size, 3), LETTERBOX_FILL_VALUE, dtype=np.uint8)
+    top = (size - resized_height) // 2
+    left = (size - resized_width) // 2
+    letterboxed[top:top + resized_height, left:left + resized_width] = resized
+    return letterboxed
+
+
+def normalize_image_extension(extension):
+    extension = extension.lower()
+    return ".jpg" if extension == ".jpeg" else extension
+
+
+def save_profile(profiler, profile_file):
+    """
+    Dumps profiler stats in pstats format (readable by pstats, snakeviz etc.) and logs the most expensive functions.
+    Only the main process is profiled, mask conversion in worker processes is visible through conversion metrics.
+    """
+    import pstats
 
-def prepare_images(annotations_file):
+    profiler.dump_stats(profile_file)
+    summary = io.StringIO()
+    pstats.Stats(profiler, stream=summary).sort_stats(pstats.SortKey.CUMULATIVE).print_stats(PROFILE_SUMMARY_FUNCTION_COUNT)
+    logger.info(f"Profile saved to {profile_file}, top functions by cumulative time:\n{summary.getvalue()}")
+
+
+def create_dataset_writer(script_options, output_folder, manifest=None, executor=None):
+    """
+    Executor is the process pool crops are cut on, they are cut on the calling thread if it is None.
+    """
+    if script_options.output_format == "shards":
+        return ShardDatasetWriter(output_folder, script_options.max_shard_size)
+    link_mode = get_dataset_link_mode(script_options)
+    if script_options.tasks:
+        return MultiTaskDatasetWriter(
+            output_folder,
+            script_options.tasks,
+            FileMaterializer(link_mode, script_options.io_threads),
+            manifest,
+            script_options.label_precision,
+            CropOptions(script_options.crop_size, script_options.crop_padding),
+            executor,
+        )
+    return FolderDatasetWriter(
+        output_folder,
+        FileMaterializer(link_mode, script_options.io_threads),
+        manifest,
+        script_options.label_precision,
+    )
+
+
+def get_dataset_link_mode(script_options):
+    """
+    Returns the link mode images are materialized in the dataset with. Tiles are written to the tiles folder,
+    which is deleted after conversion unless tiles are linked symbolically - they are hard-linked then (falling back
+    to reflinks and copies, see FileMaterializer), so every tile is written once whatever the link mode is.
+    """
+    if script_options.tile_size > 0 and script_options.link_mode not in ("symlink", "relative-symlink"):
+        return "auto"
+    return script_options.link_mode
+
+
+def create_mask_executor(workers):
+    """
+    Creates a process pool used to convert masks to polygons or a null context if conversion should run serially.
+    """
+    if workers is None or workers == 1:
+        return contextlib.nullcontext()
+    max_workers = workers if workers > 0 else os.cpu_count()
+    logger.info(f"Converting masks using {max_workers} worker process(es)")
+    return ProcessPoolExecutor(max_workers=max_workers)
+
+
+def prepare_images(annotations_file, mask_executor=None, mask_options=None):
     annotations = parse_annotations(annotations_file)
     logger.info(f"Preparing annotations from {annotations_file}: {len(annotations.images)} image(s)")
 
-    images_folder = os.path.dirname(annotations_file)
-    all_images = {
-        os.path.splitext(image_file)[0] + os.path.splitext(image_file)[1]: os.path.join(images_folder, image_file)
-        for image_file in os.listdir(images_folder)
-        if image_file.lower().endswith((".png", ".jpg", ".jpeg", ".bmp"))
-    }
+    images_folder = get_images_folder(annotations_file)
+    all_images = list_image_files(images_folder)
 
     if len(annotations.images) != len(all_images):
         logger.info(
             f"Different number of annotated/unannotated images: {len(annotations.images)} vs {len(all_images)}"
         )
 
-    images = []
-    for image in annotations.images:
+    return list(convert_annotated_images(annotations.images, images_folder, all_images, mask_executor, mask_options))
+
+
+def iter_prepared_images(annotations_file, mask_executor=None, mask_options=None):
+    """
+    Streaming counterpart of prepare_images - yields YoloImage objects while annotations file is being parsed,
+    so only a single batch of images is kept in memory at any time.
+    """
+    logger.info(f"Streaming annotations from {annotations_file}")
+    images_folder = get_images_folder(annotations_file)
+    all_images = list_image_files(images_folder)
+    yield from convert_annotated_images(
+        conversion_metrics.measure_iterator("annotation_parsing", iter_annotation_images(annotations_file)),
+        images_folder, all_images, mask_executor, mask_options
+    )
+
+
+def count_matching_images(annotations_file):
+    """
+    Counts annotated images that have a matching image file, i.e. the number of images
+    that prepare_images would return for the annotations file, without converting anything.
+    """
+    all_images = list_image_files(get_images_folder(annotations_file))
+    annotated_images = conversion_metrics.measure_iterator(
+        "annotation_counting", iter_annotation_images(annotations_file, parse_shapes=False)
+    )
+    return sum(1 for image in annotated_images if image.name in all_images)
+
+
+def get_images_folder(annotations_file):
+    """
+    Returns the folder next to the annotations file or, for annotations files that are ZIP archives (CVAT export),
+    the archive itself - images are then read straight from it, see ArchiveFiles.py.
+    """
+    return annotations_file if is_archive(annotations_file) else os.path.dirname(annotations_file)
+
+
+def list_image_files(images_folder):
+    if is_archive(images_folder):
+        return list_archive_files(images_folder, IMAGE_EXTENSIONS)
+    return {
+        os.path.splitext(image_file)[0] + os.path.splitext(image_file)[1]: os.path.join(images_folder, image_file)
+        for image_file in os.listdir(images_folder)
+        if image_file.lower().endswith(IMAGE_EXTENSIONS)
+    }
+
+
+def convert_annotated_images(annotated_images, images_folder, all_images, mask_executor=None, mask_options=None):
+    pending_images = []
+    for image in annotated_images:
         matching_image_file = all_images.get(image.name)
         if matching_image_file is None:
             logger.info(f"Failed to find annotated image {image.name} in {images_folder}")
             continue
 
         if len(image.masks) == 0 and len(image.boxes) == 0:
-            logger.info(f"Image {image.name} in {images_folder} is not annotated")
+            logger.debug("Image %s in %s is not annotated", image.name, images_folder)
 
-        logger.info(f"Processing {image.name}, boxes: {len(image.boxes)}, masks: {len(image.masks)}")
-        boxes = []
-        for box in image.boxes:
-            yolo_box = convert_box_to_yolo(box, image)
-            if yolo_box is not None:
-                boxes.append(yolo_box)
+        pending_images.append((image, matching_image_file))
+        if len(pending_images) >= MASK_BATCH_IMAGE_COUNT:
+            yield from convert_images_to_yolo(pending_images, mask_executor, mask_options)
+            pending_images = []
 
-        yolo_masks = [mask for single_mask in image.masks for mask in parse_to_yolo_labeled_masks(single_mask, image)]
+    yield from convert_images_to_yolo(pending_images, mask_executor, mask_options)
+
+
+def convert_images_to_yolo(pending_images, mask_executor=None, mask_options=None):
+    """
+    Converts a batch of (image, image file) pairs to YoloImage objects.
+
+    Masks of the whole batch are converted together, either serially or on the mask executor, which receives
+    only RLE strings, sizes and simplification settings. Results are collected in submission order, so the output
+    does not depend on the number of workers.
+    """
+    mask_options = mask_options or MaskConversionOptions()
+    mask_jobs = [(mask, image) for image, _ in pending_images for mask in image.masks]
+    if logger.isEnabledFor(logging.DEBUG):
+        for mask, image in mask_jobs:
+            logger.debug("Parsing mask of %s: %s, %d len", image.name, mask.label, len(mask.rle))
+
+    mask_polygons = trace_batch_mask_polygons([mask for mask, _ in mask_jobs], mask_executor, mask_options)
+    polygons_by_mask = iter(
+        (place_mask_polygons(polygons, mask.left, mask.top, image.width, image.height), simplification_stats, stage_timings)
+        for (mask, image), (polygons, simplification_stats, stage_timings) in zip(mask_jobs, mask_polygons)
+    )
+    with conversion_metrics.measure("box_conversion", sum(len(image.boxes) for image, _ in pending_images)):
+        boxes_by_image = convert_boxes_to_yolo([image for image, _ in pending_images])
+    images = []
+    for (image, matching_image_file), boxes in zip(pending_images, boxes_by_image):
+        logger.debug("Processing %s, boxes: %d, masks: %d", image.name, len(image.boxes), len(image.masks))
+        yolo_masks = []
+        for mask in image.masks:
+            polygons, simplification_stats, stage_timings = next(polygons_by_mask)
+            for stage, wall_seconds, cpu_seconds in stage_timings:
+                conversion_metrics.add(stage, wall_seconds, cpu_seconds, 1)
+            if simplification_stats is None:
+                logger.debug("Parsed mask of %s to %d polys", image.name, len(polygons))
+            else:
+                logger.debug("Parsed mask of %s to %d polys, %s", image.name, len(polygons), simplification_stats)
+                mask_options.simplification_summary.add(simplification_stats)
+            yolo_masks.extend(create_yolo_labeled_masks(mask, polygons))
         # CvatMaskConverter.draw_and_show_polygons(image.height, image.width, [yolo_mask.unscaled_mask for yolo_mask in yolo_masks])
 
         images.append(
-            YoloImage(image_file=matching_image_file, bboxes=boxes, masks=yolo_masks)
+            YoloImage(image_file=matching_image_file, bboxes=boxes, masks=yolo_masks, tags=image.tags)
         )
 
+    progress_reporter.advance("convert", len(images))
     return images
 
 
-def convert_box_to_yolo(box, image):
-    if image.width <= 0 or image.height <= 0:
-        logger.warning(
-            f"Skipping box '{box.label}' in {image.name}: invalid image size {image.width}x{image.height}"
-        )
-        return None
-
-    image_width = float(image.width)
-    image_height = float(image.height)
-
-    left = min(float(box.xtl), float(box.xbr))
-    top = min(float(box.ytl), float(box.ybr))
-    right = max(float(box.xtl), float(box.xbr))
-    bottom = max(float(box.ytl), float(box.ybr))
-
-    clipped_left = clamp(left, 0.0, image_width)
-    clipped_top = clamp(top, 0.0, image_height)
-    clipped_right = clamp(right, 0.0, image_width)
-    clipped_bottom = clamp(bottom, 0.0, image_height)
-
-    clipped_width = clipped_right - clipped_left
-    clipped_height = clipped_bottom - clipped_top
-    if clipped_width <= YOLO_EPSILON or clipped_height <= YOLO_EPSILON:
-        logger.warning(
-            f"Skipping box '{box.label}' in {image.name}: box is outside the image after clipping "
-            f"({left:g}, {top:g}, {right:g}, {bottom:g}) within {image.width}x{image.height}"
-        )
-        return None
+def trace_batch_mask_polygons(masks, mask_executor, mask_options):
+    """
+    Traces polygons of masks (see trace_mask_polygons), serially or on the mask executor, which receives only
+    RLE strings, sizes and simplification settings. If the polygon cache is enabled, only masks missing in it
+    are traced and their results are added to it. Identical masks are traced once. Results are in the order of masks.
+    """
+    polygon_cache = mask_options.polygon_cache
+    keys = [
+        get_polygon_cache_key(mask.rle, mask.width, mask.height, mask_options.polygon_tolerance, mask_options.max_polygon_points)
+        for mask in masks
+    ]
+    # identical masks of the batch (e.g. repeated stamps) are looked up, traced and cached once
+    first_indices = {}
+    for index, key in enumerate(keys):
+        first_indices.setdefault(key, index)
+
+    results_by_key = {}
+    if polygon_cache is not None:
+        with conversion_metrics.measure("polygon_cache_lookup", len(first_indices)):
+            cached = polygon_cache.get_many(list(first_indices))
+        for key, (polygons, stats) in cached.items():
+            results_by_key[key] = (polygons, PolygonSimplificationStats(*stats) if stats is not None else None, [])
+    pending_indices = [index for key, index in first_indices.items() if key not in results_by_key]
+
+    mask_arguments = (
+        [masks[index].rle for index in pending_indices],
+        [masks[index].width for index in pending_indices],
+        [masks[index].height for index in pending_indices],
+        [mask_options.polygon_tolerance] * len(pending_indices),
+        [mask_options.max_polygon_points] * len(pending_indices),
+    )
+    with conversion_metrics.measure("mask_conversion", len(pending_indices)):
+        if mask_executor is None:
+            traced = list(map(trace_mask_polygons, *mask_arguments))
+        else:
+            chunk_size = max(1, len(pending_indices) // MASK_BATCH_CHUNK_COUNT)
+            traced = list(mask_executor.map(trace_mask_polygons, *mask_arguments, chunksize=chunk_size))
+    for index, result in zip(pending_indices, traced):
+        results_by_key[keys[index]] = result
+
+    if polygon_cache is not None and pending_indices:
+        with conversion_metrics.measure("polygon_cache_update", len(pending_indices)):
+            polygon_cache.put_many(
+                (
+                    keys[index],
+                    polygons,
+                    None if stats is None else (stats.vertices_before, stats.vertices_after, stats.iou),
+                )
+                for index, (polygons, stats, _) in zip(pending_indices, traced)
+            )
 
-    if (
-        abs(clipped_left - left) > YOLO_EPSILON
-        or abs(clipped_top - top) > YOLO_EPSILON
-        or abs(clipped_right - right) > YOLO_EPSILON
-        or abs(clipped_bottom - bottom) > YOLO_EPSILON
-    ):
-        logger.info(
-            f"Clipped box '{box.label}' in {image.name}: "
-            f"({left:g}, {top:g}, {right:g}, {bottom:g}) -> "
-            f"({clipped_left:g}, {clipped_top:g}, {clipped_right:g}, {clipped_bottom:g})"
+    # stage timings are reported once, by the first of identical masks
+    results = []
+    for index, key in enumerate(keys):
+        polygons, stats, stage_timings = results_by_key[key]
+        results.append((polygons, stats, stage_timings if first_indices[key] == index else []))
+    return results
+
+
+def get_polygon_cache_key(rle, width, height, polygon_tolerance, max_polygon_points):
+    key_hash = hashlib.blake2b(
+        f"{CONVERTER_VERSION}|{width}|{height}|{polygon_tolerance}|{max_polygon_points}|".encode("ascii"), digest_size=16
+    )
+    key_hash.update(rle.encode("ascii"))
+    return key_hash.digest()
+
+
+def convert_boxes_to_yolo(images):
+    """
+    Converts boxes of a batch of images to YoloBoxes, one per image.
+
+    Boxes of all images are gathered into a BoxTable and clipped, filtered and normalized by whole-array operations.
+    Boxes of images with an invalid size and boxes left empty by clipping are dropped, they are counted
+    in box_conversion_summary instead of being logged one by one.
+    """
+    table = BoxTable.from_images(images)
+    image_widths = np.array([image.width for image in images], dtype=np.float64)[table.image_indices]
+    image_heights = np.array([image.height for image in images], dtype=np.float64)[table.image_indices]
+
+    left = np.minimum(table.xtl, table.xbr)
+    top = np.minimum(table.ytl, table.ybr)
+    right = np.maximum(table.xtl, table.xbr)
+    bottom = np.maximum(table.ytl, table.ybr)
+    clipped_left, clipped_top, clipped_right, clipped_bottom = clip_boxes(left, top, right, bottom, image_widths, image_heights)
+
+    valid_size = (image_widths > 0) & (image_heights > 0)
+    kept = valid_size & (clipped_right - clipped_left > YOLO_EPSILON) & (clipped_bottom - clipped_top > YOLO_EPSILON)
+    clipped = kept & (
+        (np.abs(clipped_left - left) > YOLO_EPSILON)
+        | (np.abs(clipped_top - top) > YOLO_EPSILON)
+        | (np.abs(clipped_right - right) > YOLO_EPSILON)
+        | (np.abs(clipped_bottom - bottom) > YOLO_EPSILON)
+    )
+    box_conversion_summary.add(
+        len(table),
+        int(np.count_nonzero(~valid_size)),
+        int(np.count_nonzero(valid_size & ~kept)),
+        int(np.count_nonzero(clipped)),
+    )
+
+    unscaled_boxes = np.stack((clipped_left, clipped_top, clipped_right, clipped_bottom), axis=1)[kept]
+    boxes = scale_boxes_to_yolo(unscaled_boxes, image_widths[kept], image_heights[kept])
+    class_ids = table.class_ids[kept]
+    image_ends = np.cumsum(np.bincount(table.image_indices[kept], minlength=len(images))).tolist()
+    yolo_boxes = []
+    start = 0
+    for end in image_ends:
+        yolo_boxes.append(
+            YoloBoxes(
+                class_names=[table.class_names[class_id] for class_id in class_ids[start:end].tolist()],
+                boxes=boxes[start:end],
+                unscaled_boxes=unscaled_boxes[start:end],
+            )
         )
+        start = end
+    return yolo_boxes
 
-    return YoloLabeledBBox(
-        class_name=box.label,
-        bbox=RectangleD.from_ltrb(
-            clipped_left / image_width,
-            clipped_top / image_height,
-            clipped_right / image_width,
-            clipped_bottom / image_height,
-        ),
-        unscaled_bbox=RectangleD.from_ltrb(
-            clipped_left, clipped_top, clipped_right, clipped_bottom
-        ),
+
+def clip_boxes(left, top, right, bottom, width, height):
+    """
+    Clips arrays of box coordinates to the 0..width x 0..height areas, returns clipped (left, top, right, bottom).
+    """
+    return (
+        np.minimum(np.maximum(left, 0.0), width),
+        np.minimum(np.maximum(top, 0.0), height),
+        np.minimum(np.maximum(right, 0.0), width),
+        np.minimum(np.maximum(bottom, 0.0), height),
+    )
+
+
+def scale_boxes_to_yolo(unscaled_boxes, width, height):
+    """
+    Converts N x 4 (left, top, right, bottom) pixel boxes to N x 4 (center x, center y, width, height) normalized
+    by the image size.
+    """
+    scaled_left = unscaled_boxes[:, 0] / width
+    scaled_top = unscaled_boxes[:, 1] / height
+    scaled_width = unscaled_boxes[:, 2] / width - scaled_left
+    scaled_height = unscaled_boxes[:, 3] / height - scaled_top
+    return np.stack(
+        (scaled_left + scaled_width / 2.0, scaled_top + scaled_height / 2.0, scaled_width, scaled_height), axis=1
     )
 
 
@@ -146,125 +967,559 @@ def clamp(value, min_value, max_value):
     return max(min_value, min(value, max_value))
 
 
-def format_yolo_float(value):
+def format_yolo_float(value, precision=DEFAULT_LABEL_PRECISION):
     safe_value = clamp(float(value), 0.0, 1.0)
-    text = f"{safe_value:.16f}".rstrip("0").rstrip(".")
+    text = f"{safe_value:.{precision}f}".rstrip("0").rstrip(".") if precision > 0 else f"{safe_value:.0f}"
     return text if text else "0"
 
 
+def serialize_yolo_labels(label_rows, precision=DEFAULT_LABEL_PRECISION):
+    """
+    Serializes (class index, values) rows into the text of a YOLO label file, one row per line.
+
+    Produces the same text as formatting every value with format_yolo_float, but does it in bulk:
+    values of all rows are clamped as a single NumPy array and formatted by a single %-operation.
+    Clamped values always format to a fixed width ("0.ddd" or "1.000"), so trailing zeros are
+    stripped on a 2D byte view of the formatted text instead of per value.
+    """
+    if not label_rows:
+        return ""
+
+    value_counts = np.array([np.size(values) for _, values in label_rows], dtype=np.int64)
+    values = np.concatenate([np.asarray(values, dtype=np.float64).ravel() for _, values in label_rows])
+    # NaN is formatted as 0 and -0.0 as 0 to match format_yolo_float
+    values = np.clip(np.nan_to_num(values, nan=0.0), 0.0, 1.0) + 0.0
+
+    token_width = precision + 2 if precision > 0 else 1
+    text = ((f"%.{precision}f " * len(values)) % tuple(values.tolist())).encode("ascii")
+    tokens = np.frombuffer(text, dtype=np.uint8).reshape(-1, token_width + 1)
+    if precision > 0:
+        nonzero_digits = tokens[:, 2:token_width] != ord("0")
+        token_lengths = np.where(
+            nonzero_digits.any(axis=1), token_width - np.argmax(nonzero_digits[:, ::-1], axis=1), 1
+        )
+    else:
+        token_lengths = np.full(len(tokens), token_width)
+    columns = np.arange(token_width + 1)
+    # keeps significant characters of every token and the separator after it
+    stripped = tokens[(columns < token_lengths[:, None]) | (columns == token_width)].tobytes().decode("ascii")
+
+    token_ends = np.concatenate(([0], np.cumsum(token_lengths + 1)))
+    row_ends = np.cumsum(value_counts)
+    row_starts = row_ends - value_counts
+    lines = []
+    for (class_index, _), start, end in zip(label_rows, token_ends[row_starts].tolist(), token_ends[row_ends].tolist()):
+        lines.append(f"{class_index} {stripped[start:end - 1] if end > start else ''}\n")
+    return "".join(lines)
+
+
 def parse_to_yolo_labeled_masks(mask, image):
-    logger.info(f"Parsing mask of {image.name}: {mask.label}, {len(mask.rle)} len")
+    logger.debug("Parsing mask of %s: %s, %d len", image.name, mask.label, len(mask.rle))
 
-    polygons = CvatMaskConverter.cvat_rle_to_polygon(mask.rle, mask.height, mask.width)
-    adjusted_polygons = CvatMaskConverter.adjust_polygon_coords(polygons, mask.left, mask.top)
-    logger.info(f"Parsed mask of {image.name} to {len(polygons)} polys")
-    # CvatMaskConverter.draw_and_show_polygons(image.height, image.width, adjusted_polygons)
+    polygons, _, _ = convert_mask_to_polygons(
+        mask.rle, mask.left, mask.top, mask.width, mask.height, image.width, image.height
+    )
+    logger.debug("Parsed mask of %s to %d polys", image.name, len(polygons))
+    return create_yolo_labeled_masks(mask, polygons)
+
+
+def convert_mask_to_polygons(
+        rle, left, top, width, height, image_width, image_height, polygon_tolerance=0.0, max_polygon_points=0
+):
+    """
+    Converts a single CVAT mask to a list of (polygon, scaled polygon) pairs,
+    PolygonSimplificationStats (None if simplification is disabled) and (stage, wall time, CPU time) timings.
+
+    The polygon is in image pixel coordinates, the scaled one is normalized by the image size.
+    Takes only plain values, so it can be executed in a worker process.
+    """
+    polygons, simplification_stats, stage_timings = trace_mask_polygons(
+        rle, width, height, polygon_tolerance, max_polygon_points
+    )
+    return place_mask_polygons(polygons, left, top, image_width, image_height), simplification_stats, stage_timings
+
+
+def trace_mask_polygons(rle, width, height, polygon_tolerance=0.0, max_polygon_points=0):
+    """
+    Decodes a CVAT mask and traces its polygons in mask coordinates, returns polygons,
+    PolygonSimplificationStats (None if simplification is disabled) and (stage, wall time, CPU time) timings.
+    The result depends only on the arguments, so it can be cached by them.
+    """
+    started_at = ConversionMetrics.now()
+    mask = CvatMaskConverter.rle_to_mask(rle, height, width)
+    rle_decoded_at = ConversionMetrics.now()
+    rings = CvatMaskConverter.find_contour_rings(mask)
+    contours_found_at = ConversionMetrics.now()
+    polygons = CvatMaskConverter.rings_to_polygons(rings, polygon_tolerance, max_polygon_points)
+    stage_timings = [
+        ("rle_decoding", *ConversionMetrics.elapsed(started_at, rle_decoded_at)),
+        ("contour_extraction", *ConversionMetrics.elapsed(rle_decoded_at, contours_found_at)),
+        ("polygon_building", *ConversionMetrics.elapsed(contours_found_at)),
+    ]
+
+    simplification_stats = None
+    if polygon_tolerance > 0 or max_polygon_points > 0:
+        scoring_started_at = ConversionMetrics.now()
+        simplification_stats = PolygonSimplificationStats(
+            vertices_before=sum(CvatMaskConverter.count_polygon_points(outer, holes) for outer, holes in rings),
+            vertices_after=sum(len(polygon) for polygon in polygons),
+            iou=CvatMaskConverter.calculate_iou(mask, polygons),
+        )
+        stage_timings.append(("simplification_scoring", *ConversionMetrics.elapsed(scoring_started_at)))
+    return polygons, simplification_stats, stage_timings
+
+
+def place_mask_polygons(polygons, left, top, image_width, image_height):
+    """
+    Moves polygons traced from a mask to image pixel coordinates, returns (polygon, scaled polygon) pairs,
+    the scaled one is normalized by the image size.
+    """
+    adjusted_polygons = CvatMaskConverter.adjust_polygon_coords(polygons, left, top)
+    # CvatMaskConverter.draw_and_show_polygons(image_height, image_width, adjusted_polygons)
 
     scaled_polygons = [polygon.astype(np.float32).copy() for polygon in adjusted_polygons]  # convert to float first
     for polygon in scaled_polygons:
-        polygon[:, :, 0] /= image.width
-        polygon[:, :, 1] /= image.height
+        polygon[:, :, 0] /= image_width
+        polygon[:, :, 1] /= image_height
+
+    return list(zip(adjusted_polygons, scaled_polygons))
 
-    yolo_masks = [
+
+def create_yolo_labeled_masks(mask, polygons):
+    return [
         YoloLabeledMask(
             class_name=mask.label,
             unscaled_mask=polygon,
             mask=scaled_polygon
         )
-        for polygon, scaled_polygon in zip(adjusted_polygons, scaled_polygons)
+        for polygon, scaled_polygon in polygons
     ]
 
-    return yolo_masks
-
 
-def save(output_folder, images, use_symlinks, train_val_percentage):
+def save(output_folder, images, dataset_writer, train_val_percentage, image_count=None, statistics=None):
+    """
+    Splits images to train/valid/test parts and writes them with their labels using the dataset writer
+    (FolderDatasetWriter or ShardDatasetWriter).
+
+    Images can be provided as any iterable, in which case image_count must be specified - images are then
+    consumed one by one and never collected into a list. Class indices are assigned in the order classes
+    are first seen, the writer is finished with the class list after all images. Label rows of an image passed
+    to the writer are its box rows followed by its mask rows. If statistics (DatasetStatistics) are specified,
+    every written image is added to them. Returns class names.
+    """
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
 
-    labels = defaultdict(lambda: None)
-    idx = 0
-
-    for image in images:
-        for bbox in image.bboxes:
-            class_name = bbox.class_name
-            if labels[class_name] is None:
-                labels[class_name] = YoloLabel(index=idx, name=class_name)
-                idx += 1
-        for mask in image.masks:
-            class_name = mask.class_name
-            if labels[class_name] is None:
-                labels[class_name] = YoloLabel(index=idx, name=class_name)
-                idx += 1
-
-    labels = dict(labels)
-
-    data_yaml_path = os.path.join(output_folder, "data.yaml")
-    with open(data_yaml_path, "w") as f:
-        f.write(
-            f"""train: ../train/images
-val: ../valid/images
-test: ../test/images
-
-nc: {len(labels)}
-names: [{', '.join(f"'{label.name}'" for label in labels.values())}]
-
-"""
-        )
+    if image_count is None:
+        images = list(images)
+        image_count = len(images)
 
     imageTrainCount = train_val_percentage
     imageValidCount = 100 - train_val_percentage
     imageTestCount = 0
     logger.info(
-        f"Splitting {len(images)} images to train/valid/test: {imageTrainCount}/{imageValidCount}/{imageTestCount}%"
+        f"Splitting {image_count} images to train/valid/test: {imageTrainCount}/{imageValidCount}/{imageTestCount}%"
     )
     names = ["train", "valid", "test"]
-    split = split_collection(images, imageTrainCount, imageValidCount, imageTestCount)
+    part_sizes = split_part_sizes(image_count, imageTrainCount, imageValidCount, imageTestCount)
+
+    labels = {}
+
+    def get_label(class_name):
+        label = labels.get(class_name)
+        if label is None:
+            label = YoloLabel(index=len(labels), name=class_name)
+            labels[class_name] = label
+        return label
 
     logger.info(f"Writing the results of a split to {output_folder}")
-    for i, images_collection in enumerate(split):
+    progress_reporter.start("write", image_count)
+    images_iterator = iter(images)
+    for i, part_size in enumerate(part_sizes):
         images_collection_name = names[i]
-        collection_folder_path = os.path.join(output_folder, images_collection_name)
-        images_folder_path = os.path.join(collection_folder_path, "images")
-        labels_folder_path = os.path.join(collection_folder_path, "labels")
+        logger.info(f"Writing '{images_collection_name}', count: {part_size}")
+        dataset_writer.begin_split(images_collection_name)
+
+        for _ in range(part_size):
+            image = next(images_iterator, None)
+            if image is None:
+                raise ValueError(f"Expected {image_count} image(s), but got fewer")
+
+            with conversion_metrics.measure("class_discovery", len(image.bboxes) + len(image.masks)):
+                box_class_ids = [get_label(class_name).index for class_name in image.bboxes.class_names]
+                mask_class_ids = [get_label(mask.class_name).index for mask in image.masks]
+            if statistics is not None:
+                with conversion_metrics.measure("statistics", 1):
+                    statistics.add_image(
+                        images_collection_name, box_class_ids, image.bboxes.boxes, mask_class_ids, [mask.mask for mask in image.masks]
+                    )
+            label_rows = list(zip(box_class_ids, image.bboxes.boxes))
+            label_rows.extend((class_id, mask.mask) for class_id, mask in zip(mask_class_ids, image.masks))
+            with conversion_metrics.measure("dataset_writing", 1):
+                dataset_writer.write_image(image, label_rows)
+            progress_reporter.advance("write")
+
+    if next(images_iterator, None) is not None:
+        raise ValueError(f"Expected {image_count} image(s), but got more")
+
+    class_names = [label.name for label in labels.values()]
+    with conversion_metrics.measure("dataset_finishing"):
+        dataset_writer.finish(names, class_names)
+    progress_reporter.finish("write")
+    return class_names
+
+
+class FolderDatasetWriter:
+    """
+    Writes the dataset in YOLO layout: <split>/images and <split>/labels folders and data.yaml.
 
-        logger.info(
-            f"Writing '{images_collection_name}' to {collection_folder_path}, count: {len(images_collection)}"
+    Images are copied or linked to the output folder by the materializer on its own threads, label values are
+    written with label_precision decimal places, trailing zeros are stripped.
+    If manifest is specified, the output folder is updated in place - up-to-date images and labels are left
+    untouched and files that are not part of the dataset anymore are deleted.
+    """
+
+    def __init__(self, output_folder, materializer, manifest=None, label_precision=DEFAULT_LABEL_PRECISION):
+        self.output_folder = output_folder
+        self.materializer = materializer
+        self.manifest = manifest
+        self.label_precision = label_precision
+
+    def __enter__(self):
+        self.materializer.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.materializer.__exit__(exc_type, exc_value, traceback)
+        if exc_type is None:
+            logger.info(f"Materialized images: {self.materializer.stats}")
+        return False
+
+    def begin_split(self, split_name):
+        collection_folder_path = os.path.join(self.output_folder, split_name)
+        self.images_folder_path = os.path.join(collection_folder_path, "images")
+        self.labels_folder_path = os.path.join(collection_folder_path, "labels")
+        os.makedirs(self.images_folder_path, exist_ok=True)
+        os.makedirs(self.labels_folder_path, exist_ok=True)
+
+    def write_image(self, image, label_rows):
+        materialize_image(self.materializer, self.manifest, image.image_file, self.get_image_files(image))
+        self.write_labels(image, label_rows)
+
+    def get_image_files(self, image):
+        return [os.path.join(self.images_folder_path, image.output_name)]
+
+    def write_labels(self, image, label_rows):
+        manifest = self.manifest
+        label_file = os.path.join(
+            self.labels_folder_path,
+            f"{os.path.splitext(image.output_name)[0]}.txt",
         )
+        with conversion_metrics.measure("label_serialization", len(label_rows)):
+            label_text = serialize_yolo_labels(label_rows, self.label_precision)
+        with conversion_metrics.measure("label_writes", 1):
+            if manifest is not None:
+                manifest.add_label(label_file)
+                if is_file_content_equal(label_file, label_text):
+                    return
+            with open(label_file, "w") as f:
+                f.write(label_text)
+
+    def finish(self, split_names, class_names):
+        self.materializer.wait()
+        if self.manifest is not None:
+            self.manifest.class_names = class_names
+            self.manifest.delete_stale_files([os.path.join(self.output_folder, name) for name in split_names])
+
+        data_yaml_path = os.path.join(self.output_folder, "data.yaml")
+        with open(data_yaml_path, "w") as f:
+            f.write(
+                f"""train: ../train/images
+val: ../valid/images
+test: ../test/images
+
+nc: {len(class_names)}
+names: [{', '.join(f"'{class_name}'" for class_name in class_names)}]
+
+"""
+            )
+
+
+class ClassifyDatasetWriter:
+    """
+    Writes a classification dataset in the layout of YOLO classification: <split>/<tag>/<image>. An image is written
+    to the folder of every tag it has, images without tags are left out. The valid split is written to val.
+    """
+
+    def __init__(self, output_folder, materializer, manifest=None):
+        self.output_folder = output_folder
+        self.materializer = materializer
+        self.manifest = manifest
+        self.tag_names = set()
+
+    def __enter__(self):
+        self.materializer.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.materializer.__exit__(exc_type, exc_value, traceback)
+        if exc_type is None:
+            logger.info(f"Materialized images: {self.materializer.stats}")
+        return False
+
+    def begin_split(self, split_name):
+        self.split_folder_path = self._get_split_folder(split_name)
+        self._tag_folder_paths = set()
+        os.makedirs(self.split_folder_path, exist_ok=True)
+
+    def write_image(self, image, label_rows):
+        materialize_image(self.materializer, self.manifest, image.image_file, self.get_image_files(image))
+
+    def get_image_files(self, image):
+        image_files = []
+        for tag in dict.fromkeys(image.tags):
+            tag_folder_path = os.path.join(self.split_folder_path, tag)
+            if tag_folder_path not in self._tag_folder_paths:
+                os.makedirs(tag_folder_path, exist_ok=True)
+                self._tag_folder_paths.add(tag_folder_path)
+                self.tag_names.add(tag)
+            image_files.append(os.path.join(tag_folder_path, image.output_name))
+        return image_files
+
+    def write_labels(self, image, label_rows):
+        pass  # classes of images are the folders they are written to
+
+    def finish(self, split_names, class_names):
+        self.materializer.wait()
+        if self.manifest is not None:
+            self.manifest.delete_stale_files([self._get_split_folder(split_name) for split_name in split_names])
+        if not self.tag_names:
+            logger.warning(f"No image has tags, classification dataset in {self.output_folder} is empty")
+        logger.info(f"Written classification dataset, tags: {len(self.tag_names)}")
+
+    def _get_split_folder(self, split_name):
+        return os.path.join(self.output_folder, CLASSIFY_SPLIT_NAMES.get(split_name, split_name))
+
+
+class CropDatasetWriter:
+    """
+    Writes a classification dataset of objects: <split>/<label>/<image>_<box index> crops of boxes (see cut_box_crops),
+    so classifiers of objects are trained without full-size copies of images. The valid split is written to val.
+
+    Crops of an image are cut by a single job, on the executor (process pool) if it is specified, at most a few jobs
+    per CPU core are in flight at once. If manifest is specified, crops of an image are cut again only if the image,
+    its boxes or crop options have changed, and crops that are not part of the dataset anymore are deleted.
+    """
+
+    def __init__(self, output_folder, crop_options, executor=None, manifest=None):
+        self.output_folder = output_folder
+        self.crop_options = crop_options
+        self.executor = executor
+        self.manifest = manifest
+        self.crop_count = 0
+        self.skipped_crop_count = 0
+        self._pending = deque()
+        self._max_pending = (os.cpu_count() or 1) * 4
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            for future in self._pending:
+                future.cancel()
+        return False
+
+    def begin_split(self, split_name):
+        self.split_folder_path = self._get_split_folder(split_name)
+        self._label_folder_paths = set()
+        os.makedirs(self.split_folder_path, exist_ok=True)
+
+    def write_image(self, image, label_rows):
+        self.write_labels(image, label_rows)
+
+    def get_image_files(self, image):
+        return []
+
+    def write_labels(self, image, label_rows):
+        if len(image.bboxes) == 0:
+            return
+        stem, extension = os.path.splitext(image.output_name)
+        crop_files = []
+        for box_index, class_name in enumerate(image.bboxes.class_names):
+            label_folder_path = os.path.join(self.split_folder_path, class_name)
+            if label_folder_path not in self._label_folder_paths:
+                os.makedirs(label_folder_path, exist_ok=True)
+                self._label_folder_paths.add(label_folder_path)
+            crop_files.append(os.path.join(label_folder_path, f"{stem}_{box_index}{extension}"))
+        manifest = self.manifest
+        if manifest is not None:
+            crop_key = self._get_crop_key(image.bboxes.boxes)
+            is_up_to_date = all(manifest.is_crop_up_to_date(image.image_file, crop_file, crop_key) for crop_file in crop_files)
+            for crop_file in crop_files:
+                manifest.add_crop(image.image_file, crop_file, crop_key)
+            if is_up_to_date:
+                self.skipped_crop_count += len(crop_files)
+                return
+        crop_arguments = (image.image_file, image.bboxes.boxes, crop_files, self.crop_options.crop_size, self.crop_options.padding)
+        self.crop_count += len(crop_files)
+        if self.executor is None:
+            conversion_metrics.add("crop_cutting", *cut_box_crops(*crop_arguments), len(crop_files))
+            return
+        while len(self._pending) >= self._max_pending:
+            self._complete(self._pending.popleft())
+        self._pending.append((self.executor.submit(cut_box_crops, *crop_arguments), len(crop_files)))
+
+    def finish(self, split_names, class_names):
+        while self._pending:
+            self._complete(self._pending.popleft())
+        if self.manifest is not None:
+            self.manifest.delete_stale_files([self._get_split_folder(split_name) for split_name in split_names])
+            logger.info(f"Written {self.crop_count} crop(s) of {self.crop_options}, {self.skipped_crop_count} up to date")
+        else:
+            logger.info(f"Written {self.crop_count} crop(s) of {self.crop_options}")
+
+    def _get_split_folder(self, split_name):
+        return os.path.join(self.output_folder, CLASSIFY_SPLIT_NAMES.get(split_name, split_name))
+
+    def _get_crop_key(self, boxes):
+        """
+        Returns a hash of everything crops of an image depend on besides the image file - its boxes and crop options.
+        """
+        key_hash = hashlib.blake2b(repr(self.crop_options).encode("utf-8"), digest_size=16)
+        key_hash.update(np.ascontiguousarray(boxes).tobytes())
+        return key_hash.hexdigest()
+
+    @staticmethod
+    def _complete(pending_crops):
+        future, crop_count = pending_crops
+        conversion_metrics.add("crop_cutting", *future.result(), crop_count)
 
-        os.makedirs(images_folder_path, exist_ok=True)
-        os.makedirs(labels_folder_path, exist_ok=True)
 
-        for image in images_collection:
+class MultiTaskDatasetWriter:
+    """
+    Writes datasets of several tasks in a single pass, each to the folder of its task - detect (YOLO layout with box
+    labels only), segment (YOLO layout with mask labels only), classify (see ClassifyDatasetWriter) and crops
+    (see CropDatasetWriter).
+
+    An image is materialized by the link mode only once, the other layouts get hard links to it (symbolic links
+    to the source in symlink modes), so all layouts share the image bytes.
+    """
 
-            destination_image_file = os.path.join(images_folder_path, os.path.basename(image.image_file))
-            if use_symlinks:
-                os.symlink(
-                    image.image_file,
-                    destination_image_file)
+    def __init__(self, output_folder, tasks, materializer, manifest=None, label_precision=DEFAULT_LABEL_PRECISION,
+                 crop_options=None, executor=None):
+        self.materializer = materializer
+        self.manifest = manifest
+        self.writers = {}
+        for task in tasks:
+            task_folder = os.path.join(output_folder, task)
+            if task == "classify":
+                self.writers[task] = ClassifyDatasetWriter(task_folder, materializer, manifest)
+            elif task == "crops":
+                self.writers[task] = CropDatasetWriter(task_folder, crop_options or CropOptions(), executor, manifest)
             else:
-                shutil.copy2(
-                    image.image_file,
-                    destination_image_file)
-
-            image_boxes = [
-                f"{labels[bbox.class_name].index} {format_yolo_float(bbox.bbox.center_x)} {format_yolo_float(bbox.bbox.center_y)} {format_yolo_float(bbox.bbox.width)} {format_yolo_float(bbox.bbox.height)}"
-                for bbox in image.bboxes
-            ]
-            image_masks = [
-                f"{labels[mask.class_name].index} {' '.join(format_yolo_float(val) for val in mask.mask.flatten())}"
-                for mask in image.masks
-            ]
-            with open(
-                    os.path.join(
-                        labels_folder_path,
-                        f"{os.path.splitext(os.path.basename(image.image_file))[0]}.txt",
-                    ),
-                    "w",
-            ) as f:
-                label_lines = image_boxes + image_masks
-                f.write("\n".join(label_lines))
-                if label_lines:
-                    f.write("\n")
+                self.writers[task] = FolderDatasetWriter(task_folder, materializer, manifest, label_precision)
+
+    def __enter__(self):
+        self.materializer.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        crop_writer = self.writers.get("crops")
+        if crop_writer is not None:
+            crop_writer.__exit__(exc_type, exc_value, traceback)
+        self.materializer.__exit__(exc_type, exc_value, traceback)
+        if exc_type is None:
+            logger.info(f"Materialized images: {self.materializer.stats}")
+        return False
+
+    def begin_split(self, split_name):
+        for writer in self.writers.values():
+            writer.begin_split(split_name)
+
+    def write_image(self, image, label_rows):
+        box_count = len(image.bboxes)
+        label_rows_by_task = {"detect": label_rows[:box_count], "segment": label_rows[box_count:]}
+        image_files = [image_file for writer in self.writers.values() for image_file in writer.get_image_files(image)]
+        materialize_image(self.materializer, self.manifest, image.image_file, image_files)
+        for task, writer in self.writers.items():
+            writer.write_labels(image, label_rows_by_task.get(task, []))
+
+    def finish(self, split_names, class_names):
+        for writer in self.writers.values():
+            writer.finish(split_names, class_names)
+
+
+def materialize_image(materializer, manifest, source_file, destination_files):
+    """
+    Submits an image to the materializer - the first destination file gets the image, the others are linked to it.
+    If manifest is specified, the image is skipped if all destination files are up to date.
+    """
+    if not destination_files:
+        return
+    link_mode = materializer.link_mode
+    if manifest is None or not all(
+            manifest.is_image_up_to_date(source_file, destination_file, link_mode) for destination_file in destination_files
+    ):
+        materializer.submit(source_file, destination_files[0], replace=manifest is not None, linked_files=destination_files[1:])
+    else:
+        materializer.skip()
+    if manifest is not None:
+        for destination_file in destination_files:
+            manifest.add_image(source_file, destination_file, link_mode)
+
+
+class ShardDatasetWriter:
+    """
+    Writes the dataset as packed shard files (see DatasetShards.py), a few large files per split
+    instead of an image and a label file per image, plus shards.json with class names and shards of each split.
+    """
+
+    def __init__(self, output_folder, max_shard_size=DEFAULT_MAX_SHARD_SIZE):
+        self.output_folder = output_folder
+        self.max_shard_size = max_shard_size
+        self.shard_files_by_split = {}
+        self._split_name = None
+        self._shard_writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._shard_writer is not None:
+            self._shard_writer.__exit__(exc_type, exc_value, traceback)
+        return False
+
+    def begin_split(self, split_name):
+        self._close_split()
+        self._split_name = split_name
+        self._shard_writer = ShardWriter(self.output_folder, split_name, self.max_shard_size)
+
+    def write_image(self, image, label_rows):
+        with conversion_metrics.measure("image_reading", 1):
+            image_bytes = read_file(image.image_file)
+        with conversion_metrics.measure("shard_writes", 1):
+            self._shard_writer.add(image.output_name, image_bytes, label_rows)
+
+    def finish(self, split_names, class_names):
+        self._close_split()
+        write_shard_index(self.output_folder, class_names, self.shard_files_by_split)
+        logger.info(
+            f"Written shards: {', '.join(f'{split}: {len(files)}' for split, files in self.shard_files_by_split.items())}"
+        )
+
+    def _close_split(self):
+        if self._shard_writer is not None:
+            self.shard_files_by_split[self._split_name] = self._shard_writer.close()
+            self._shard_writer = None
+
+
+def is_file_content_equal(file_path, text):
+    try:
+        with open(file_path, "r") as f:
+            return f.read() == text
+    except FileNotFoundError:
+        return False
 
 
 def read_file_paths(file_path):
@@ -278,96 +1533,363 @@ def read_file_paths(file_path):
         return []
 
 
-def parse_options():
+def parse_options(arguments=None):
     parser = argparse.ArgumentParser()
     parser.add_argument(
-        "--inputAnnotationsFiles",
-        help="Paths to CVAT 1.1 annotation file (annotations.xml)",
-        nargs="+",
+        "--inputAnnotationsFiles",
+        help="Paths to CVAT 1.1 annotation file (annotations.xml) or ZIP export with annotations.xml and images",
+        nargs="+",
+    )
+    parser.add_argument(
+        "--inputAnnotationsFileList",
+        help="Path to file containing list of paths to CVAT 1.1 annotation files (annotations.xml)",
+    )
+    parser.add_argument(
+        "--outputDirectory",
+        help="Path to output directory, required unless running as a worker",
+    )
+    parser.add_argument(
+        "--symlinks",
+        help="Use symbolic links instead of copying files, same as --linkMode symlink",
+        action="store_true"
+    )
+    parser.add_argument(
+        "--linkMode",
+        "--link-mode",
+        choices=LINK_MODES,
+        help="How images are placed into the output directory, auto picks the cheapest mode "
+             "supported by the file system (hardlink, reflink, copy). Default is copy",
+    )
+    parser.add_argument(
+        "--ioThreads",
+        type=int,
+        default=DEFAULT_IO_THREAD_COUNT,
+        help="Number of threads used to copy or link images to the output directory",
+    )
+    parser.add_argument(
+        "--trainPercentage",
+        type=int,
+        help="Percentage of images to use for training",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of processes used to convert masks to polygons and cut box crops, 0 uses all CPU cores",
+    )
+    parser.add_argument(
+        "--streaming",
+        help="Stream images from annotation files to the output instead of loading all of them into memory",
+        action="store_true"
+    )
+    parser.add_argument(
+        "--dedup",
+        choices=DEDUP_MODES,
+        default="none",
+        help="Drop duplicate images before splitting - exact drops byte-identical files, "
+             f"near also drops visually similar ones. Dropped images are listed in {DEDUP_REPORT_FILE_NAME}",
+    )
+    parser.add_argument(
+        "--dedupDistance",
+        type=int,
+        default=DEFAULT_NEAR_DUPLICATE_DISTANCE,
+        help="Maximum number of differing bits of 64-bit perceptual hashes of near-duplicate images",
+    )
+    parser.add_argument(
+        "--dedupKeep",
+        choices=DEDUP_KEEP_POLICIES,
+        default="most_labels",
+        help="Which copy of duplicate images is kept - the one with the most annotations or the first one",
+    )
+    parser.add_argument(
+        "--tileSize",
+        type=int,
+        default=0,
+        help="Cut images to square tiles of this many pixels, the original images are not written. 0 disables tiling",
+    )
+    parser.add_argument(
+        "--tileStride",
+        type=int,
+        default=0,
+        help="Distance between tiles in pixels, 0 makes tiles overlap by a quarter of the tile size",
+    )
+    parser.add_argument(
+        "--tileMinVisibility",
+        type=float,
+        default=DEFAULT_TILE_MIN_VISIBILITY,
+        help="Objects with a smaller part of their area inside a tile are not labeled in that tile",
+    )
+    parser.add_argument(
+        "--imageSize",
+        type=int,
+        default=0,
+        help="Downsize images so their longest side is at most this many pixels, e.g. training imgsz. 0 keeps the size",
+    )
+    parser.add_argument(
+        "--imageFormat",
+        choices=IMAGE_FORMATS,
+        default="keep",
+        help="Transcode images to JPEG or WebP",
+    )
+    parser.add_argument(
+        "--imageQuality",
+        type=int,
+        default=DEFAULT_IMAGE_QUALITY,
+        help="JPEG/WebP quality of transcoded images, 1-100",
+    )
+    parser.add_argument(
+        "--imageCacheDirectory",
+        default=DEFAULT_IMAGE_CACHE_DIRECTORY,
+        help="Folder for resized/transcoded images, reused between runs. Default is a folder in the temp directory",
+    )
+    parser.add_argument(
+        "--polygonTolerance",
+        type=float,
+        default=0.0,
+        help="Simplify mask polygons (Douglas-Peucker), allowing them to deviate from the mask by up to this many pixels",
+    )
+    parser.add_argument(
+        "--maxPolygonPoints",
+        type=int,
+        default=0,
+        help="Simplify mask polygons until each of them has at most this many points, 0 means unlimited",
+    )
+    parser.add_argument(
+        "--polygonCache",
+        help="Path to SQLite file caching polygons traced from masks between runs, e.g. in the project workspace",
+    )
+    parser.add_argument(
+        "--polygonCacheSize",
+        type=int,
+        default=DEFAULT_MAX_CACHE_SIZE // (1024 * 1024),
+        help="Maximum size of cached polygons in megabytes, least recently used ones are evicted",
+    )
+    parser.add_argument(
+        "--labelPrecision",
+        type=int,
+        default=DEFAULT_LABEL_PRECISION,
+        help="Number of decimal places of coordinates in label files",
+    )
+    parser.add_argument(
+        "--incremental",
+        help="Update existing output directory in place, re-converting only new and edited images of annotation files that have changed",
+        action="store_true"
+    )
+    parser.add_argument(
+        "--outputFormat",
+        choices=OUTPUT_FORMATS,
+        default="folders",
+        help="Write images and labels as files in YOLO folders or pack each split into a few memory-mappable shard files",
+    )
+    parser.add_argument(
+        "--tasks",
+        nargs="+",
+        choices=TASKS,
+        help="Write a dataset per task to subfolders of the output directory from a single conversion - detect "
+             "(boxes only), segment (masks only), classify (image tags) and crops (box crops sorted by label), "
+             "images are shared by links. By default a single dataset with boxes and masks is written to the output directory",
+    )
+    parser.add_argument(
+        "--cropSize",
+        type=int,
+        default=DEFAULT_CROP_SIZE,
+        help="Width and height of box crops of the crops task in pixels, crops are letterboxed to squares",
+    )
+    parser.add_argument(
+        "--cropPadding",
+        type=float,
+        default=DEFAULT_CROP_PADDING,
+        help="Box crops include this part of the box width and height around the box on every side",
+    )
+    parser.add_argument(
+        "--progress",
+        choices=PROGRESS_MODES,
+        default="none",
+        help="Report progress as JSON lines on stdout, logs are written to stderr",
     )
     parser.add_argument(
-        "--inputAnnotationsFileList",
-        help="Path to file containing list of paths to CVAT 1.1 annotation files (annotations.xml)",
+        "--progressRate",
+        type=float,
+        default=DEFAULT_PROGRESS_RATE,
+        help="Maximum number of progress events per second",
     )
     parser.add_argument(
-        "--outputDirectory",
-        help="Path to output directory",
-        required=True,
+        "--verbose",
+        help="Log every image and mask, this slows down conversion of large datasets",
+        action="store_true"
     )
     parser.add_argument(
-        "--symlinks",
-        help="Use symbolic links instead of copying files",
+        "--worker",
+        help="Run as a long-lived worker that reads conversion requests as JSON lines from stdin, see run_worker",
         action="store_true"
     )
     parser.add_argument(
-        "--trainPercentage",
+        "--metricsFile",
+        help="Path to JSON file to write wall time, CPU time and item counts of each conversion stage to",
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="ConvertCVATtoYolo8.pstats",
+        metavar="PROFILE_FILE",
+        help="Profile the conversion with cProfile and dump pstats to the file (ConvertCVATtoYolo8.pstats by default)",
+    )
+    parser.add_argument(
+        "--shardSize",
         type=int,
-        help="Percentage of images to use for training",
+        default=DEFAULT_MAX_SHARD_SIZE // (1024 * 1024),
+        help="Maximum size of a shard file in megabytes",
     )
-    args = parser.parse_args()
+    args = parser.parse_args(arguments)
+    if not args.worker and not args.outputDirectory:
+        parser.error("the following arguments are required: --outputDirectory")
 
     file_paths = args.inputAnnotationsFiles if args.inputAnnotationsFiles else read_file_paths(args.inputAnnotationsFileList)
+    if args.symlinks and args.linkMode not in (None, "symlink"):
+        parser.error(f"--symlinks conflicts with --linkMode {args.linkMode}")
+    if args.outputFormat == "shards" and args.incremental:
+        parser.error("--incremental is not supported with --outputFormat shards")
+    if args.dedup != "none" and args.streaming:
+        parser.error("--dedup is not supported with --streaming, duplicates are known only once all images are prepared")
+    if args.tileSize < 0 or args.tileStride < 0 or (args.tileSize > 0 and args.tileStride > args.tileSize):
+        parser.error("--tileStride must be between 0 and --tileSize, which can not be negative")
+    if args.tileSize > 0 and (args.streaming or args.incremental):
+        parser.error("--tileSize is not supported with --streaming or --incremental")
+    if args.tasks and args.outputFormat == "shards":
+        parser.error("--tasks is not supported with --outputFormat shards")
+    if args.cropSize <= 0 or args.cropPadding < 0:
+        parser.error("--cropSize must be positive and --cropPadding can not be negative")
+    if args.tasks and "classify" in args.tasks and args.tileSize > 0:
+        parser.error("--tasks classify is not supported with --tileSize, tags describe whole images")
+    if (args.imageSize > 0 or args.imageFormat != "keep") and args.streaming:
+        parser.error("--imageSize and --imageFormat are not supported with --streaming")
+    if args.imageSize < 0 or not 1 <= args.imageQuality <= 100:
+        parser.error("--imageSize can not be negative and --imageQuality must be between 1 and 100")
 
     return ScriptOptions(
         input_annotations_files=file_paths,
         output_directory=args.outputDirectory,
-        use_symlinks=args.symlinks,
-        train_val_percentage=args.trainPercentage
+        link_mode=args.linkMode or ("symlink" if args.symlinks else "copy"),
+        train_val_percentage=args.trainPercentage,
+        workers=args.workers,
+        streaming=args.streaming,
+        incremental=args.incremental,
+        dedup=args.dedup,
+        dedup_distance=args.dedupDistance,
+        dedup_keep=args.dedupKeep,
+        tile_size=args.tileSize,
+        tile_stride=args.tileStride,
+        tile_min_visibility=args.tileMinVisibility,
+        image_size=args.imageSize,
+        image_format=args.imageFormat,
+        image_quality=args.imageQuality,
+        image_cache_directory=args.imageCacheDirectory,
+        polygon_tolerance=args.polygonTolerance,
+        max_polygon_points=args.maxPolygonPoints,
+        polygon_cache_file=args.polygonCache,
+        polygon_cache_size=args.polygonCacheSize * 1024 * 1024,
+        label_precision=args.labelPrecision,
+        io_threads=args.ioThreads,
+        output_format=args.outputFormat,
+        tasks=list(dict.fromkeys(args.tasks)) if args.tasks else None,
+        crop_size=args.cropSize,
+        crop_padding=args.cropPadding,
+        max_shard_size=args.shardSize * 1024 * 1024,
+        metrics_file=args.metricsFile,
+        profile_file=args.profile,
+        progress=args.progress,
+        progress_rate=args.progressRate,
+        verbose=args.verbose,
+        worker=args.worker
     )
 
 
 def parse_annotations(file_path):
-    tree = ET.parse(file_path)
-    root = tree.getroot()
+    images = conversion_metrics.measure_iterator("annotation_parsing", iter_annotation_images(file_path))
+    return Annotations(annotations_file=file_path, images=list(images))
 
-    images = []
-    for image_elem in root.findall("image"):
-        id = int(image_elem.attrib["id"])
-        name = image_elem.attrib["name"]
-        width = int(image_elem.attrib["width"])
-        height = int(image_elem.attrib["height"])
-
-        boxes = [
-            Box(
-                label=box_elem.attrib["label"],
-                source=box_elem.attrib["source"],
-                occluded=int(box_elem.attrib["occluded"]),
-                xtl=float(box_elem.attrib["xtl"]),
-                ytl=float(box_elem.attrib["ytl"]),
-                xbr=float(box_elem.attrib["xbr"]),
-                ybr=float(box_elem.attrib["ybr"]),
-                z_order=int(box_elem.attrib["z_order"]),
-            )
-            for box_elem in image_elem.findall("box")
-        ]
 
-        masks = [
-            Mask(
-                label=mask_elem.attrib["label"],
-                source=mask_elem.attrib["source"],
-                occluded=int(mask_elem.attrib["occluded"]),
-                rle=mask_elem.attrib["rle"],
-                left=int(mask_elem.attrib["left"]),
-                top=int(mask_elem.attrib["top"]),
-                width=int(mask_elem.attrib["width"]),
-                height=int(mask_elem.attrib["height"]),
-                z_order=int(mask_elem.attrib["z_order"]),
-            )
-            for mask_elem in image_elem.findall("mask")
-        ]
+def iter_annotation_images(file_path, parse_shapes=True):
+    """
+    Incrementally parses CVAT 1.1 annotations file and yields Image objects one by one.
 
-        images.append(
-            Image(
-                id=id,
-                name=name,
-                width=width,
-                height=height,
-                boxes=boxes,
-                masks=masks,
-            )
+    Each <image> element is released right after it has been converted, so memory usage
+    does not depend on the size of the annotations file. If parse_shapes is False,
+    images are yielded without boxes and masks. ZIP archives are parsed from their annotations.xml,
+    which is decompressed while being parsed.
+    """
+    for image_elem in iter_image_elements(file_path):
+        yield parse_image_element(image_elem, parse_shapes)
+
+
+def iter_image_elements(file_path):
+    """
+    Yields <image> elements of CVAT 1.1 annotations file one by one, each element is released once the next one
+    is requested.
+    """
+    with open_file(get_annotations_path(file_path)) as f:
+        context = ET.iterparse(f, events=("start", "end"))
+        _, root = next(context)
+        depth = 1
+        for event, elem in context:
+            if event == "start":
+                depth += 1
+                continue
+
+            depth -= 1
+            if depth == 1 and elem.tag == "image":
+                yield elem
+                root.clear()
+
+
+def parse_image_element(image_elem, parse_shapes=True):
+    id = int(image_elem.attrib["id"])
+    name = image_elem.attrib["name"]
+    width = int(image_elem.attrib["width"])
+    height = int(image_elem.attrib["height"])
+
+    if not parse_shapes:
+        return Image(id=id, name=name, width=width, height=height, boxes=ImageBoxes.empty(), masks=[], tags=[])
+
+    box_elems = image_elem.findall("box")
+    boxes = ImageBoxes(
+        # labels repeat across boxes, interning keeps a single string per label
+        labels=[sys.intern(box_elem.attrib["label"]) for box_elem in box_elems],
+        coordinates=np.array(
+            [
+                (float(box_elem.attrib["xtl"]), float(box_elem.attrib["ytl"]), float(box_elem.attrib["xbr"]), float(box_elem.attrib["ybr"]))
+                for box_elem in box_elems
+            ],
+            dtype=np.float64,
+        ).reshape(-1, 4),
+    )
+
+    masks = [
+        Mask(
+            label=mask_elem.attrib["label"],
+            source=mask_elem.attrib["source"],
+            occluded=int(mask_elem.attrib["occluded"]),
+            rle=mask_elem.attrib["rle"],
+            left=int(mask_elem.attrib["left"]),
+            top=int(mask_elem.attrib["top"]),
+            width=int(mask_elem.attrib["width"]),
+            height=int(mask_elem.attrib["height"]),
+            z_order=int(mask_elem.attrib["z_order"]),
         )
+        for mask_elem in image_elem.findall("mask")
+    ]
+
+    tags = [sys.intern(tag_elem.attrib["label"]) for tag_elem in image_elem.findall("tag")]
 
-    return Annotations(annotations_file=file_path, images=images)
+    return Image(
+        id=id,
+        name=name,
+        width=width,
+        height=height,
+        boxes=boxes,
+        masks=masks,
+        tags=tags,
+    )
 
 
 def split_collection(collection, *part_percentages):
@@ -393,8 +1915,32 @@ def split_collection(collection, *part_percentages):
         split_collection([1, 2, 3, 4, 5, 6, 7, 8], 25, 25, 25, 25) returns [[1, 2], [3, 4], [5, 6], [7, 8]]
         split_collection([1, 2, 3, 4, 5, 6, 7, 8, 9], 33, 33, 34) returns [[1, 2, 3], [4, 5, 6], [7, 8, 9]]
     """
+    part_sizes = split_part_sizes(len(collection), *part_percentages)
+
+    # Split collection into parts
+    parts = []
+    current_index = 0
+    for part_size in part_sizes:
+        part = collection[current_index: current_index + part_size]
+        parts.append(part)
+        current_index += part_size
+
+    # Return the parts
+    return parts
+
+
+def split_part_sizes(collection_size, *part_percentages):
+    """
+    Calculates sizes of the parts split_collection would produce for a collection of the given size.
+
+    Raises:
+        ValueError: Same as split_collection.
+
+    Examples:
+        split_part_sizes(5, 20, 30, 50) returns [1, 2, 2]
+    """
     # Check if collection is empty
-    if not collection:
+    if collection_size <= 0:
         raise ValueError("The collection cannot be empty.")
 
     # Check if part percentages are specified
@@ -410,9 +1956,6 @@ def split_collection(collection, *part_percentages):
     if abs(total_percentage - 100) > 0.0001:
         raise ValueError("The sum of the part percentages must equal 100.")
 
-    # Size of the collection
-    collection_size = len(collection)
-
     # Check if collection has at least as many items as there are parts
     part_count = len(part_percentages)
     non_zero_part_count = len(list(filter(lambda p: p > 0, part_percentages)))
@@ -438,46 +1981,7 @@ def split_collection(collection, *part_percentages):
     for i in range(remaining):
         part_sizes[i] += 1
 
-    # Split collection into parts
-    parts = []
-    current_index = 0
-    for part_size in part_sizes:
-        part = collection[current_index: current_index + part_size]
-        parts.append(part)
-        current_index += part_size
-
-    # Return the parts
-    return parts
-
-
-class RectangleD:
-    def __init__(self, x, y, width, height):
-        self.x = x
-        self.y = y
-        self.width = width
-        self.height = height
-
-    @property
-    def center_x(self):
-        return self.x + self.width / float(2)
-
-    @property
-    def center_y(self):
-        return self.y + self.height / float(2)
-
-    @classmethod
-    def from_yolo(cls, center_x, center_y, width, height):
-        x = center_x - width / float(2)
-        y = center_y - height / float(2)
-        return cls(x, y, width, height)
-
-    @classmethod
-    def from_ltrb(cls, left, top, right, bottom):
-        x = left
-        y = top
-        width = right - left
-        height = bottom - top
-        return cls(x, y, width, height)
+    return part_sizes
 
 
 class Annotations:
@@ -487,27 +1991,72 @@ class Annotations:
 
 
 class Image:
-    def __init__(self, id, name, width, height, boxes, masks):
+    __slots__ = ("id", "name", "width", "height", "boxes", "masks", "tags")
+
+    def __init__(self, id, name, width, height, boxes, masks, tags):
         self.id = id
         self.name = name
         self.width = width
         self.height = height
         self.boxes = boxes
         self.masks = masks
+        self.tags = tags
 
 
-class Box:
-    def __init__(
-            self, label, source, occluded, xtl, ytl, xbr, ybr, z_order
-    ):
-        self.label = label
-        self.source = source
-        self.occluded = occluded
+class ImageBoxes:
+    """
+    Boxes of an image as columns - labels and an N x 4 array of (xtl, ytl, xbr, ybr) coordinates.
+    """
+    __slots__ = ("labels", "coordinates")
+
+    def __init__(self, labels, coordinates):
+        self.labels = labels
+        self.coordinates = coordinates
+
+    @classmethod
+    def empty(cls):
+        return cls([], np.empty((0, 4), dtype=np.float64))
+
+    def __len__(self):
+        return len(self.labels)
+
+
+class BoxTable:
+    """
+    Boxes of a batch of images as a struct of arrays - index of the image in the batch, class id (index in class_names)
+    and xtl, ytl, xbr, ybr coordinates, one element per box.
+    """
+
+    def __init__(self, image_indices, class_ids, class_names, xtl, ytl, xbr, ybr):
+        self.image_indices = image_indices
+        self.class_ids = class_ids
+        self.class_names = class_names
         self.xtl = xtl
         self.ytl = ytl
         self.xbr = xbr
         self.ybr = ybr
-        self.z_order = z_order
+
+    @classmethod
+    def from_images(cls, images):
+        box_counts = np.array([len(image.boxes) for image in images], dtype=np.int64)
+        class_ids_by_name = {}
+        class_ids = np.array(
+            [class_ids_by_name.setdefault(label, len(class_ids_by_name)) for image in images for label in image.boxes.labels],
+            dtype=np.int32,
+        )
+        coordinates = np.concatenate([image.boxes.coordinates for image in images] + [np.empty((0, 4), dtype=np.float64)])
+        return cls(
+            image_indices=np.repeat(np.arange(len(images)), box_counts),
+            class_ids=class_ids,
+            class_names=list(class_ids_by_name),
+            xtl=coordinates[:, 0],
+            ytl=coordinates[:, 1],
+            xbr=coordinates[:, 2],
+            ybr=coordinates[:, 3],
+        )
+
+    def __len__(self):
+        return len(self.class_ids)
 
 
 @dataclass
@@ -530,17 +2079,34 @@ class YoloLabel:
 
 
 class YoloImage:
-    def __init__(self, image_file, bboxes, masks):
+    __slots__ = ("image_file", "bboxes", "masks", "output_name", "tags")
+
+    def __init__(self, image_file, bboxes, masks, output_name=None, tags=None):
+        """
+        Output name is the file name of the image in the dataset, the name of the image file by default.
+        Tags are labels of the whole image, used by classification datasets.
+        """
         self.image_file = image_file
         self.bboxes = bboxes
         self.masks = masks
+        self.output_name = output_name or os.path.basename(image_file)
+        self.tags = tags or []
 
 
-class YoloLabeledBBox:
-    def __init__(self, class_name, bbox, unscaled_bbox):
-        self.class_name = class_name
-        self.bbox = bbox
-        self.unscaled_bbox = unscaled_bbox
+class YoloBoxes:
+    """
+    Boxes of a YoloImage as columns - class names, N x 4 arrays of (center x, center y, width, height) normalized
+    by the image size and of (left, top, right, bottom) in image pixels.
+    """
+    __slots__ = ("class_names", "boxes", "unscaled_boxes")
+
+    def __init__(self, class_names, boxes, unscaled_boxes):
+        self.class_names = class_names
+        self.boxes = boxes
+        self.unscaled_boxes = unscaled_boxes
+
+    def __len__(self):
+        return len(self.class_names)
 
 
 class YoloLabeledMask:
@@ -550,20 +2116,817 @@ class YoloLabeledMask:
         self.unscaled_mask = unscaled_mask
 
 
+class MaskConversionOptions:
+    def __init__(self, polygon_tolerance=0.0, max_polygon_points=0, polygon_cache=None):
+        self.polygon_tolerance = polygon_tolerance
+        self.max_polygon_points = max_polygon_points
+        self.polygon_cache = polygon_cache
+        self.simplification_summary = PolygonSimplificationSummary()
+
+    @property
+    def is_simplification_enabled(self):
+        return self.polygon_tolerance > 0 or self.max_polygon_points > 0
+
+    def __repr__(self):
+        return f"polygon_tolerance={self.polygon_tolerance}, max_polygon_points={self.max_polygon_points}"
+
+
+class TileOptions:
+    def __init__(self, tile_size, stride=0, min_visibility=DEFAULT_TILE_MIN_VISIBILITY):
+        """
+        Stride 0 makes tiles overlap by a quarter of the tile size.
+        """
+        self.tile_size = tile_size
+        self.stride = stride if stride > 0 else max(1, tile_size * 3 // 4)
+        self.min_visibility = min_visibility
+
+    def __repr__(self):
+        return f"tile_size={self.tile_size}, stride={self.stride}, min_visibility={self.min_visibility}"
+
+
+class CropOptions:
+    def __init__(self, crop_size=DEFAULT_CROP_SIZE, padding=DEFAULT_CROP_PADDING):
+        """
+        Padding enlarges boxes by this part of their width and height on every side.
+        """
+        self.crop_size = crop_size
+        self.padding = padding
+
+    def __repr__(self):
+        return f"crop_size={self.crop_size}, padding={self.padding}"
+
+
+@dataclass
+class PolygonSimplificationStats:
+    vertices_before: int
+    vertices_after: int
+    iou: float
+
+    def __str__(self):
+        return f"vertices: {self.vertices_before} -> {self.vertices_after}, IoU: {self.iou:.4f}"
+
+
+class PolygonSimplificationSummary:
+    def __init__(self):
+        self.mask_count = 0
+        self.vertices_before = 0
+        self.vertices_after = 0
+        self.iou_sum = 0.0
+        self.min_iou = None
+
+    def add(self, stats):
+        self.mask_count += 1
+        self.vertices_before += stats.vertices_before
+        self.vertices_after += stats.vertices_after
+        self.iou_sum += stats.iou
+        self.min_iou = stats.iou if self.min_iou is None else min(self.min_iou, stats.iou)
+
+    def __str__(self):
+        if self.mask_count == 0:
+            return "no masks"
+        return (
+            f"masks: {self.mask_count}, vertices: {self.vertices_before} -> {self.vertices_after}, "
+            f"IoU mean: {self.iou_sum / self.mask_count:.4f}, min: {self.min_iou:.4f}"
+        )
+
+
+class BoxConversionSummary:
+    """
+    Counts boxes dropped or changed by conversion over a run, reported once instead of a warning per box.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.box_count = 0
+        self.invalid_image_size_count = 0
+        self.outside_image_count = 0
+        self.clipped_count = 0
+
+    def add(self, box_count, invalid_image_size_count, outside_image_count, clipped_count):
+        self.box_count += box_count
+        self.invalid_image_size_count += invalid_image_size_count
+        self.outside_image_count += outside_image_count
+        self.clipped_count += clipped_count
+
+    @property
+    def skipped_count(self):
+        return self.invalid_image_size_count + self.outside_image_count
+
+    def __str__(self):
+        return (
+            f"boxes: {self.box_count}, skipped in images of invalid size: {self.invalid_image_size_count}, "
+            f"skipped outside the image after clipping: {self.outside_image_count}, clipped to the image: {self.clipped_count}"
+        )
+
+
+box_conversion_summary = BoxConversionSummary()
+
+
+class ConversionMetrics:
+    """
+    Accumulates wall time, CPU time, number of measurements (calls) and processed items of conversion stages.
+
+    CPU time is measured for the thread that executes the stage. Stages measured in worker processes or threads
+    (rle_decoding, contour_extraction, polygon_building, simplification_scoring, image_materialization, tile_cutting,
+    image_resizing) are reported back with their results, they overlap the main thread stages that wait for them (mask_conversion,
+    dataset_finishing, tiling, resizing), so their wall time can exceed the wall time of the run.
+    """
+
+    def __init__(self):
+        self.stages = {}
+
+    def reset(self):
+        self.stages = {}
+
+    @staticmethod
+    def now():
+        return time.perf_counter(), time.thread_time()
+
+    @staticmethod
+    def elapsed(started_at, finished_at=None):
+        finished_at = finished_at or ConversionMetrics.now()
+        return finished_at[0] - started_at[0], finished_at[1] - started_at[1]
+
+    def add(self, stage, wall_seconds, cpu_seconds=0.0, items=0):
+        stage_metrics = self.stages.get(stage)
+        if stage_metrics is None:
+            stage_metrics = {"wall_seconds": 0.0, "cpu_seconds": 0.0, "calls": 0, "items": 0}
+            self.stages[stage] = stage_metrics
+        stage_metrics["wall_seconds"] += wall_seconds
+        stage_metrics["cpu_seconds"] += cpu_seconds
+        stage_metrics["calls"] += 1
+        stage_metrics["items"] += items
+
+    @contextlib.contextmanager
+    def measure(self, stage, items=0):
+        started_at = self.now()
+        try:
+            yield
+        finally:
+            self.add(stage, *self.elapsed(started_at), items)
+
+    def measure_iterator(self, stage, iterable):
+        """
+        Yields items of the iterable, measuring only the time spent producing them, one item per step.
+        """
+        iterator = iter(iterable)
+        while True:
+            started_at = self.now()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add(stage, *self.elapsed(started_at))
+                return
+            self.add(stage, *self.elapsed(started_at), 1)
+            yield item
+
+    def save(self, metrics_file, image_count):
+        metrics_folder = os.path.dirname(os.path.abspath(metrics_file))
+        os.makedirs(metrics_folder, exist_ok=True)
+        with open(metrics_file, "w") as f:
+            json.dump(
+                {
+                    "converter_version": CONVERTER_VERSION,
+                    "image_count": image_count,
+                    "stages": self.stages,
+                },
+                f,
+                indent=1,
+            )
+
+    def __str__(self):
+        return ", ".join(
+            f"{stage}: {stage_metrics['wall_seconds']:.2f}s (CPU {stage_metrics['cpu_seconds']:.2f}s)"
+            for stage, stage_metrics in self.stages.items()
+        )
+
+
+conversion_metrics = ConversionMetrics()
+
+
+@dataclass
+class ConversionStats:
+    output_directory: str
+    image_count: int
+    class_names: list
+    elapsed_seconds: float
+    stages: dict
+    statistics: dict
+
+
+class ProgressReporter:
+    """
+    Writes progress of conversion stages as compact JSON lines, e.g.
+    {"event":"progress","stage":"write","done":120,"total":1000,"rate":85.3}
+
+    Total is null while it is unknown (images are not counted before conversion unless streaming), rate is items
+    per second since the stage has started. Events of all stages together are emitted at most max_rate times
+    per second, the final event of a stage is always emitted. Does nothing until configured with a stream.
+    Events of a worker request carry its id after the event name, e.g. {"event":"progress","id":1,"stage":...}.
+    """
+
+    def __init__(self):
+        self.stream = None
+        self.min_interval = 1.0 / DEFAULT_PROGRESS_RATE
+        self.request_id = None
+        self.stages = {}
+        self._last_emitted_at = None
+
+    def configure(self, stream, max_rate=DEFAULT_PROGRESS_RATE, request_id=None):
+        self.stream = stream
+        self.request_id = request_id
+        self.min_interval = 1.0 / max_rate if max_rate > 0 else 0.0
+        self.reset()
+
+    def reset(self):
+        self.stages = {}
+        self._last_emitted_at = None
+
+    def start(self, stage, total=None):
+        if self.stream is None:
+            return
+        stage_progress = self.stages.get(stage)
+        if stage_progress is None:
+            self.stages[stage] = {"done": 0, "total": total, "started_at": time.perf_counter()}
+        elif total is not None:
+            stage_progress["total"] = total
+
+    def advance(self, stage, count=1):
+        if self.stream is None:
+            return
+        stage_progress = self.stages.get(stage)
+        if stage_progress is None:
+            return
+        stage_progress["done"] += count
+        now = time.perf_counter()
+        if self._last_emitted_at is None or now - self._last_emitted_at >= self.min_interval:
+            self._emit(stage, stage_progress, now)
+
+    def finish(self, stage):
+        if self.stream is None:
+            return
+        stage_progress = self.stages.pop(stage, None)
+        if stage_progress is None:
+            return
+        if stage_progress["total"] is None:
+            stage_progress["total"] = stage_progress["done"]
+        self._emit(stage, stage_progress, time.perf_counter())
+
+    def _emit(self, stage, stage_progress, now):
+        elapsed = now - stage_progress["started_at"]
+        event = {"event": "progress"}
+        if self.request_id is not None:
+            event["id"] = self.request_id
+        event.update({
+            "stage": stage,
+            "done": stage_progress["done"],
+            "total": stage_progress["total"],
+            "rate": round(stage_progress["done"] / elapsed, 1) if elapsed > 0 else 0.0,
+        })
+        self.stream.write(json.dumps(event, separators=(",", ":")) + "\n")
+        self.stream.flush()
+        self._last_emitted_at = now
+
+
+progress_reporter = ProgressReporter()
+
+
 class ScriptOptions:
-    def __init__(self, input_annotations_files, output_directory, use_symlinks, train_val_percentage):
+    def __init__(self, input_annotations_files, output_directory, link_mode="copy", train_val_percentage=80, workers=1, streaming=False,
+                 incremental=False, polygon_tolerance=0.0, max_polygon_points=0,
+                 label_precision=DEFAULT_LABEL_PRECISION, io_threads=DEFAULT_IO_THREAD_COUNT, output_format="folders",
+                 max_shard_size=DEFAULT_MAX_SHARD_SIZE, metrics_file=None, profile_file=None, progress="none",
+                 progress_rate=DEFAULT_PROGRESS_RATE, verbose=False, worker=False, dedup="none",
+                 dedup_distance=DEFAULT_NEAR_DUPLICATE_DISTANCE, dedup_keep="most_labels", tile_size=0, tile_stride=0,
+                 tile_min_visibility=DEFAULT_TILE_MIN_VISIBILITY, image_size=0, image_format="keep",
+                 image_quality=DEFAULT_IMAGE_QUALITY, image_cache_directory=DEFAULT_IMAGE_CACHE_DIRECTORY,
+                 polygon_cache_file=None, polygon_cache_size=DEFAULT_MAX_CACHE_SIZE, tasks=None,
+                 crop_size=DEFAULT_CROP_SIZE, crop_padding=DEFAULT_CROP_PADDING):
         self.input_annotations_files = input_annotations_files
         self.output_directory = output_directory
-        self.use_symlinks = use_symlinks
+        self.link_mode = link_mode
         self.train_val_percentage = train_val_percentage
+        self.workers = workers
+        self.streaming = streaming
+        self.incremental = incremental
+        self.polygon_tolerance = polygon_tolerance
+        self.max_polygon_points = max_polygon_points
+        self.label_precision = label_precision
+        self.io_threads = io_threads
+        self.output_format = output_format
+        self.max_shard_size = max_shard_size
+        self.metrics_file = metrics_file
+        self.profile_file = profile_file
+        self.progress = progress
+        self.progress_rate = progress_rate
+        self.verbose = verbose
+        self.worker = worker
+        self.dedup = dedup
+        self.dedup_distance = dedup_distance
+        self.dedup_keep = dedup_keep
+        self.tile_size = tile_size
+        self.tile_stride = tile_stride
+        self.tile_min_visibility = tile_min_visibility
+        self.image_size = image_size
+        self.image_format = image_format
+        self.image_quality = image_quality
+        self.image_cache_directory = image_cache_directory
+        self.polygon_cache_file = polygon_cache_file
+        self.polygon_cache_size = polygon_cache_size
+        self.tasks = tasks
+        self.crop_size = crop_size
+        self.crop_padding = crop_padding
 
     def __repr__(self):
         return (
             "ScriptOptions("
             f"input_annotations_files={self.input_annotations_files}, "
             f"output_directory='{self.output_directory}', "
-            f"use_symlinks={self.use_symlinks}, "
-            f"train_val_percentage={self.train_val_percentage})"
+            f"link_mode={self.link_mode}, "
+            f"train_val_percentage={self.train_val_percentage}, "
+            f"workers={self.workers}, "
+            f"streaming={self.streaming}, "
+            f"incremental={self.incremental}, "
+            f"polygon_tolerance={self.polygon_tolerance}, "
+            f"max_polygon_points={self.max_polygon_points}, "
+            f"label_precision={self.label_precision}, "
+            f"io_threads={self.io_threads}, "
+            f"output_format={self.output_format}, "
+            f"max_shard_size={self.max_shard_size}, "
+            f"metrics_file={self.metrics_file}, "
+            f"profile_file={self.profile_file}, "
+            f"progress={self.progress}, "
+            f"progress_rate={self.progress_rate}, "
+            f"verbose={self.verbose}, "
+            f"worker={self.worker}, "
+            f"dedup={self.dedup}, "
+            f"dedup_distance={self.dedup_distance}, "
+            f"dedup_keep={self.dedup_keep}, "
+            f"tile_size={self.tile_size}, "
+            f"tile_stride={self.tile_stride}, "
+            f"tile_min_visibility={self.tile_min_visibility}, "
+            f"image_size={self.image_size}, "
+            f"image_format={self.image_format}, "
+            f"image_quality={self.image_quality}, "
+            f"image_cache_directory='{self.image_cache_directory}', "
+            f"polygon_cache_file={self.polygon_cache_file}, "
+            f"polygon_cache_size={self.polygon_cache_size}, "
+            f"tasks={self.tasks}, "
+            f"crop_size={self.crop_size}, "
+            f"crop_padding={self.crop_padding})"
+        )
+
+
+class ConversionManifest:
+    """
+    Keeps fingerprints of conversion inputs and outputs, used by incremental conversion.
+
+    For each annotations file the manifest stores a fingerprint (hash of the annotations file, names of
+    images next to it and mask conversion options) and a cache file with converted YoloImage objects, so unchanged annotation files are
+    not parsed and converted again. Cached images are keyed by a hash of their <image> element, image file
+    and mask conversion options - when an annotations file changes, only its new and edited images are converted,
+    the rest is read from the previous cache. For each image in the output it stores path, size and modification time
+    of the source file, so unchanged images are not copied again (crops of boxes also keep a hash of the boxes
+    and crop options, so unchanged crops are not cut again). Class map of the previous run is kept
+    to report when class indices, and hence all labels, change.
+    """
+
+    FILE_NAME = ".conversion-manifest.json"
+    CACHE_FOLDER_NAME = ".conversion-cache"
+
+    def __init__(self, output_folder, annotations=None, images=None, class_names=None):
+        self.output_folder = output_folder
+        self.annotations = annotations or {}
+        self.previous_images = images or {}
+        self.previous_class_names = class_names or []
+        self.images = {}
+        self.labels = set()
+        self.class_names = []
+
+    @classmethod
+    def load(cls, output_folder):
+        manifest_path = os.path.join(output_folder, cls.FILE_NAME)
+        try:
+            with open(manifest_path, "r") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            logger.info(f"Conversion manifest not found @ {manifest_path}, performing full conversion")
+            return cls(output_folder)
+        except (ValueError, OSError) as ex:
+            logger.warning(f"Failed to read conversion manifest @ {manifest_path}, performing full conversion: {ex}")
+            return cls(output_folder)
+
+        if data.get("converter_version") != CONVERTER_VERSION:
+            logger.info(
+                f"Conversion manifest was created by converter v{data.get('converter_version')}, "
+                f"current is v{CONVERTER_VERSION}, performing full conversion"
+            )
+            return cls(output_folder)
+
+        return cls(
+            output_folder,
+            annotations=data.get("annotations"),
+            images=data.get("images"),
+            class_names=data.get("class_names"),
+        )
+
+    def save(self, annotations_files):
+        annotations_files = [os.path.abspath(annotations_file) for annotations_file in annotations_files]
+        for annotations_file, entry in list(self.annotations.items()):
+            if annotations_file not in annotations_files:
+                logger.info(f"Annotations file {annotations_file} is not part of the dataset anymore")
+                self._delete_file(os.path.join(self.output_folder, entry["cache"]))
+                del self.annotations[annotations_file]
+
+        if self.previous_class_names and self.class_names != self.previous_class_names:
+            logger.info(f"Class map has changed: {self.previous_class_names} -> {self.class_names}")
+
+        manifest_path = os.path.join(self.output_folder, self.FILE_NAME)
+        with open(manifest_path + ".tmp", "w") as f:
+            json.dump(
+                {
+                    "converter_version": CONVERTER_VERSION,
+                    "class_names": self.class_names,
+                    "annotations": self.annotations,
+                    "images": self.images,
+                },
+                f,
+                indent=1,
+            )
+        os.replace(manifest_path + ".tmp", manifest_path)
+
+    def prepare_images(self, annotations_file, mask_executor=None, mask_options=None, streaming=False):
+        """
+        Returns images of the annotations file either from cache or by converting them and caching the result.
+        """
+        fingerprint = self.get_annotations_fingerprint(annotations_file, mask_options)
+        entry = self.annotations.get(os.path.abspath(annotations_file))
+        cache_file = self._get_cache_file(annotations_file)
+        # entries written before images were cached one by one have no offsets, their cache is not reused
+        if entry is None or "image_offsets" not in entry or not os.path.exists(cache_file):
+            previous_offsets = {}
+        else:
+            previous_offsets = entry["image_offsets"]
+            if entry["fingerprint"] == fingerprint:
+                logger.info(f"Annotations file {annotations_file} has not changed, using {entry['image_count']} cached image(s)")
+                images = self._iter_cached_images(cache_file)
+                return images if streaming else list(images)
+            logger.info(f"Annotations file {annotations_file} has changed, converting new and edited images")
+        images = self._convert_images(annotations_file, fingerprint, previous_offsets, mask_executor, mask_options)
+        return images if streaming else list(images)
+
+    def count_matching_images(self, annotations_file, mask_options=None):
+        entry = self.annotations.get(os.path.abspath(annotations_file))
+        if entry is not None and entry["fingerprint"] == self.get_annotations_fingerprint(annotations_file, mask_options):
+            return entry["image_count"]
+        return count_matching_images(annotations_file)
+
+    @staticmethod
+    def get_annotations_fingerprint(annotations_file, mask_options=None):
+        file_hash = hashlib.sha256(repr(mask_options or MaskConversionOptions()).encode("utf-8"))
+        with open_file(get_annotations_path(annotations_file)) as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                file_hash.update(chunk)
+        for image_name in sorted(list_image_files(get_images_folder(annotations_file))):
+            file_hash.update(b"\0" + image_name.encode("utf-8"))
+        return file_hash.hexdigest()
+
+    def is_image_up_to_date(self, source_file, destination_file, link_mode):
+        previous = self.previous_images.get(self._get_relative_path(destination_file))
+        return (
+            previous is not None
+            and previous == self._get_image_fingerprint(source_file, link_mode)
+            and os.path.lexists(destination_file)
+        )
+
+    def add_image(self, source_file, destination_file, link_mode):
+        self.images[self._get_relative_path(destination_file)] = self._get_image_fingerprint(source_file, link_mode)
+
+    def is_crop_up_to_date(self, source_file, crop_file, crop_key):
+        previous = self.previous_images.get(self._get_relative_path(crop_file))
+        return (
+            previous is not None
+            and previous == self._get_crop_fingerprint(source_file, crop_key)
+            and os.path.exists(crop_file)
+        )
+
+    def add_crop(self, source_file, crop_file, crop_key):
+        self.images[self._get_relative_path(crop_file)] = self._get_crop_fingerprint(source_file, crop_key)
+
+    def add_label(self, label_file):
+        self.labels.add(self._get_relative_path(label_file))
+
+    def delete_stale_files(self, folders):
+        """
+        Deletes files in the given folders that were not written during this run.
+        """
+        deleted_count = 0
+        for folder in folders:
+            for root, _, files in os.walk(folder):
+                for file_name in files:
+                    relative_path = self._get_relative_path(os.path.join(root, file_name))
+                    if relative_path not in self.images and relative_path not in self.labels:
+                        self._delete_file(os.path.join(root, file_name))
+                        deleted_count += 1
+        logger.info(f"Deleted {deleted_count} stale file(s)")
+
+    def _convert_images(self, annotations_file, fingerprint, previous_offsets, mask_executor=None, mask_options=None):
+        """
+        Yields YoloImage objects of the annotations file in their order in it, reading images whose key is in
+        previous_offsets from the previous cache file and converting the others in batches. All of them are written
+        to a new cache file, which replaces the previous one once the file is done.
+        """
+        mask_options = mask_options or MaskConversionOptions()
+        options_key = repr(mask_options).encode("utf-8")
+        images_folder = get_images_folder(annotations_file)
+        all_images = list_image_files(images_folder)
+        cache_file = self._get_cache_file(annotations_file)
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        image_offsets = {}
+        reused_count = 0
+        with open(cache_file, "rb") if previous_offsets else contextlib.nullcontext() as previous_cache, \
+                open(cache_file + ".tmp", "wb") as f:
+            def flush(batch):
+                pending_images = [(image, image_file) for _, _, image, image_file in batch if image is not None]
+                converted = iter(convert_images_to_yolo(pending_images, mask_executor, mask_options))
+                for key, cached_image, image, _ in batch:
+                    yolo_image = next(converted) if image is not None else cached_image
+                    image_offsets[key] = f.tell()
+                    pickle.dump((key, yolo_image), f, protocol=pickle.HIGHEST_PROTOCOL)
+                    yield yolo_image
+
+            batch = []
+            pending_count = 0
+            image_elems = conversion_metrics.measure_iterator("annotation_parsing", iter_image_elements(annotations_file))
+            for image_elem in image_elems:
+                image_file = all_images.get(image_elem.attrib["name"])
+                if image_file is None:
+                    logger.info(f"Failed to find annotated image {image_elem.attrib['name']} in {images_folder}")
+                    continue
+                key_hash = hashlib.blake2b(options_key, digest_size=16)
+                key_hash.update(b"\0" + image_file.encode("utf-8") + b"\0")
+                key_hash.update(ET.tostring(image_elem))
+                key = key_hash.hexdigest()
+                cached_image = self._read_cached_image(previous_cache, previous_offsets.get(key), key)
+                if cached_image is not None:
+                    reused_count += 1
+                    progress_reporter.advance("convert")
+                    batch.append((key, cached_image, None, image_file))
+                    continue
+                batch.append((key, None, parse_image_element(image_elem), image_file))
+                pending_count += 1
+                if pending_count >= MASK_BATCH_IMAGE_COUNT:
+                    yield from flush(batch)
+                    batch = []
+                    pending_count = 0
+            yield from flush(batch)
+        os.replace(cache_file + ".tmp", cache_file)
+        logger.info(
+            f"Prepared {len(image_offsets)} image(s) of {annotations_file}, "
+            f"converted {len(image_offsets) - reused_count}, reused {reused_count} cached"
+        )
+        self.annotations[os.path.abspath(annotations_file)] = {
+            "fingerprint": fingerprint,
+            "cache": self._get_relative_path(cache_file),
+            "image_count": len(image_offsets),
+            "image_offsets": image_offsets,
+        }
+
+    @staticmethod
+    def _read_cached_image(cache, offset, key):
+        """
+        Returns the cached YoloImage at the offset, None if there is none or the record has a different key
+        (e.g. the cache file was rewritten by a run that failed before saving the manifest).
+        """
+        if offset is None:
+            return None
+        try:
+            cache.seek(offset)
+            cached_key, image = pickle.load(cache)
+        except (EOFError, pickle.UnpicklingError, ValueError, TypeError):
+            return None
+        return image if cached_key == key else None
+
+    @staticmethod
+    def _iter_cached_images(cache_file):
+        with open(cache_file, "rb") as f:
+            while True:
+                try:
+                    _, image = pickle.load(f)
+                except EOFError:
+                    return
+                progress_reporter.advance("convert")
+                yield image
+
+    def _get_cache_file(self, annotations_file):
+        cache_name = hashlib.sha1(os.path.abspath(annotations_file).encode("utf-8")).hexdigest()
+        return os.path.join(self.output_folder, self.CACHE_FOLDER_NAME, f"{cache_name}.pkl")
+
+    def _get_relative_path(self, file_path):
+        return os.path.relpath(file_path, self.output_folder).replace(os.sep, "/")
+
+    @staticmethod
+    def _get_image_fingerprint(source_file, link_mode):
+        return dict(get_file_fingerprint(source_file), link_mode=link_mode)
+
+    @staticmethod
+    def _get_crop_fingerprint(source_file, crop_key):
+        return dict(get_file_fingerprint(source_file), crop=crop_key)
+
+    @staticmethod
+    def _delete_file(file_path):
+        try:
+            os.remove(file_path)
+        except FileNotFoundError:
+            pass
+
+
+class FileMaterializer:
+    """
+    Copies or links files to the output folder on a thread pool.
+
+    Supported link modes are copy, symlink, relative-symlink (link target is relative to the destination folder,
+    so the dataset can be moved together with its sources), hardlink, reflink (copy-on-write clone, Linux and macOS
+    file systems that support it) and auto. Auto tries hardlink, reflink and copy in that order and remembers modes
+    that are not supported for a source device, so each file costs a single attempt after the first failure.
+
+    Submitted files are materialized in the background, at most a few per thread are in flight at once so memory
+    stays bounded. The first error is raised from submit() or when the context is exited.
+    """
+
+    FICLONE = 0x40049409
+    MEMBER_COPY_BUFFER_SIZE = 1024 * 1024
+
+    def __init__(self, link_mode, thread_count=DEFAULT_IO_THREAD_COUNT):
+        if link_mode not in LINK_MODES:
+            raise ValueError(f"Unknown link mode {link_mode}, supported modes: {LINK_MODES}")
+        self.link_mode = link_mode
+        self.thread_count = max(1, thread_count)
+        self.stats = MaterializationStats()
+        self._unsupported_modes = set()
+        self._executor = None
+        self._pending = deque()
+
+    def __enter__(self):
+        self._executor = ThreadPoolExecutor(max_workers=self.thread_count, thread_name_prefix="materializer")
+        self._started_at = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                self.wait()
+        finally:
+            self._executor.shutdown(wait=True, cancel_futures=exc_type is not None)
+            self.stats.elapsed = time.perf_counter() - self._started_at
+        return False
+
+    def submit(self, source_file, destination_file, replace=False, linked_files=()):
+        """
+        Linked files get links to the destination file once it is materialized (see materialize_linked).
+        """
+        while len(self._pending) >= self.thread_count * 4:
+            self._complete(self._pending.popleft())
+        self._pending.append(
+            self._executor.submit(self.materialize_linked, source_file, destination_file, replace, linked_files)
+        )
+
+    def skip(self):
+        self.stats.skipped_count += 1
+
+    def wait(self):
+        while self._pending:
+            self._complete(self._pending.popleft())
+
+    def materialize(self, source_file, destination_file, replace=False):
+        """
+        Materializes a single file on the calling thread, returns (used link mode, file size, wall time, CPU time).
+        """
+        started_at = ConversionMetrics.now()
+        if replace and os.path.lexists(destination_file):
+            os.remove(destination_file)
+        if is_member_path(source_file):
+            # archive members can not be linked, they are decompressed straight to the destination
+            link_mode = "copy"
+            with open_file(source_file) as source, open(destination_file, "wb") as destination:
+                shutil.copyfileobj(source, destination, self.MEMBER_COPY_BUFFER_SIZE)
+        elif self.link_mode != "auto":
+            link_mode = self.link_mode
+            self._materialize(link_mode, source_file, destination_file)
+        else:
+            link_mode = self._materialize_auto(source_file, destination_file)
+        size = get_file_size(source_file)
+        return (link_mode, size, *ConversionMetrics.elapsed(started_at))
+
+    def materialize_linked(self, source_file, destination_file, replace=False, linked_files=()):
+        """
+        Materializes a file and links each of linked files to it, returns a materialize() result per file.
+        Linked files are hard links of the destination file, falling back to reflinks and copies where hard links
+        are not supported, or symbolic links to the source file if the file itself was materialized as one.
+        """
+        results = [self.materialize(source_file, destination_file, replace)]
+        source_link_mode, size = results[0][:2]
+        for linked_file in linked_files:
+            started_at = ConversionMetrics.now()
+            if replace and os.path.lexists(linked_file):
+                os.remove(linked_file)
+            if source_link_mode in ("symlink", "relative-symlink"):
+                link_mode = source_link_mode
+                self._materialize(link_mode, source_file, linked_file)
+            else:
+                link_mode = self._materialize_auto(destination_file, linked_file)
+            results.append((link_mode, size, *ConversionMetrics.elapsed(started_at)))
+        return results
+
+    def _complete(self, future):
+        for link_mode, size, wall_seconds, cpu_seconds in future.result():
+            self.stats.add(link_mode, size, wall_seconds)
+            conversion_metrics.add("image_materialization", wall_seconds, cpu_seconds, 1)
+
+    def _materialize_auto(self, source_file, destination_file):
+        source_device = os.stat(source_file).st_dev
+        for link_mode in AUTO_LINK_MODES:
+            if (link_mode, source_device) in self._unsupported_modes:
+                continue
+            try:
+                self._materialize(link_mode, source_file, destination_file)
+                return link_mode
+            except (FileNotFoundError, FileExistsError):
+                raise
+            except OSError as ex:
+                if link_mode == AUTO_LINK_MODES[-1]:
+                    raise
+                logger.info(f"Link mode {link_mode} is not supported for {source_file}, falling back: {ex}")
+                self._unsupported_modes.add((link_mode, source_device))
+
+    @classmethod
+    def _materialize(cls, link_mode, source_file, destination_file):
+        if link_mode == "copy":
+            shutil.copy2(source_file, destination_file)
+        elif link_mode == "symlink":
+            os.symlink(os.path.abspath(source_file), destination_file)
+        elif link_mode == "relative-symlink":
+            os.symlink(
+                os.path.relpath(os.path.abspath(source_file), os.path.dirname(os.path.abspath(destination_file))),
+                destination_file)
+        elif link_mode == "hardlink":
+            os.link(source_file, destination_file)
+        elif link_mode == "reflink":
+            cls._reflink(source_file, destination_file)
+        else:
+            raise ValueError(f"Unknown link mode {link_mode}")
+
+    @classmethod
+    def _reflink(cls, source_file, destination_file):
+        if sys.platform.startswith("linux"):
+            import fcntl
+
+            with open(source_file, "rb") as source, open(destination_file, "xb") as destination:
+                try:
+                    fcntl.ioctl(destination.fileno(), cls.FICLONE, source.fileno())
+                except OSError:
+                    destination.close()
+                    os.remove(destination_file)
+                    raise
+        elif sys.platform == "darwin":
+            import ctypes
+
+            libc = ctypes.CDLL(None, use_errno=True)
+            if libc.clonefile(os.fsencode(source_file), os.fsencode(destination_file), 0) != 0:
+                error = ctypes.get_errno()
+                raise OSError(error, os.strerror(error), destination_file)
+        else:
+            raise OSError(errno.ENOTSUP, "Reflinks are not supported on this platform", destination_file)
+        shutil.copystat(source_file, destination_file)
+
+
+class MaterializationStats:
+    def __init__(self):
+        self.skipped_count = 0
+        self.elapsed = 0.0
+        self.by_link_mode = {}
+
+    def add(self, link_mode, size, elapsed):
+        mode_stats = self.by_link_mode.setdefault(link_mode, {"files": 0, "bytes": 0, "seconds": 0.0})
+        mode_stats["files"] += 1
+        mode_stats["bytes"] += size
+        mode_stats["seconds"] += elapsed
+
+    @property
+    def copied_bytes(self):
+        return self.by_link_mode.get("copy", {}).get("bytes", 0)
+
+    def __str__(self):
+        modes = ", ".join(
+            f"{link_mode}: {mode_stats['files']} file(s), {mode_stats['bytes'] / (1024 * 1024):.1f} MB, "
+            f"{mode_stats['seconds']:.2f}s"
+            for link_mode, mode_stats in self.by_link_mode.items()
+        )
+        return (
+            f"{modes or 'no files'}; up-to-date: {self.skipped_count}, "
+            f"copied: {self.copied_bytes / (1024 * 1024):.1f} MB, elapsed: {self.elapsed:.2f}s"
         )
 
 
@@ -571,6 +2934,9 @@ class CvatMaskConverter:
 
     @staticmethod
     def draw_and_show_polygons(height, width, polygons):
+        import cv2
+        import matplotlib.pyplot as plt
+
         img = np.zeros((height, width, 3), np.uint8)
         polygons = [np.array(poly, dtype=np.int32).reshape((-1, 1, 2)) for poly in polygons]
 
@@ -585,26 +2951,78 @@ class CvatMaskConverter:
 
     @staticmethod
     def rle_to_mask(rle_string, height, width):
-        rle_numbers = [int(num_string) for num_string in rle_string.split(',')]
+        """
+        Decodes CVAT mask RLE (alternating background/foreground run lengths, starting with background)
+        into a uint8 mask of the given size with foreground pixels set to 255.
+
+        Runs are expanded with np.repeat over the run lengths, so the cost does not depend on a Python loop
+        per pixel. A trailing background run without a matching foreground run is ignored.
+
+        Raises:
+            ValueError: If the RLE string is empty, contains non-integer or negative run lengths,
+                        or covers more pixels than the mask has.
+        """
+        if height <= 0 or width <= 0:
+            raise ValueError(f"Invalid mask size {width}x{height}")
+
+        try:
+            rle_numbers = np.array([int(num_string) for num_string in rle_string.split(',')], dtype=np.int64)
+        except ValueError as ex:
+            raise ValueError(f"Malformed mask RLE, expected comma-separated integers: {ex}") from ex
+
         if len(rle_numbers) % 2 != 0:
             rle_numbers = rle_numbers[:-1]
-        rle_pairs = np.array(rle_numbers).reshape(-1, 2)
-        img = np.zeros([height, width], dtype=np.uint8)
-        start = 0
-        for index, length in rle_pairs:
-            start += index
-            for j in range(length):
-                img[start // width, start % width] = 255
-                start += 1
-        return img
+
+        if np.any(rle_numbers < 0):
+            raise ValueError("Malformed mask RLE, run lengths must not be negative")
+
+        pixel_count = height * width
+        rle_pixel_count = int(rle_numbers.sum())
+        if rle_pixel_count > pixel_count:
+            raise ValueError(
+                f"Mask RLE is out of bounds: it covers {rle_pixel_count} pixel(s), "
+                f"but mask {width}x{height} has only {pixel_count}"
+            )
+
+        run_values = np.tile(np.array([0, 255], dtype=np.uint8), len(rle_numbers) // 2)
+        img = np.zeros(pixel_count, dtype=np.uint8)
+        img[:rle_pixel_count] = np.repeat(run_values, rle_numbers)
+        return img.reshape(height, width)
+
+    @staticmethod
+    def mask_to_polygons(mask, tolerance=0.0, max_points=0):
+        """
+        Converts a binary mask to a list of OpenCV-style polygons (N x 1 x 2 int32 arrays, first point repeated at the end).
+
+        Every outer boundary becomes a single polygon. Its holes are merged into it through zero-width
+        bridge seams (see bridge_holes), so a polygon with holes can be described by a single ring as
+        YOLO segmentation format expects. Islands inside holes become separate polygons.
+        Polygons are simplified if tolerance or max_points is specified, see simplify_rings.
+        """
+        return CvatMaskConverter.rings_to_polygons(CvatMaskConverter.find_contour_rings(mask), tolerance, max_points)
 
     @staticmethod
-    def mask_to_polygons(mask):
-        polygons = []
+    def find_contour_rings(mask):
+        """
+        Finds contours of the mask and groups them into (outer ring, [hole rings]) tuples, rings are N x 2 arrays.
+        """
+        import cv2
+
         contours, hierarchy = cv2.findContours(mask, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+        if hierarchy is None:
+            return []
+        hierarchy = hierarchy[0]
+
+        depths = np.zeros(len(contours), dtype=np.int32)
+        for i in range(len(contours)):
+            parent = hierarchy[i][3]
+            if parent != -1:
+                # OpenCV lists parents before their children
+                depths[i] = depths[parent] + 1
 
+        rings = []
         for i in range(len(contours)):
-            if hierarchy[0][i][3] != -1:
+            if depths[i] % 2 != 0:
                 continue
             polygon_coords = contours[i].reshape(-1, 2)
 
@@ -612,50 +3030,203 @@ class CvatMaskConverter:
             if len(polygon_coords) < 3:
                 continue
 
-            polygon = Polygon(polygon_coords)
-
-            if hierarchy[0][i][2] != -1:
-                hole_index = hierarchy[0][i][2]
+            holes = []
+            hole_index = hierarchy[i][2]
+            while hole_index != -1:
                 hole_coords = contours[hole_index].reshape(-1, 2)
-                hole = Polygon(hole_coords)
-                centroid = hole.centroid
-
-                result = polygon.difference(hole)
-
-                if isinstance(result, GeometryCollection):
-                    geometries = [geom for geom in result.geoms if isinstance(geom, Polygon)]
-                else:
-                    geometries = [result]
-
-                for geom in geometries:
-                    for angle in np.linspace(0, 2 * np.pi, 1000):
-                        line_candidate = LineString(
-                            [(centroid.x + 1000 * np.cos(angle + np.pi), centroid.y + 1000 * np.sin(angle + np.pi)),
-                             (centroid.x + 1000 * np.cos(angle), centroid.y + 1000 * np.sin(angle))])
-                        split_result = split(geom, line_candidate)
-
-                        if isinstance(split_result, GeometryCollection):
-                            split_polygons = [g for g in split_result.geoms if isinstance(g, Polygon)]
-                        else:
-                            split_polygons = list(split_result)
-
-                        if len(split_polygons) == 2:
-                            polygons.extend(split_polygons)
-                            break
-            else:
-                polygons.append(polygon)
+                if len(hole_coords) >= 3:
+                    holes.append(hole_coords)
+                hole_index = hierarchy[hole_index][0]
+
+            rings.append((polygon_coords, holes))
 
+        return rings
+
+    @staticmethod
+    def rings_to_polygons(rings, tolerance=0.0, max_points=0):
         opencv_polygons = []
-        for polygon in polygons:
-            contour = np.array(polygon.exterior.coords).reshape((-1, 1, 2)).astype(np.int32)
+        for outer, holes in rings:
+            if tolerance > 0 or max_points > 0:
+                outer, holes = CvatMaskConverter.simplify_rings(outer, holes, tolerance, max_points)
+            ring = CvatMaskConverter.bridge_holes(outer, holes)
+            contour = np.concatenate((ring, ring[:1])).reshape((-1, 1, 2)).astype(np.int32)
             opencv_polygons.append(contour)
 
         return opencv_polygons
 
     @staticmethod
-    def cvat_rle_to_polygon(rle_string, image_height, image_width):
+    def simplify_rings(outer, holes, tolerance=0.0, max_points=0):
+        """
+        Simplifies outer ring and holes of a polygon with Douglas-Peucker algorithm (cv2.approxPolyDP).
+
+        Rings are simplified separately, before holes are bridged, so seams stay intact. If max_points is
+        specified and the polygon still has more points, tolerance is doubled until it fits. The outer ring
+        never goes below 3 points - the last approximation that kept a valid ring is used instead.
+        Holes that degenerate to less than 3 points are removed.
+        """
+        epsilon = tolerance
+        result = (outer, holes)
+        for _ in range(MAX_SIMPLIFICATION_ITERATIONS):
+            if epsilon > 0:
+                simplified_outer = CvatMaskConverter.approximate_ring(outer, epsilon)
+                if len(simplified_outer) < 3:
+                    break
+                simplified_holes = [CvatMaskConverter.approximate_ring(hole, epsilon) for hole in holes]
+                result = (simplified_outer, [hole for hole in simplified_holes if len(hole) >= 3])
+
+            if max_points <= 0 or CvatMaskConverter.count_polygon_points(*result) <= max_points:
+                break
+            epsilon = max(epsilon * 2, MIN_SIMPLIFICATION_TOLERANCE)
+        return result
+
+    @staticmethod
+    def approximate_ring(ring, epsilon):
+        import cv2
+
+        return cv2.approxPolyDP(ring.reshape(-1, 1, 2).astype(np.int32), epsilon, True).reshape(-1, 2)
+
+    @staticmethod
+    def count_polygon_points(outer, holes):
+        """
+        Returns number of points in a polygon produced from the rings: each bridge adds two points
+        (hole vertex and outer vertex are repeated), the first point is repeated to close the polygon.
+        """
+        return len(outer) + sum(len(hole) + 2 for hole in holes) + 1
+
+    @staticmethod
+    def calculate_iou(mask, polygons):
+        """
+        Calculates IoU between the mask and its polygons rasterized back to a mask of the same size.
+        """
+        import cv2
+
+        polygons_mask = np.zeros(mask.shape, dtype=np.uint8)
+        cv2.fillPoly(polygons_mask, polygons, 255)
+        mask_pixels = mask > 0
+        polygon_pixels = polygons_mask > 0
+        union = np.count_nonzero(mask_pixels | polygon_pixels)
+        if union == 0:
+            return 1.0
+        return np.count_nonzero(mask_pixels & polygon_pixels) / union
+
+    @staticmethod
+    def bridge_holes(outer, holes):
+        """
+        Merges holes into the outer ring, each one through a zero-width seam - the ring goes from a ring vertex
+        to a hole vertex, around the hole and back along the same segment.
+
+        Holes are merged from right to left (by their rightmost vertex), each one is connected from its rightmost
+        vertex to the nearest vertex of the ring built so far that it can see - the seam has to leave the vertex
+        into the polygon interior and must not cross or touch any edge of the ring or of the holes not merged yet,
+        so the resulting ring never intersects itself. Holes are traversed in the direction opposite to the outer ring.
+        """
+        if not holes:
+            return outer
+
+        ring = outer
+        outer_orientation = np.sign(CvatMaskConverter.calculate_signed_area(outer))
+        holes = [
+            hole[::-1] if np.sign(CvatMaskConverter.calculate_signed_area(hole)) == outer_orientation else hole
+            for hole in holes
+        ]
+        holes.sort(key=lambda hole: int(hole[:, 0].max()), reverse=True)
+        # edges of holes in merge order, holes not merged yet are a suffix
+        hole_edge_starts = np.concatenate(holes).astype(np.int64)
+        hole_edge_ends = np.concatenate([np.roll(hole, -1, axis=0) for hole in holes]).astype(np.int64)
+        hole_edge_offsets = np.cumsum([0] + [len(hole) for hole in holes])
+        for hole_number, hole in enumerate(holes):
+            hole_index = int(np.argmax(hole[:, 0]))
+            remaining_edges = slice(hole_edge_offsets[hole_number], None)
+            ring_index = CvatMaskConverter.find_visible_vertex(
+                ring, hole[hole_index], hole_edge_starts[remaining_edges], hole_edge_ends[remaining_edges], outer_orientation
+            )
+            ring = np.concatenate((
+                ring[:ring_index + 1],
+                np.roll(hole, -hole_index, axis=0),
+                hole[hole_index:hole_index + 1],
+                # ring vertex is repeated after the hole, closing the seam
+                ring[ring_index:],
+            ))
+        return ring
+
+    @staticmethod
+    def find_visible_vertex(ring, point, hole_edge_starts, hole_edge_ends, orientation):
+        """
+        Returns index of the nearest ring vertex whose segment to the point starts into the polygon interior
+        and neither crosses nor touches edges of the ring or of the holes except at its own ends. Falls back
+        to the nearest vertex if there is none, which can only happen for rings that already intersect each other.
+        """
+        ring_points = ring.astype(np.int64)
+        point = np.asarray(point, dtype=np.int64)
+        edge_starts = np.concatenate((ring_points, hole_edge_starts))
+        edge_ends = np.concatenate((np.roll(ring_points, -1, axis=0), hole_edge_ends))
+        distances = np.sum((ring_points - point) ** 2, axis=1)
+        # the nearest vertices are almost always visible, the rest is sorted only if none of them is
+        nearest_count = min(len(distances), VISIBLE_VERTEX_CANDIDATE_COUNT)
+        nearest = np.argpartition(distances, nearest_count - 1)[:nearest_count]
+        nearest = nearest[np.lexsort((nearest, distances[nearest]))]
+        for candidates in (nearest, np.argsort(distances, kind="stable")):
+            for ring_index in candidates.tolist():
+                vertex = ring_points[ring_index]
+                if np.array_equal(vertex, point):
+                    return ring_index
+                if not CvatMaskConverter.is_direction_inside(
+                        ring_points[ring_index - 1], vertex, ring_points[(ring_index + 1) % len(ring_points)], point - vertex,
+                        orientation):
+                    continue
+                if not CvatMaskConverter.segment_hits_edges(vertex, point, edge_starts, edge_ends):
+                    return ring_index
+        return int(nearest[0])
+
+    @staticmethod
+    def is_direction_inside(previous_point, vertex, next_point, direction, orientation):
+        """
+        Checks whether the direction from the vertex points into the interior of a ring with the given orientation
+        (sign of its signed area), i.e. lies strictly inside the angle between its edges at the vertex.
+        """
+        def cross(first, second):
+            return int(first[0]) * int(second[1]) - int(first[1]) * int(second[0])
+
+        to_next = next_point - vertex
+        to_previous = previous_point - vertex
+        if orientation < 0:
+            to_next, to_previous = to_previous, to_next
+        if cross(to_next, to_previous) > 0:
+            return cross(to_next, direction) > 0 and cross(direction, to_previous) > 0
+        return cross(to_next, direction) > 0 or cross(direction, to_previous) > 0
+
+    @staticmethod
+    def segment_hits_edges(start, end, edge_starts, edge_ends):
+        """
+        Checks whether the segment properly crosses any of the edges or passes through any of their vertices,
+        vertices at the segment ends are ignored.
+        """
+        def sides(points, origin, vector):
+            return np.sign(vector[..., 0] * (points[..., 1] - origin[..., 1]) - vector[..., 1] * (points[..., 0] - origin[..., 0]))
+
+        direction = end - start
+        edge_directions = edge_ends - edge_starts
+        edge_start_sides = sides(edge_starts, start, direction)
+        crossings = (
+            (edge_start_sides * sides(edge_ends, start, direction) < 0)
+            & (sides(start, edge_starts, edge_directions) * sides(end, edge_starts, edge_directions) < 0)
+        )
+        if np.any(crossings):
+            return True
+
+        # vertices lying on the open segment
+        projections = (edge_starts - start) @ direction
+        return bool(np.any((edge_start_sides == 0) & (projections > 0) & (projections < int(direction @ direction))))
+
+    @staticmethod
+    def calculate_signed_area(ring):
+        points = ring.astype(np.float64)
+        return 0.5 * float(np.sum(points[:, 0] * np.roll(points[:, 1], -1) - np.roll(points[:, 0], -1) * points[:, 1]))
+
+    @staticmethod
+    def cvat_rle_to_polygon(rle_string, image_height, image_width, tolerance=0.0, max_points=0):
         mask = CvatMaskConverter.rle_to_mask(rle_string, image_height, image_width)
-        polygons = CvatMaskConverter.mask_to_polygons(mask)
+        polygons = CvatMaskConverter.mask_to_polygons(mask, tolerance, max_points)
         return polygons
 
     @staticmethod
@@ -0,0 +1,266 @@
+import bisect
+import json
+import mmap
+import os
+import struct
+import numpy as np
+
+SHARD_MAGIC = b"YOLOSHRD"
+SHARD_VERSION = 1
+SHARD_EXTENSION = ".shard"
+SHARD_INDEX_FILE_NAME = "shards.json"
+DEFAULT_MAX_SHARD_SIZE = 1024 * 1024 * 1024
+# magic, version, reserved, metadata offset, metadata size
+SHARD_HEADER = struct.Struct("<8sIIQQ")
+SHARD_ALIGNMENT = 64
+
+RECORD_DTYPE = np.dtype([("image_offset", "<u8"), ("image_size", "<u8"), ("row_start", "<u8"), ("row_count", "<u8")])
+ROW_DTYPE = np.dtype([("class_index", "<i4"), ("value_count", "<u4"), ("value_start", "<u8")])
+VALUE_DTYPE = np.dtype("<f4")
+
+
+class ShardWriter:
+    """
+    Packs records (encoded image bytes + YOLO label rows) of one dataset split into shard files.
+
+    Shard layout: fixed-size header, encoded images one after another, then three NumPy arrays aligned to
+    SHARD_ALIGNMENT - records (image offset/size and range of label rows), label rows (class index and range of values)
+    and label values (normalized coordinates, float32) - and JSON metadata with record names and array offsets.
+    A new shard is started once the current one would grow over max_shard_size.
+    Shards are written to temporary files and renamed when complete.
+    """
+
+    def __init__(self, output_folder, name_prefix, max_shard_size=DEFAULT_MAX_SHARD_SIZE):
+        self.output_folder = output_folder
+        self.name_prefix = name_prefix
+        self.max_shard_size = max_shard_size
+        self.shard_files = []
+        self.record_count = 0
+        self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self._discard()
+        return False
+
+    def add(self, name, image_bytes, labels):
+        """
+        Adds a record, labels is an iterable of (class index, values) rows.
+        """
+        if self._file is not None and self._records and self._file.tell() + len(image_bytes) > self.max_shard_size:
+            self._finish_shard()
+        if self._file is None:
+            self._start_shard()
+
+        image_offset = self._file.tell()
+        self._file.write(image_bytes)
+        row_start = len(self._rows)
+        for class_index, values in labels:
+            values = np.asarray(values, dtype=np.float64).ravel()
+            self._rows.append((class_index, len(values), self._value_count))
+            self._values.append(values)
+            self._value_count += len(values)
+        self._records.append((image_offset, len(image_bytes), row_start, len(self._rows) - row_start))
+        self._names.append(name)
+        self.record_count += 1
+
+    def close(self):
+        if self._file is not None:
+            self._finish_shard()
+        return self.shard_files
+
+    def _start_shard(self):
+        shard_name = f"{self.name_prefix}-{len(self.shard_files):05d}{SHARD_EXTENSION}"
+        self._shard_path = os.path.join(self.output_folder, shard_name)
+        self._file = open(self._shard_path + ".tmp", "wb")
+        self._file.write(b"\0" * SHARD_ALIGNMENT)
+        self._records = []
+        self._rows = []
+        self._values = []
+        self._value_count = 0
+        self._names = []
+
+    def _finish_shard(self):
+        values = np.concatenate(self._values) if self._values else np.empty(0)
+        # same clamping as label files, NaN is written as 0
+        values = np.clip(np.nan_to_num(values, nan=0.0), 0.0, 1.0).astype(VALUE_DTYPE)
+        arrays = {
+            "records": np.array(self._records, dtype=RECORD_DTYPE),
+            "rows": np.array(self._rows, dtype=ROW_DTYPE),
+            "values": values,
+        }
+        array_entries = {}
+        for array_name, array in arrays.items():
+            self._pad_to_alignment()
+            array_entries[array_name] = {"offset": self._file.tell(), "count": len(array)}
+            self._file.write(array.tobytes())
+
+        metadata = json.dumps({"names": self._names, "arrays": array_entries}).encode("utf-8")
+        metadata_offset = self._file.tell()
+        self._file.write(metadata)
+        self._file.seek(0)
+        self._file.write(SHARD_HEADER.pack(SHARD_MAGIC, SHARD_VERSION, 0, metadata_offset, len(metadata)))
+        self._file.close()
+        self._file = None
+        os.replace(self._shard_path + ".tmp", self._shard_path)
+        self.shard_files.append(os.path.basename(self._shard_path))
+
+    def _pad_to_alignment(self):
+        padding = -self._file.tell() % SHARD_ALIGNMENT
+        self._file.write(b"\0" * padding)
+
+    def _discard(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            os.remove(self._shard_path + ".tmp")
+
+
+class ShardRecord:
+    def __init__(self, name, image, class_indices, labels):
+        self.name = name
+        self.image = image
+        self.class_indices = class_indices
+        self.labels = labels
+
+
+class ShardReader:
+    """
+    Reads records of a single shard file through a read-only memory map.
+
+    Records are returned without copying: image is a memoryview of the encoded image bytes and labels are
+    NumPy views of the mapped label values, so decoding can start straight from the page cache.
+    Records may outlive the reader - if their views are still alive when it is closed, the file is unmapped
+    once the last of them is released.
+    """
+
+    def __init__(self, shard_path):
+        self.shard_path = shard_path
+        with open(shard_path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._buffer = memoryview(self._mmap)
+
+        magic, version, _, metadata_offset, metadata_size = SHARD_HEADER.unpack_from(self._buffer, 0)
+        if magic != SHARD_MAGIC:
+            self.close()
+            raise ValueError(f"File {shard_path} is not a dataset shard")
+        if version != SHARD_VERSION:
+            self.close()
+            raise ValueError(f"Shard {shard_path} has version {version}, supported version is {SHARD_VERSION}")
+
+        metadata = json.loads(bytes(self._buffer[metadata_offset:metadata_offset + metadata_size]).decode("utf-8"))
+        self.names = metadata["names"]
+        arrays = metadata["arrays"]
+        self.records = self._map_array(arrays["records"], RECORD_DTYPE)
+        self.rows = self._map_array(arrays["rows"], ROW_DTYPE)
+        self.values = self._map_array(arrays["values"], VALUE_DTYPE)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, index):
+        record = self.records[index]
+        image_offset = int(record["image_offset"])
+        image = self._buffer[image_offset:image_offset + int(record["image_size"])]
+        rows = self.rows[int(record["row_start"]):int(record["row_start"] + record["row_count"])]
+        labels = [
+            self.values[int(row["value_start"]):int(row["value_start"] + row["value_count"])]
+            for row in rows
+        ]
+        return ShardRecord(self.names[index], image, rows["class_index"], labels)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def close(self):
+        self.records = self.rows = self.values = None
+        buffer, self._buffer = self._buffer, None
+        mapped_file, self._mmap = self._mmap, None
+        if buffer is None:
+            return
+        try:
+            buffer.release()
+            mapped_file.close()
+        except BufferError:
+            # views of returned records (e.g. the last record of a loop) still export the buffer,
+            # the map is closed when they are garbage-collected
+            pass
+
+    def _map_array(self, entry, dtype):
+        return np.frombuffer(self._buffer, dtype=dtype, count=entry["count"], offset=entry["offset"])
+
+
+class ShardedDataset:
+    """
+    Random access to all records of a dataset split written as shards, using shards.json of the dataset folder.
+    """
+
+    def __init__(self, dataset_folder, split):
+        with open(os.path.join(dataset_folder, SHARD_INDEX_FILE_NAME), "r") as f:
+            index = json.load(f)
+        self.class_names = index["names"]
+        self.readers = [ShardReader(os.path.join(dataset_folder, shard_file)) for shard_file in index["splits"][split]]
+        self._record_ends = np.cumsum([len(reader) for reader in self.readers]).tolist()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def __len__(self):
+        return self._record_ends[-1] if self._record_ends else 0
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(f"Record index {index} is out of range, record count: {len(self)}")
+        shard_index = bisect.bisect_right(self._record_ends, index)
+        shard_start = self._record_ends[shard_index - 1] if shard_index > 0 else 0
+        return self.readers[shard_index][index - shard_start]
+
+    def __iter__(self):
+        for reader in self.readers:
+            yield from reader
+
+    def close(self):
+        """
+        Closes all readers, even if closing one of them fails - the first error is raised once all are closed.
+        """
+        error = None
+        for reader in self.readers:
+            try:
+                reader.close()
+            except Exception as ex:
+                error = error or ex
+        if error is not None:
+            raise error
+
+
+def write_shard_index(dataset_folder, class_names, shard_files_by_split):
+    with open(os.path.join(dataset_folder, SHARD_INDEX_FILE_NAME), "w") as f:
+        json.dump(
+            {
+                "format": "yolo-shards",
+                "version": SHARD_VERSION,
+                "names": class_names,
+                "splits": shard_files_by_split,
+            },
+            f,
+            indent=1,
+        )
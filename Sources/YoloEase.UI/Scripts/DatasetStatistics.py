@@ -0,0 +1,176 @@
+import json
+import numpy as np
+
+STATISTICS_FILE_NAME = "stats.json"
+SIZE_HISTOGRAM_BIN_COUNT = 20
+# images buffered by a split before their objects are aggregated at once
+AGGREGATION_IMAGE_COUNT = 1024
+
+
+class SplitStatistics:
+    """
+    Statistics of a dataset split - image counts, per-class box, mask and image counts and histograms of object sizes.
+
+    Objects of added images are buffered and aggregated in chunks by whole-array operations. Class ids are indices
+    in the class list of the dataset, sizes are normalized by the image size, so histograms have SIZE_HISTOGRAM_BIN_COUNT
+    equal bins over 0..1. Mask sizes are the sizes of bounding boxes of their polygons.
+    """
+
+    def __init__(self):
+        self.image_count = 0
+        self.empty_image_count = 0
+        self.max_object_count = 0
+        self.class_box_counts = np.zeros(0, dtype=np.int64)
+        self.class_mask_counts = np.zeros(0, dtype=np.int64)
+        self.class_image_counts = np.zeros(0, dtype=np.int64)
+        self.box_width_histogram = np.zeros(SIZE_HISTOGRAM_BIN_COUNT, dtype=np.int64)
+        self.box_height_histogram = np.zeros(SIZE_HISTOGRAM_BIN_COUNT, dtype=np.int64)
+        self.mask_width_histogram = np.zeros(SIZE_HISTOGRAM_BIN_COUNT, dtype=np.int64)
+        self.mask_height_histogram = np.zeros(SIZE_HISTOGRAM_BIN_COUNT, dtype=np.int64)
+        self._pending_images = []
+
+    def add_image(self, box_class_ids, boxes, mask_class_ids, polygons):
+        """
+        Adds an image with boxes (N x 4 array of center x, center y, width, height) and mask polygons (M x 1 x 2 arrays).
+        """
+        self._pending_images.append((box_class_ids, boxes, mask_class_ids, polygons))
+        if len(self._pending_images) >= AGGREGATION_IMAGE_COUNT:
+            self.aggregate()
+
+    def aggregate(self):
+        pending_images = self._pending_images
+        self._pending_images = []
+        if not pending_images:
+            return
+
+        box_counts = np.array([len(box_class_ids) for box_class_ids, _, _, _ in pending_images], dtype=np.int64)
+        mask_counts = np.array([len(mask_class_ids) for _, _, mask_class_ids, _ in pending_images], dtype=np.int64)
+        object_counts = box_counts + mask_counts
+        self.image_count += len(pending_images)
+        self.empty_image_count += int(np.count_nonzero(object_counts == 0))
+        self.max_object_count = max(self.max_object_count, int(object_counts.max()))
+
+        box_class_ids = np.array([class_id for image in pending_images for class_id in image[0]], dtype=np.int64)
+        mask_class_ids = np.array([class_id for image in pending_images for class_id in image[2]], dtype=np.int64)
+        boxes = np.concatenate([np.asarray(image[1], dtype=np.float64).reshape(-1, 4) for image in pending_images])
+        mask_sizes = calculate_polygon_sizes([polygon for image in pending_images for polygon in image[3]])
+
+        self.class_box_counts = add_counts(self.class_box_counts, np.bincount(box_class_ids))
+        self.class_mask_counts = add_counts(self.class_mask_counts, np.bincount(mask_class_ids))
+        image_indices = np.arange(len(pending_images))
+        class_ids = np.concatenate((box_class_ids, mask_class_ids))
+        if len(class_ids) > 0:
+            class_count = int(class_ids.max()) + 1
+            # every image is counted once per class, however many objects of the class it contains
+            image_classes = np.unique(
+                np.concatenate((np.repeat(image_indices, box_counts), np.repeat(image_indices, mask_counts))) * class_count
+                + class_ids
+            )
+            self.class_image_counts = add_counts(self.class_image_counts, np.bincount(image_classes % class_count))
+
+        self.box_width_histogram += calculate_size_histogram(boxes[:, 2])
+        self.box_height_histogram += calculate_size_histogram(boxes[:, 3])
+        self.mask_width_histogram += calculate_size_histogram(mask_sizes[:, 0])
+        self.mask_height_histogram += calculate_size_histogram(mask_sizes[:, 1])
+
+    def merge(self, other):
+        self.aggregate()
+        other.aggregate()
+        self.image_count += other.image_count
+        self.empty_image_count += other.empty_image_count
+        self.max_object_count = max(self.max_object_count, other.max_object_count)
+        self.class_box_counts = add_counts(self.class_box_counts, other.class_box_counts)
+        self.class_mask_counts = add_counts(self.class_mask_counts, other.class_mask_counts)
+        self.class_image_counts = add_counts(self.class_image_counts, other.class_image_counts)
+        self.box_width_histogram += other.box_width_histogram
+        self.box_height_histogram += other.box_height_histogram
+        self.mask_width_histogram += other.mask_width_histogram
+        self.mask_height_histogram += other.mask_height_histogram
+
+    def to_dict(self, class_names):
+        self.aggregate()
+        class_count = len(class_names)
+        class_box_counts = add_counts(np.zeros(class_count, dtype=np.int64), self.class_box_counts).tolist()
+        class_mask_counts = add_counts(np.zeros(class_count, dtype=np.int64), self.class_mask_counts).tolist()
+        class_image_counts = add_counts(np.zeros(class_count, dtype=np.int64), self.class_image_counts).tolist()
+        return {
+            "images": self.image_count,
+            "empty_images": self.empty_image_count,
+            "empty_image_ratio": self.empty_image_count / self.image_count if self.image_count > 0 else 0.0,
+            "boxes": sum(class_box_counts),
+            "masks": sum(class_mask_counts),
+            "max_objects_per_image": self.max_object_count,
+            "classes": {
+                class_name: {"boxes": class_box_counts[index], "masks": class_mask_counts[index], "images": class_image_counts[index]}
+                for index, class_name in enumerate(class_names)
+            },
+            "box_width_histogram": self.box_width_histogram.tolist(),
+            "box_height_histogram": self.box_height_histogram.tolist(),
+            "mask_width_histogram": self.mask_width_histogram.tolist(),
+            "mask_height_histogram": self.mask_height_histogram.tolist(),
+        }
+
+
+class DatasetStatistics:
+    """
+    Statistics of a dataset collected while it is being written, saved as stats.json next to data.yaml,
+    so the dataset does not have to be read again to get them.
+    """
+
+    def __init__(self):
+        self.splits = {}
+
+    def add_image(self, split_name, box_class_ids, boxes, mask_class_ids, polygons):
+        split = self.splits.get(split_name)
+        if split is None:
+            split = SplitStatistics()
+            self.splits[split_name] = split
+        split.add_image(box_class_ids, boxes, mask_class_ids, polygons)
+
+    def to_dict(self, class_names):
+        total = SplitStatistics()
+        for split in self.splits.values():
+            total.merge(split)
+        return {
+            "classes": list(class_names),
+            "size_histogram_bins": [index / SIZE_HISTOGRAM_BIN_COUNT for index in range(SIZE_HISTOGRAM_BIN_COUNT + 1)],
+            "total": total.to_dict(class_names),
+            "splits": {split_name: split.to_dict(class_names) for split_name, split in self.splits.items()},
+        }
+
+    def save(self, statistics_file, class_names):
+        """
+        Writes statistics to the file, returns them as a dict.
+        """
+        statistics = self.to_dict(class_names)
+        with open(statistics_file, "w") as f:
+            json.dump(statistics, f, indent=1)
+        return statistics
+
+
+def add_counts(counts, other_counts):
+    """
+    Adds per-class count arrays of different lengths, the result has the length of the longer one.
+    """
+    if len(other_counts) > len(counts):
+        counts, other_counts = other_counts, counts
+    counts = counts.copy()
+    counts[:len(other_counts)] += other_counts
+    return counts
+
+
+def calculate_size_histogram(sizes):
+    bins = np.clip((sizes * SIZE_HISTOGRAM_BIN_COUNT).astype(np.int64), 0, SIZE_HISTOGRAM_BIN_COUNT - 1)
+    return np.bincount(bins, minlength=SIZE_HISTOGRAM_BIN_COUNT)
+
+
+def calculate_polygon_sizes(polygons):
+    """
+    Returns N x 2 array of widths and heights of bounding boxes of polygons, all polygons are reduced at once.
+    """
+    polygons = [polygon for polygon in polygons if np.size(polygon) > 0]
+    if not polygons:
+        return np.empty((0, 2), dtype=np.float64)
+    points = np.concatenate([np.asarray(polygon, dtype=np.float64).reshape(-1, 2) for polygon in polygons])
+    starts = np.concatenate(([0], np.cumsum([np.size(polygon) // 2 for polygon in polygons])[:-1]))
+    return np.maximum.reduceat(points, starts, axis=0) - np.minimum.reduceat(points, starts, axis=0)
@@ -0,0 +1,231 @@
+import hashlib
+import json
+import logging
+import mmap
+import os
+import numpy as np
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from ArchiveFiles import get_file_size, is_member_path, open_file, read_file
+
+logger = logging.getLogger(__name__)
+
+DEDUP_MODES = ["none", "exact", "near"]
+DEDUP_KEEP_POLICIES = ["most_labels", "first"]
+DEDUP_REPORT_FILE_NAME = "dedup_report.json"
+# maximum Hamming distance between 64-bit difference hashes of near-duplicates
+DEFAULT_NEAR_DUPLICATE_DISTANCE = 4
+DHASH_SIZE = 8
+
+
+@dataclass
+class DroppedImage:
+    image_file: str
+    kept_image_file: str
+    reason: str
+    distance: int
+
+
+class DeduplicationReport:
+    def __init__(self, mode, max_distance, keep_policy, input_count):
+        self.mode = mode
+        self.max_distance = max_distance
+        self.keep_policy = keep_policy
+        self.input_count = input_count
+        self.kept_count = 0
+        self.dropped = []
+
+    def save(self, report_file):
+        with open(report_file, "w") as f:
+            json.dump(
+                {
+                    "mode": self.mode,
+                    "max_distance": self.max_distance,
+                    "keep_policy": self.keep_policy,
+                    "input_images": self.input_count,
+                    "kept_images": self.kept_count,
+                    "dropped": [asdict(dropped_image) for dropped_image in self.dropped],
+                },
+                f,
+                indent=1,
+            )
+
+    def __str__(self):
+        exact_count = sum(1 for dropped_image in self.dropped if dropped_image.reason == "exact")
+        return (
+            f"kept {self.kept_count} of {self.input_count} image(s), dropped exact duplicates: {exact_count}, "
+            f"near-duplicates: {len(self.dropped) - exact_count}"
+        )
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over 64-bit hashes with Hamming distance - a search visits only subtrees whose
+    distance to the query can be within max_distance (triangle inequality) instead of comparing with every hash.
+    """
+
+    def __init__(self):
+        self.root = None
+
+    def add(self, value, item):
+        node = (value, item, {})
+        if self.root is None:
+            self.root = node
+            return
+        current = self.root
+        while True:
+            distance = hamming_distance(value, current[0])
+            child = current[2].get(distance)
+            if child is None:
+                current[2][distance] = node
+                return
+            current = child
+
+    def find_nearest(self, value, max_distance):
+        """
+        Returns (distance, item) of the nearest hash within max_distance, the earliest added one among equally near
+        hashes, or None.
+        """
+        best = None
+        pending = [self.root] if self.root is not None else []
+        while pending:
+            node_value, node_item, children = pending.pop()
+            distance = hamming_distance(value, node_value)
+            if distance <= max_distance and (best is None or (distance, node_item) < best):
+                best = (distance, node_item)
+            for child_distance, child in children.items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    pending.append(child)
+        return best
+
+
+def hamming_distance(first, second):
+    return bin(first ^ second).count("1")
+
+
+def hash_file_content(file_path):
+    """
+    Returns BLAKE2b digest of the file, read through a memory map so the content is hashed without copying it.
+    Archive members are hashed while being decompressed.
+    """
+    if is_member_path(file_path):
+        content_hash = hashlib.blake2b()
+        with open_file(file_path) as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                content_hash.update(chunk)
+        return content_hash.hexdigest()
+    with open(file_path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return hashlib.blake2b(b"").hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file:
+            return hashlib.blake2b(mapped_file).hexdigest()
+
+
+def load_hash_thumbnail(file_path):
+    """
+    Decodes the image as grayscale (JPEGs are decoded at 1/8 scale) and shrinks it to (DHASH_SIZE + 1) x DHASH_SIZE.
+    Returns None if the image can not be decoded.
+    """
+    import cv2
+
+    content = np.frombuffer(read_file(file_path), dtype=np.uint8)
+    image = cv2.imdecode(content, cv2.IMREAD_REDUCED_GRAYSCALE_8) if len(content) > 0 else None
+    if image is None:
+        return None
+    return cv2.resize(image, (DHASH_SIZE + 1, DHASH_SIZE), interpolation=cv2.INTER_AREA)
+
+
+def compute_difference_hashes(image_files, thread_count):
+    """
+    Computes 64-bit difference hashes (dHash) of images, None for images that can not be decoded.
+
+    Images are decoded on a thread pool (OpenCV releases the GIL), bits of all thumbnails are then computed at once -
+    a bit is set where a pixel is brighter than its left neighbour.
+    """
+    with ThreadPoolExecutor(max_workers=thread_count) as executor:
+        thumbnails = list(executor.map(load_hash_thumbnail, image_files))
+
+    decoded_indices = [index for index, thumbnail in enumerate(thumbnails) if thumbnail is not None]
+    hashes = [None] * len(image_files)
+    if decoded_indices:
+        stacked = np.stack([thumbnails[index] for index in decoded_indices]).astype(np.int16)
+        bits = (stacked[:, :, 1:] > stacked[:, :, :-1]).reshape(len(decoded_indices), -1)
+        packed = np.packbits(bits, axis=1).view(">u8").ravel()
+        for index, value in zip(decoded_indices, packed.tolist()):
+            hashes[index] = value
+    return hashes
+
+
+def find_exact_duplicates(image_files, thread_count):
+    """
+    Returns content keys of the files - files with equal keys are byte-identical. Only files sharing
+    their size with another file are hashed, files with a unique size are their own key.
+    """
+    sizes = [get_file_size(image_file) for image_file in image_files]
+    indices_by_size = defaultdict(list)
+    for index, size in enumerate(sizes):
+        indices_by_size[size].append(index)
+
+    keys = [("index", index) for index in range(len(image_files))]
+    hashed_indices = [index for indices in indices_by_size.values() if len(indices) > 1 for index in indices]
+    with ThreadPoolExecutor(max_workers=thread_count) as executor:
+        digests = executor.map(hash_file_content, [image_files[index] for index in hashed_indices])
+        for index, digest in zip(hashed_indices, digests):
+            keys[index] = ("content", sizes[index], digest)
+    return keys
+
+
+def deduplicate_images(
+        image_files,
+        label_counts,
+        mode,
+        max_distance=DEFAULT_NEAR_DUPLICATE_DISTANCE,
+        keep_policy="most_labels",
+        thread_count=8,
+):
+    """
+    Finds duplicate images, returns (indices of kept images in input order, DeduplicationReport).
+
+    Mode "exact" drops byte-identical files, mode "near" additionally drops images whose difference hashes are within
+    max_distance bits of an already kept image. Images are visited in the order of the keep policy - "most_labels"
+    prefers the copy with the most annotations (the earliest one on ties), "first" keeps the earliest copy -
+    and each one is either kept or dropped as a duplicate of the kept image it matches.
+    """
+    report = DeduplicationReport(mode, max_distance, keep_policy, len(image_files))
+    if keep_policy == "most_labels":
+        visit_order = sorted(range(len(image_files)), key=lambda index: (-label_counts[index], index))
+    else:
+        visit_order = list(range(len(image_files)))
+
+    content_keys = find_exact_duplicates(image_files, thread_count)
+    kept_by_content = {}
+    exact_kept = []
+    for index in visit_order:
+        kept_index = kept_by_content.setdefault(content_keys[index], index)
+        if kept_index == index:
+            exact_kept.append(index)
+        else:
+            report.dropped.append(DroppedImage(image_files[index], image_files[kept_index], "exact", 0))
+
+    kept_indices = exact_kept
+    if mode == "near":
+        hashes = compute_difference_hashes([image_files[index] for index in exact_kept], thread_count)
+        tree = BKTree()
+        kept_indices = []
+        for order, (index, image_hash) in enumerate(zip(exact_kept, hashes)):
+            if image_hash is None:
+                logger.warning(f"Failed to decode {image_files[index]}, it is kept without near-duplicate check")
+                kept_indices.append(index)
+                continue
+            nearest = tree.find_nearest(image_hash, max_distance)
+            if nearest is None:
+                tree.add(image_hash, order)
+                kept_indices.append(index)
+            else:
+                distance, kept_order = nearest
+                report.dropped.append(DroppedImage(image_files[index], image_files[exact_kept[kept_order]], "near", distance))
+
+    kept_indices.sort()
+    report.kept_count = len(kept_indices)
+    return kept_indices, report
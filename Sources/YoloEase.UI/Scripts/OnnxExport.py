@@ -0,0 +1,432 @@
+import os
+import argparse
+import json
+import math
+import time
+
+# numpy, onnx, onnxruntime and cv2 are imported by the functions that use them, so the training pipeline can add
+# export options without loading them, see Benchmarks/import_time_benchmark.py
+
+QUANTIZATION_MODES = ["none", "dynamic", "static", "all"]
+DEFAULT_BENCHMARK_BATCH_SIZES = [1, 8, 32]
+DEFAULT_BENCHMARK_THREAD_COUNTS = [1, 4]
+DEFAULT_BENCHMARK_RUN_COUNT = 50
+BENCHMARK_WARMUP_RUN_COUNT = 5
+DEFAULT_CALIBRATION_IMAGE_COUNT = 100
+DEFAULT_MAX_ACCURACY_DROP = 0.01
+EVALUATION_BATCH_SIZE = 32
+EXPORT_REPORT_FILE_NAME = "export_report.json"
+VALIDATION_SPLIT_NAME = "val"
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Optimizes and quantizes an ONNX classifier and benchmarks its variants with onnxruntime on CPU"
+    )
+    parser.add_argument("--model", required=True, help="Path to the FP32 ONNX model")
+    parser.add_argument("--dataset", help="Path to the classification dataset, its val split is used for calibration and accuracy")
+    parser.add_argument("--imageSize", type=int, required=True, help="Input image size of the model")
+    add_export_arguments(parser)
+    parser.add_argument("--benchmarkRuns", type=int, default=DEFAULT_BENCHMARK_RUN_COUNT, help="Measured runs per configuration")
+    args = parser.parse_args()
+    options = create_export_options(args)
+    options.benchmark = True
+    options.benchmark_run_count = args.benchmarkRuns
+    run_export_stage(args.model, args.dataset, args.imageSize, options)
+
+
+def add_export_arguments(parser):
+    """
+    Adds options of the export stage to an argument parser, see create_export_options.
+    """
+    parser.add_argument(
+        "--optimize",
+        help="Save a copy of the ONNX model with onnxruntime graph optimizations applied",
+        action="store_true"
+    )
+    parser.add_argument(
+        "--quantize",
+        choices=QUANTIZATION_MODES,
+        default="none",
+        help="Save INT8 copies of the ONNX model - dynamic quantization, static quantization calibrated "
+             "on images of the val split, or both",
+    )
+    parser.add_argument(
+        "--benchmark",
+        help="Benchmark the FP32 model and its optimized and quantized copies with onnxruntime on CPU",
+        action="store_true"
+    )
+    parser.add_argument(
+        "--benchmarkBatchSizes",
+        type=int,
+        nargs="+",
+        default=DEFAULT_BENCHMARK_BATCH_SIZES,
+        help="Batch sizes to benchmark",
+    )
+    parser.add_argument(
+        "--benchmarkThreads",
+        type=int,
+        nargs="+",
+        default=DEFAULT_BENCHMARK_THREAD_COUNTS,
+        help="Numbers of onnxruntime intra-op threads to benchmark",
+    )
+    parser.add_argument(
+        "--calibrationImages",
+        type=int,
+        default=DEFAULT_CALIBRATION_IMAGE_COUNT,
+        help="Maximum number of val images used to calibrate static quantization",
+    )
+    parser.add_argument(
+        "--maxAccuracyDrop",
+        type=float,
+        default=DEFAULT_MAX_ACCURACY_DROP,
+        help="Largest drop of top-1 accuracy against the FP32 model a recommended model may have",
+    )
+
+
+def create_export_options(args):
+    return ExportOptions(
+        optimize=args.optimize,
+        quantize=args.quantize,
+        benchmark=args.benchmark,
+        batch_sizes=args.benchmarkBatchSizes,
+        thread_counts=args.benchmarkThreads,
+        calibration_image_count=args.calibrationImages,
+        max_accuracy_drop=args.maxAccuracyDrop,
+    )
+
+
+def run_export_stage(model_path, dataset_folder, image_size, options):
+    """
+    Builds variants of an exported FP32 classifier next to it as requested by options - a graph-optimized model and
+    dynamically and statically INT8-quantized models - and measures them: top-1 accuracy on the val split of the
+    dataset and, if benchmarking is enabled, CPU latency and throughput with onnxruntime. Recommends the fastest
+    variant whose accuracy is at most max_accuracy_drop below the FP32 model. Writes export_report.json next to
+    the model and returns the report.
+    """
+    model_folder = os.path.dirname(os.path.abspath(model_path))
+    model_stem = os.path.splitext(os.path.basename(model_path))[0]
+    class_names = get_class_names(model_path, dataset_folder)
+    images, labels = load_validation_images(dataset_folder, class_names, image_size) if dataset_folder else (None, None)
+    if images is not None and len(images) == 0:
+        print(f"No val images in {dataset_folder}, accuracy is not measured")
+        images, labels = None, None
+
+    variants = {"fp32": model_path}
+    if options.optimize:
+        variants["fp32-optimized"] = optimize_onnx_model(model_path, os.path.join(model_folder, f"{model_stem}-optimized.onnx"))
+    if options.quantize in ("dynamic", "all"):
+        variants["int8-dynamic"] = quantize_onnx_model_dynamic(model_path, os.path.join(model_folder, f"{model_stem}-int8-dynamic.onnx"))
+    if options.quantize in ("static", "all"):
+        if images is None:
+            print("Static quantization needs val images for calibration, skipping it")
+        else:
+            # images are sorted by class, a strided sample keeps every class in the calibration set
+            calibration_step = max(1, len(images) // options.calibration_image_count)
+            variants["int8-static"] = quantize_onnx_model_static(
+                model_path,
+                os.path.join(model_folder, f"{model_stem}-int8-static.onnx"),
+                images[::calibration_step][:options.calibration_image_count],
+            )
+
+    report = {"options": vars(options), "image_size": image_size, "variants": {}}
+    for variant_name, variant_path in variants.items():
+        variant = {"model": os.path.abspath(variant_path), "size_bytes": os.path.getsize(variant_path)}
+        if images is not None:
+            variant["top1_accuracy"] = evaluate_top1_accuracy(variant_path, images, labels)
+        if options.benchmark:
+            variant["load_ms"], variant["benchmarks"] = benchmark_model(
+                variant_path, image_size, options.batch_sizes, options.thread_counts, options.benchmark_run_count
+            )
+        report["variants"][variant_name] = variant
+
+    fp32_accuracy = report["variants"]["fp32"].get("top1_accuracy")
+    if fp32_accuracy is not None:
+        for variant in report["variants"].values():
+            variant["top1_accuracy_delta"] = variant["top1_accuracy"] - fp32_accuracy
+    report["recommended"] = select_fastest_variant(report["variants"], options.max_accuracy_drop) if options.benchmark else None
+
+    report_file = os.path.join(model_folder, EXPORT_REPORT_FILE_NAME)
+    with open(report_file, "w") as f:
+        json.dump(report, f, indent=1)
+    print_report(report)
+    print(f"Export report saved to {report_file}")
+    return report
+
+
+def optimize_onnx_model(model_path, optimized_model_path):
+    """
+    Saves the model with extended onnxruntime graph optimizations (constant folding, node fusions) applied,
+    so they are not repeated whenever the model is loaded.
+    """
+    import onnxruntime
+
+    session_options = onnxruntime.SessionOptions()
+    session_options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_EXTENDED
+    session_options.optimized_model_filepath = optimized_model_path
+    onnxruntime.InferenceSession(model_path, session_options, providers=["CPUExecutionProvider"])
+    print(f"Saved graph-optimized model to {optimized_model_path}")
+    return optimized_model_path
+
+
+def quantize_onnx_model_dynamic(model_path, quantized_model_path):
+    """
+    Quantizes weights to INT8 ahead of time, activations are quantized at run time - needs no calibration data.
+    Weights are unsigned, as CPU convolutions of dynamically quantized models support only those.
+    """
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(model_path, quantized_model_path, weight_type=QuantType.QUInt8)
+    print(f"Saved dynamically quantized model to {quantized_model_path}")
+    return quantized_model_path
+
+
+def quantize_onnx_model_static(model_path, quantized_model_path, calibration_images):
+    """
+    Quantizes weights (per channel) and activations to INT8 ahead of time in QDQ format, activation ranges
+    are calibrated on the images (N x 3 x H x W float32 array).
+    """
+    from onnxruntime.quantization import QuantFormat, QuantType, quantize_static
+
+    quantize_static(
+        model_path,
+        quantized_model_path,
+        ImageCalibrationDataReader(get_input_name(model_path), calibration_images),
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        per_channel=True,
+    )
+    print(f"Saved statically quantized model to {quantized_model_path}, calibrated on {len(calibration_images)} image(s)")
+    return quantized_model_path
+
+
+class ImageCalibrationDataReader:
+    """
+    Feeds calibration images to onnxruntime static quantization one at a time (CalibrationDataReader protocol).
+    """
+
+    def __init__(self, input_name, images):
+        self.input_name = input_name
+        self.images = images
+        self._index = 0
+
+    def get_next(self):
+        if self._index >= len(self.images):
+            return None
+        image = self.images[self._index:self._index + 1]
+        self._index += 1
+        return {self.input_name: image}
+
+    def rewind(self):
+        self._index = 0
+
+
+def create_session(model_path, thread_count=0):
+    import onnxruntime
+
+    session_options = onnxruntime.SessionOptions()
+    session_options.intra_op_num_threads = thread_count
+    session_options.inter_op_num_threads = 1
+    return onnxruntime.InferenceSession(model_path, session_options, providers=["CPUExecutionProvider"])
+
+
+def get_input_name(model_path):
+    return create_session(model_path, 1).get_inputs()[0].name
+
+
+def evaluate_top1_accuracy(model_path, images, labels):
+    import numpy as np
+
+    session = create_session(model_path)
+    input_name = session.get_inputs()[0].name
+    batch_size = EVALUATION_BATCH_SIZE if is_batch_dynamic(session) else 1
+    predictions = []
+    for start in range(0, len(images), batch_size):
+        outputs = session.run(None, {input_name: images[start:start + batch_size]})[0]
+        predictions.append(np.argmax(outputs.reshape(len(outputs), -1), axis=1))
+    return float(np.mean(np.concatenate(predictions) == labels))
+
+
+def is_batch_dynamic(session):
+    return not isinstance(session.get_inputs()[0].shape[0], int)
+
+
+def benchmark_model(model_path, image_size, batch_sizes, thread_counts, run_count=DEFAULT_BENCHMARK_RUN_COUNT):
+    """
+    Measures latency of the model on random inputs for every combination of batch size and thread count,
+    returns (session load time in ms, results). Batch sizes other than 1 are skipped for models exported
+    with a fixed batch size.
+    """
+    import numpy as np
+
+    rng = np.random.default_rng(0)
+    results = []
+    load_ms = None
+    for thread_count in thread_counts:
+        started_at = time.perf_counter()
+        session = create_session(model_path, thread_count)
+        session_load_ms = (time.perf_counter() - started_at) * 1000
+        load_ms = session_load_ms if load_ms is None else min(load_ms, session_load_ms)
+        input_name = session.get_inputs()[0].name
+        for batch_size in batch_sizes:
+            if batch_size != 1 and not is_batch_dynamic(session):
+                print(f"Skipping batch size {batch_size} of {model_path}, the model has a fixed batch size")
+                continue
+            inputs = {input_name: rng.random((batch_size, 3, image_size, image_size), dtype=np.float32)}
+            for _ in range(BENCHMARK_WARMUP_RUN_COUNT):
+                session.run(None, inputs)
+            latencies = np.empty(run_count)
+            for run in range(run_count):
+                run_started_at = time.perf_counter()
+                session.run(None, inputs)
+                latencies[run] = time.perf_counter() - run_started_at
+            results.append({
+                "batch_size": batch_size,
+                "threads": thread_count,
+                "p50_ms": float(np.percentile(latencies, 50) * 1000),
+                "p99_ms": float(np.percentile(latencies, 99) * 1000),
+                "images_per_second": float(batch_size * run_count / latencies.sum()),
+            })
+    return load_ms, results
+
+
+def select_fastest_variant(variants, max_accuracy_drop):
+    """
+    Returns the name of the variant with the highest throughput (geometric mean over benchmarked configurations)
+    among those whose top-1 accuracy is at most max_accuracy_drop below FP32. Without accuracy measurements
+    only FP32 variants are considered.
+    """
+    best_name = None
+    best_throughput = 0.0
+    for variant_name, variant in variants.items():
+        accuracy_delta = variant.get("top1_accuracy_delta")
+        if accuracy_delta is None and not variant_name.startswith("fp32"):
+            continue
+        if accuracy_delta is not None and accuracy_delta < -max_accuracy_drop:
+            continue
+        throughputs = [benchmark["images_per_second"] for benchmark in variant.get("benchmarks", [])]
+        if not throughputs:
+            continue
+        throughput = math.exp(sum(math.log(value) for value in throughputs) / len(throughputs))
+        if throughput > best_throughput:
+            best_name, best_throughput = variant_name, throughput
+    return best_name
+
+
+def get_class_names(model_path, dataset_folder):
+    """
+    Returns class names in the order of model outputs - from the names stored in the model metadata by ultralytics,
+    or sorted folder names of the train split (the order YOLO classification assigns class indices in).
+    """
+    import ast
+    import onnx
+
+    metadata = {prop.key: prop.value for prop in onnx.load(model_path, load_external_data=False).metadata_props}
+    if "names" in metadata:
+        names = ast.literal_eval(metadata["names"])
+        return [names[index] for index in sorted(names)]
+    if dataset_folder is None:
+        return []
+    train_folder = os.path.join(dataset_folder, "train")
+    return sorted(name for name in os.listdir(train_folder) if os.path.isdir(os.path.join(train_folder, name)))
+
+
+def load_validation_images(dataset_folder, class_names, image_size):
+    """
+    Loads images of the val split of a classification dataset (<val>/<class>/<image>), preprocessed as YOLO
+    classification does it, returns (N x 3 x size x size float32 array, class indices). Classes unknown
+    to the model are left out.
+    """
+    import numpy as np
+
+    validation_folder = os.path.join(dataset_folder, VALIDATION_SPLIT_NAME)
+    class_indices = {class_name: index for index, class_name in enumerate(class_names)}
+    images = []
+    labels = []
+    if os.path.isdir(validation_folder):
+        for class_name in sorted(os.listdir(validation_folder)):
+            class_folder = os.path.join(validation_folder, class_name)
+            if class_name not in class_indices or not os.path.isdir(class_folder):
+                continue
+            for image_name in sorted(os.listdir(class_folder)):
+                if not image_name.lower().endswith(IMAGE_EXTENSIONS):
+                    continue
+                image = preprocess_image(os.path.join(class_folder, image_name), image_size)
+                if image is not None:
+                    images.append(image)
+                    labels.append(class_indices[class_name])
+    if not images:
+        return np.empty((0, 3, image_size, image_size), dtype=np.float32), np.empty(0, dtype=np.int64)
+    return np.stack(images), np.array(labels, dtype=np.int64)
+
+
+def preprocess_image(image_file, image_size):
+    """
+    Resizes the shorter side of the image to image_size, crops the center square and converts it to a 3 x size x size
+    RGB float32 array with values in 0..1, the input YOLO classification models expect. Returns None if the image
+    can not be decoded.
+    """
+    import cv2
+    import numpy as np
+
+    image = cv2.imdecode(np.fromfile(image_file, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        return None
+    height, width = image.shape[:2]
+    scale = image_size / min(width, height)
+    resized_width = max(image_size, round(width * scale))
+    resized_height = max(image_size, round(height * scale))
+    image = cv2.resize(
+        image, (resized_width, resized_height), interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+    )
+    top = (resized_height - image_size) // 2
+    left = (resized_width - image_size) // 2
+    image = image[top:top + image_size, left:left + image_size]
+    return np.ascontiguousarray(image[:, :, ::-1].transpose(2, 0, 1), dtype=np.float32) / 255.0
+
+
+def print_report(report):
+    for variant_name, variant in report["variants"].items():
+        accuracy = ""
+        if "top1_accuracy" in variant:
+            accuracy = f", top-1: {variant['top1_accuracy']:.4f} ({variant['top1_accuracy_delta']:+.4f})"
+        print(f"{variant_name}: {variant['size_bytes'] / (1024 * 1024):.2f} MB{accuracy}")
+        for benchmark in variant.get("benchmarks", []):
+            print(
+                f"    batch {benchmark['batch_size']:>3}, threads {benchmark['threads']:>2}: "
+                f"p50 {benchmark['p50_ms']:.2f} ms, p99 {benchmark['p99_ms']:.2f} ms, "
+                f"{benchmark['images_per_second']:.1f} images/s"
+            )
+    if report["recommended"] is not None:
+        print(f"Recommended model: {report['recommended']} ({report['variants'][report['recommended']]['model']})")
+
+
+class ExportOptions:
+    def __init__(self, optimize=False, quantize="none", benchmark=False, batch_sizes=None, thread_counts=None,
+                 calibration_image_count=DEFAULT_CALIBRATION_IMAGE_COUNT, max_accuracy_drop=DEFAULT_MAX_ACCURACY_DROP,
+                 benchmark_run_count=DEFAULT_BENCHMARK_RUN_COUNT):
+        self.optimize = optimize
+        self.quantize = quantize
+        self.benchmark = benchmark
+        self.batch_sizes = batch_sizes or DEFAULT_BENCHMARK_BATCH_SIZES
+        self.thread_counts = thread_counts or DEFAULT_BENCHMARK_THREAD_COUNTS
+        self.calibration_image_count = calibration_image_count
+        self.max_accuracy_drop = max_accuracy_drop
+        self.benchmark_run_count = benchmark_run_count
+
+    @property
+    def is_enabled(self):
+        return self.optimize or self.quantize != "none" or self.benchmark
+
+    def __repr__(self):
+        return (
+            f"optimize={self.optimize}, quantize={self.quantize}, benchmark={self.benchmark}, "
+            f"batch_sizes={self.batch_sizes}, thread_counts={self.thread_counts}, "
+            f"calibration_image_count={self.calibration_image_count}, max_accuracy_drop={self.max_accuracy_drop}"
+        )
+
+
+if __name__ == "__main__":
+    main()
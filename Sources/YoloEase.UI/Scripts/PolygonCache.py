@@ -0,0 +1,135 @@
+import os
+import sqlite3
+import struct
+import time
+import numpy as np
+
+DEFAULT_MAX_CACHE_SIZE = 512 * 1024 * 1024
+# eviction frees space down to this fraction of the maximum size, so it does not run on every insert
+EVICTION_TARGET_RATIO = 0.9
+# polygon count, has stats, vertices before, vertices after, IoU
+VALUE_HEADER = struct.Struct("<IIIId")
+MAX_QUERY_PARAMETERS = 500
+
+
+class PolygonCache:
+    """
+    Size-bounded on-disk cache of polygons traced from masks, stored in a SQLite file.
+
+    Values are polygons (N x 1 x 2 int32 arrays) with optional simplification stats (vertices before, vertices after,
+    IoU) packed into a compact binary blob: a fixed header, polygon lengths as uint32 and all points as int32.
+    Every hit refreshes the last use time of the entry, least recently used entries are evicted once the total
+    size of values exceeds max_size. Only the process that opened the cache may use it.
+    """
+
+    def __init__(self, cache_file, max_size=DEFAULT_MAX_CACHE_SIZE):
+        self.cache_file = cache_file
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        cache_folder = os.path.dirname(os.path.abspath(cache_file))
+        os.makedirs(cache_folder, exist_ok=True)
+        self._connection = sqlite3.connect(cache_file)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS polygons (key BLOB PRIMARY KEY, value BLOB NOT NULL, "
+            "size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS polygons_last_used ON polygons (last_used)")
+        self._connection.commit()
+        self.total_size = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM polygons").fetchone()[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def get_many(self, keys):
+        """
+        Returns {key: (polygons, stats)} of the cached keys, stats is None if it was not stored.
+        """
+        found = {}
+        unique_keys = list(dict.fromkeys(keys))
+        for start in range(0, len(unique_keys), MAX_QUERY_PARAMETERS):
+            chunk = unique_keys[start:start + MAX_QUERY_PARAMETERS]
+            rows = self._connection.execute(
+                f"SELECT key, value FROM polygons WHERE key IN ({', '.join('?' * len(chunk))})", chunk
+            )
+            for key, value in rows:
+                found[key] = decode_polygons(value)
+        if found:
+            now = time.time()
+            self._connection.executemany("UPDATE polygons SET last_used = ? WHERE key = ?", [(now, key) for key in found])
+            self._connection.commit()
+        self.hits += sum(1 for key in keys if key in found)
+        self.misses += sum(1 for key in keys if key not in found)
+        return found
+
+    def put_many(self, entries):
+        """
+        Stores (key, polygons, stats) entries, evicting least recently used entries if the cache grows over max_size.
+        """
+        now = time.time()
+        rows = []
+        for key, polygons, stats in entries:
+            value = encode_polygons(polygons, stats)
+            rows.append((key, value, len(value), now))
+        cursor = self._connection.executemany(
+            "INSERT OR IGNORE INTO polygons (key, value, size, last_used) VALUES (?, ?, ?, ?)", rows
+        )
+        if cursor.rowcount == len(rows):
+            self.total_size += sum(row[2] for row in rows)
+        else:
+            self.total_size = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM polygons").fetchone()[0]
+        if self.total_size > self.max_size:
+            self._evict()
+        self._connection.commit()
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def _evict(self):
+        target_size = self.max_size * EVICTION_TARGET_RATIO
+        evicted_keys = []
+        for key, size in self._connection.execute("SELECT key, size FROM polygons ORDER BY last_used"):
+            if self.total_size <= target_size:
+                break
+            evicted_keys.append((key,))
+            self.total_size -= size
+        self._connection.executemany("DELETE FROM polygons WHERE key = ?", evicted_keys)
+        self.evictions += len(evicted_keys)
+
+    def __str__(self):
+        lookups = self.hits + self.misses
+        hit_rate = self.hits / lookups * 100 if lookups > 0 else 0.0
+        return (
+            f"hits: {self.hits}, misses: {self.misses} ({hit_rate:.1f}% hit rate), evicted: {self.evictions}, "
+            f"size: {self.total_size / (1024 * 1024):.1f} of {self.max_size / (1024 * 1024):.0f} MB"
+        )
+
+
+def encode_polygons(polygons, stats=None):
+    lengths = np.array([len(polygon) for polygon in polygons], dtype="<u4")
+    points = np.concatenate([np.asarray(polygon, dtype="<i4").ravel() for polygon in polygons]) if polygons \
+        else np.empty(0, dtype="<i4")
+    vertices_before, vertices_after, iou = stats if stats is not None else (0, 0, 0.0)
+    header = VALUE_HEADER.pack(len(polygons), stats is not None, vertices_before, vertices_after, iou)
+    return header + lengths.tobytes() + points.astype("<i4").tobytes()
+
+
+def decode_polygons(value):
+    polygon_count, has_stats, vertices_before, vertices_after, iou = VALUE_HEADER.unpack_from(value, 0)
+    lengths = np.frombuffer(value, dtype="<u4", count=polygon_count, offset=VALUE_HEADER.size)
+    points = np.frombuffer(value, dtype="<i4", offset=VALUE_HEADER.size + lengths.nbytes)
+    polygons = []
+    start = 0
+    for length in lengths.tolist():
+        polygons.append(points[start:start + length * 2].astype(np.int32).reshape(-1, 1, 2))
+        start += length * 2
+    return polygons, (vertices_before, vertices_after, iou) if has_stats else None
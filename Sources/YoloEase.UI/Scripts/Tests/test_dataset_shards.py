@@ -0,0 +1,60 @@
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from DatasetShards import ShardedDataset, ShardWriter, write_shard_index
+
+CLASS_NAMES = ["car", "person", "sign"]
+
+
+def write_split(dataset_folder, split, record_count, seed):
+    """
+    Writes random records of a split to shards small enough for every split to span several of them,
+    returns [(name, image bytes, [(class index, values)])] of the written records.
+    """
+    rng = np.random.default_rng(seed)
+    records = []
+    with ShardWriter(dataset_folder, split, max_shard_size=4096) as writer:
+        for index in range(record_count):
+            image_bytes = rng.integers(0, 256, int(rng.integers(100, 1000)), dtype=np.uint8).tobytes()
+            labels = [
+                (int(rng.integers(0, len(CLASS_NAMES))), rng.random(int(rng.choice([4, 8, 12]))).astype(np.float32))
+                for _ in range(int(rng.integers(0, 4)))
+            ]
+            writer.add(f"{split}_{index:04d}.png", image_bytes, labels)
+            records.append((f"{split}_{index:04d}.png", image_bytes, labels))
+    return writer.shard_files, records
+
+
+def test_round_trip_with_records_alive_after_close(tmp_path):
+    dataset_folder = str(tmp_path)
+    shard_files_by_split = {}
+    expected_records = {}
+    for split, record_count, seed in (("train", 60, 0), ("val", 20, 1)):
+        shard_files_by_split[split], expected_records[split] = write_split(dataset_folder, split, record_count, seed)
+    write_shard_index(dataset_folder, CLASS_NAMES, shard_files_by_split)
+
+    for split, expected in expected_records.items():
+        read_records = []
+        with ShardedDataset(dataset_folder, split) as dataset:
+            assert dataset.class_names == CLASS_NAMES
+            assert len(dataset.readers) > 1
+            assert len(dataset) == len(expected)
+            # the loop variable keeps views of the last record alive while the dataset is closed
+            for record in dataset:
+                read_records.append((record.name, bytes(record.image), record.class_indices.tolist(),
+                                     [label.copy() for label in record.labels]))
+        assert all(reader._mmap is None for reader in dataset.readers)
+        assert bytes(record.image) == expected[-1][1]
+
+        assert len(read_records) == len(expected)
+        for (name, image_bytes, class_indices, labels), (expected_name, expected_bytes, expected_labels) in zip(
+                read_records, expected):
+            assert name == expected_name
+            assert image_bytes == expected_bytes
+            assert class_indices == [class_index for class_index, _ in expected_labels]
+            assert len(labels) == len(expected_labels)
+            for values, (_, expected_values) in zip(labels, expected_labels):
+                np.testing.assert_array_equal(values, expected_values)
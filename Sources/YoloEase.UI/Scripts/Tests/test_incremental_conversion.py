@@ -0,0 +1,78 @@
+import filecmp
+import os
+import sys
+import xml.etree.ElementTree as ET
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Benchmarks"))
+
+from ConvertCVATtoYolo8 import ConversionManifest, convert
+from generate_cvat_dataset import generate_dataset
+
+MANIFEST_FILES = [ConversionManifest.FILE_NAME, ConversionManifest.CACHE_FOLDER_NAME]
+
+
+def list_files(folder):
+    files = set()
+    for root, folders, file_names in os.walk(folder):
+        folders[:] = [name for name in folders if name not in MANIFEST_FILES]
+        files.update(os.path.relpath(os.path.join(root, name), folder) for name in file_names if name not in MANIFEST_FILES)
+    return files
+
+
+def assert_same_output(expected_folder, actual_folder):
+    expected_files = list_files(expected_folder)
+    assert list_files(actual_folder) == expected_files
+    _, mismatches, errors = filecmp.cmpfiles(expected_folder, actual_folder, sorted(expected_files), shallow=False)
+    assert not mismatches and not errors
+
+
+def edit_annotations(annotations_file, edit):
+    tree = ET.parse(annotations_file)
+    edit(tree.getroot())
+    tree.write(annotations_file)
+
+
+def move_first_box(root):
+    box_elem = root.find("image").find("box")
+    box_elem.attrib["xtl"] = str(float(box_elem.attrib["xtl"]) + 3)
+
+
+def remove_images(root):
+    for image_elem in root.findall("image")[5:10]:
+        root.remove(image_elem)
+
+
+def test_incremental_conversion_converts_only_edited_images(tmp_path, caplog):
+    annotations_file = generate_dataset(str(tmp_path / "data"), 30, masks_per_image=1, tags_per_image=1)
+    incremental_folder = str(tmp_path / "incremental")
+    full_folder = str(tmp_path / "full")
+    options = {"train_val_percentage": 75}
+    convert([annotations_file], incremental_folder, dict(options, incremental=True))
+
+    for edit, converted_count in ((move_first_box, 1), (remove_images, 0)):
+        edit_annotations(annotations_file, edit)
+        caplog.clear()
+        with caplog.at_level("INFO"):
+            convert([annotations_file], incremental_folder, dict(options, incremental=True))
+        assert f"converted {converted_count}, reused" in caplog.text
+        convert([annotations_file], full_folder, options)
+        assert_same_output(full_folder, incremental_folder)
+
+
+def test_incremental_crops_match_full_conversion(tmp_path, caplog):
+    annotations_file = generate_dataset(str(tmp_path / "data"), 30, masks_per_image=0, tags_per_image=0)
+    incremental_folder = str(tmp_path / "incremental")
+    full_folder = str(tmp_path / "full")
+    options = {"train_val_percentage": 75, "tasks": ["detect", "crops"]}
+    convert([annotations_file], incremental_folder, dict(options, incremental=True))
+
+    for edit in (remove_images, move_first_box):
+        edit_annotations(annotations_file, edit)
+        caplog.clear()
+        with caplog.at_level("INFO"):
+            convert([annotations_file], incremental_folder, dict(options, incremental=True))
+        convert([annotations_file], full_folder, options)
+        assert_same_output(full_folder, incremental_folder)
+        # crops of the images that were not edited are not cut again
+        assert "crop(s) of crop_size" in caplog.text and ", 0 up to date" not in caplog.text
@@ -0,0 +1,56 @@
+import os
+import sys
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ConvertCVATtoYolo8 import CvatMaskConverter
+
+
+def count_edge_crossings(polygon):
+    """
+    Counts pairs of non-adjacent edges of the closed polygon that properly cross each other.
+    """
+    points = polygon.reshape(-1, 2).astype(np.int64)
+    edge_count = len(points) - 1
+
+    def side(first, second, point):
+        return np.sign((second[0] - first[0]) * (point[1] - first[1]) - (second[1] - first[1]) * (point[0] - first[0]))
+
+    crossings = 0
+    for i in range(edge_count):
+        a, b = points[i], points[i + 1]
+        for j in range(i + 2, edge_count):
+            if i == 0 and j == edge_count - 1:
+                continue
+            c, d = points[j], points[j + 1]
+            if side(a, b, c) * side(a, b, d) < 0 and side(c, d, a) * side(c, d, b) < 0:
+                crossings += 1
+    return crossings
+
+
+def assert_exact_polygons(mask):
+    polygons = CvatMaskConverter.mask_to_polygons(mask)
+    assert len(polygons) == 1
+    assert count_edge_crossings(polygons[0]) == 0
+    assert CvatMaskConverter.calculate_iou(mask, polygons) == 1.0
+
+
+def test_bridges_do_not_cross_other_holes():
+    # the seam of the smaller hole to the nearest outer vertex would run through the larger one
+    mask = np.full((200, 200), 255, dtype=np.uint8)
+    mask[35:76, 30:51] = 0
+    mask[98:103, 70:81] = 0
+    assert_exact_polygons(mask)
+
+
+def test_many_holes():
+    rng = np.random.default_rng(1)
+    mask = np.zeros((160, 160), dtype=np.uint8)
+    cv2.circle(mask, (80, 80), 70, 255, -1)
+    for _ in range(8):
+        x, y = rng.integers(30, 120, 2)
+        width, height = rng.integers(3, 15, 2)
+        cv2.rectangle(mask, (int(x), int(y)), (int(x + width), int(y + height)), 0, -1)
+    assert_exact_polygons(mask)
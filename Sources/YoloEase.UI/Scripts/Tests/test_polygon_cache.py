@@ -0,0 +1,41 @@
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Benchmarks"))
+
+import ConvertCVATtoYolo8 as converter
+from PolygonCache import PolygonCache
+from generate_cvat_dataset import mask_to_rle
+
+
+def create_mask(left, top, size):
+    mask = np.zeros((48, 48), dtype=np.uint8)
+    mask[8:8 + size, 8:40] = 255
+    return converter.Mask("stamp", "manual", 0, mask_to_rle(mask), left, top, 48, 48, 0)
+
+
+def test_identical_masks_are_traced_and_cached_once(tmp_path, monkeypatch):
+    traced_rles = []
+    trace_mask_polygons = converter.trace_mask_polygons
+
+    def counting_trace_mask_polygons(rle, *args):
+        traced_rles.append(rle)
+        return trace_mask_polygons(rle, *args)
+
+    monkeypatch.setattr(converter, "trace_mask_polygons", counting_trace_mask_polygons)
+    masks = [create_mask(index, index, 20) for index in range(40)] + [create_mask(0, 0, 10)]
+    with PolygonCache(str(tmp_path / "polygons.sqlite")) as polygon_cache:
+        mask_options = converter.MaskConversionOptions(polygon_cache=polygon_cache)
+        results = converter.trace_batch_mask_polygons(masks, None, mask_options)
+        assert len(traced_rles) == 2
+        assert (polygon_cache.hits, polygon_cache.misses) == (0, 2)
+        assert len(results) == len(masks)
+        for polygons, _, _ in results[1:40]:
+            assert all(np.array_equal(polygon, expected) for polygon, expected in zip(polygons, results[0][0]))
+        assert [index for index, (_, _, stage_timings) in enumerate(results) if stage_timings] == [0, 40]
+
+        assert len(converter.trace_batch_mask_polygons(masks, None, mask_options)) == len(masks)
+        assert len(traced_rles) == 2
+        assert (polygon_cache.hits, polygon_cache.misses) == (2, 2)
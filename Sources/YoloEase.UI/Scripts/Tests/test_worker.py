@@ -0,0 +1,51 @@
+import io
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Benchmarks"))
+
+import ConvertCVATtoYolo8 as converter
+from generate_cvat_dataset import generate_dataset
+
+
+def run_requests(requests):
+    output_stream = io.StringIO()
+    converter.run_worker(io.StringIO("".join(json.dumps(request) + "\n" for request in requests)), output_stream)
+    return [json.loads(line) for line in output_stream.getvalue().splitlines()]
+
+
+def test_consecutive_requests_do_not_share_state(tmp_path, capsys):
+    annotations_file = generate_dataset(str(tmp_path / "data"), 20, masks_per_image=1)
+
+    def request(request_id, *arguments):
+        return {
+            "id": request_id,
+            "arguments": ["--inputAnnotationsFiles", annotations_file, "--outputDirectory",
+                          str(tmp_path / f"out{request_id}"), "--trainPercentage", "75", *arguments],
+        }
+
+    events = run_requests([
+        request(1, "--progress", "json"),
+        request(2),
+        request(3, "--tileSize", "-1"),
+        request(4, "--progress", "json"),
+    ])
+
+    assert [event["event"] for event in events if event["event"] != "progress"] == ["ready", "result", "result", "error", "result"]
+    progress_ids = {event["id"] for event in events if event["event"] == "progress"}
+    assert progress_ids == {1, 4}
+    results = {event["id"]: event["result"] for event in events if event["event"] == "result"}
+    # metrics of a request cover only its own run
+    for stage in ("annotation_parsing", "box_conversion", "mask_conversion"):
+        assert results[1]["stages"][stage]["items"] == results[2]["stages"][stage]["items"] == results[4]["stages"][stage]["items"]
+    assert capsys.readouterr().out == ""
+    assert converter.progress_reporter.stream is None and converter.progress_reporter.request_id is None
+
+    # the library API does not inherit progress reporting configured by an earlier run
+    previous_progress_stream = io.StringIO()
+    converter.progress_reporter.configure(previous_progress_stream, request_id=4)
+    converter.progress_reporter.start("convert")
+    converter.convert([annotations_file], str(tmp_path / "api"), {"train_val_percentage": 75})
+    assert previous_progress_stream.getvalue() == ""
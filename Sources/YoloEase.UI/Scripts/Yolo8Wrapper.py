@@ -1,3 +1,43 @@
-import ultralytics
+import argparse
+import platform
+import sys
 
-ultralytics.checks()
\ No newline at end of file
+# Packages reported without importing them, ultralytics and torch take seconds to import
+REPORTED_PACKAGES = ["ultralytics", "torch", "torchvision", "opencv-python", "opencv-python-headless", "numpy", "onnx", "onnxruntime"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reports the Python environment used to run YOLOv8")
+    parser.add_argument(
+        "--full",
+        help="Run the complete ultralytics.checks() (imports torch, queries devices and disk/RAM usage)",
+        action="store_true"
+    )
+    args = parser.parse_args()
+
+    if args.full:
+        import ultralytics
+
+        ultralytics.checks()
+    else:
+        print_environment()
+
+
+def print_environment():
+    """
+    Prints Python, OS and installed package versions from package metadata, without importing the packages.
+    """
+    from importlib import metadata
+
+    print(f"Python-{platform.python_version()} ({sys.executable})")
+    print(f"OS: {platform.platform()}")
+    for package in REPORTED_PACKAGES:
+        try:
+            version = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            version = "not installed"
+        print(f"{package}: {version}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,15 @@
 ﻿import os
 import argparse
 import shutil
-from ultralytics import YOLO
+import tempfile
 from ConvertCVATtoYolo8_cls import convert_annotations_to_yolo
+from OnnxExport import ExportOptions, add_export_arguments, create_export_options, run_export_stage
+
+IMAGE_SIZE = 100
+PRETRAINED_MODEL = "yolov8n-cls.pt"
+DEFAULT_EPOCHS = 100
+# epochs without improvement of validation accuracy before training stops
+DEFAULT_PATIENCE = 10
 
 
 def main():
@@ -18,40 +25,94 @@ def main_internal():
     print("Options:", script_options)
 
     output_folder = os.path.abspath(script_options.output_directory)
-
-    # Convert CVAT annotations to YOLO format
-    convert_annotations_to_yolo(script_options.input_annotations_files, output_folder)
-
-    # Load the model
-    model = YOLO("yolov8n-cls.pt")  # Load the pre-trained model
-    
     save_directory = os.path.join(output_folder, "runs")
-
-    # Define the training parameters
-    model.train(
-        data=output_folder,  # Path to the data.yaml file
-        imgsz=100,  # Image size for training
-        epochs=100,  # Number of training epochs
-        task="classify",  # Task (classify, detect, segment)
-        mode="train",  # Training mode,
-        project=save_directory
-    )
+    weights_folder = os.path.join(save_directory, "train", "weights")
+
+    if script_options.resume:
+        last_model_path = os.path.join(weights_folder, "last.pt")
+        if not os.path.exists(last_model_path):
+            raise FileNotFoundError(f"Can not resume training, {last_model_path} does not exist")
+        # ultralytics takes seconds to import, so it is loaded only once it is needed
+        from ultralytics import YOLO
+
+        # the interrupted run continues with its own dataset and training arguments, stored in the checkpoint
+        YOLO(last_model_path).train(resume=True)
+        data_folder = get_dataset_folder(script_options, output_folder)
+    else:
+        with tempfile.TemporaryDirectory() as previous_weights_folder:
+            initial_model_path = PRETRAINED_MODEL
+            if script_options.warm_start:
+                previous_model_path = os.path.join(weights_folder, "best.pt")
+                if os.path.exists(previous_model_path):
+                    # conversion deletes the output folder together with weights of the previous cycle
+                    initial_model_path = shutil.copy2(previous_model_path, previous_weights_folder)
+                    print(f"Warm-starting from {previous_model_path}")
+                else:
+                    print(f"No weights of a previous cycle at {previous_model_path}, starting from {PRETRAINED_MODEL}")
+
+            data_folder = convert_dataset(script_options, output_folder)
+
+            # ultralytics takes seconds to import, so it is loaded only once it is needed
+            from ultralytics import YOLO
+
+            model = YOLO(initial_model_path)
+            model.train(
+                data=data_folder,  # Path to the dataset folder
+                imgsz=IMAGE_SIZE,  # Image size for training
+                epochs=script_options.epochs,  # Maximum number of training epochs
+                patience=script_options.patience,  # Stops early once validation accuracy stops improving
+                task="classify",  # Task (classify, detect, segment)
+                mode="train",  # Training mode,
+                project=save_directory
+            )
 
     # Load the trained model
-    trained_model_path = os.path.join(save_directory, "train", "weights", "best.pt")
+    trained_model_path = os.path.join(weights_folder, "best.pt")
     model = YOLO(trained_model_path)
 
-    # Export the model to ONNX format
-    model.export(format="onnx")
+    # Export the model to ONNX format, batch size is left dynamic when larger batches are benchmarked
+    export_options = script_options.export_options
+    dynamic_batch = export_options.benchmark and any(batch_size > 1 for batch_size in export_options.batch_sizes)
+    onnx_model_path = model.export(format="onnx", imgsz=IMAGE_SIZE, dynamic=dynamic_batch)
+
+    if export_options.is_enabled:
+        run_export_stage(onnx_model_path, data_folder, IMAGE_SIZE, export_options)
     return
 
 
+def convert_dataset(script_options, output_folder):
+    """
+    Converts CVAT annotations to a YOLO classification dataset in the output folder, returns the dataset folder.
+    """
+    if script_options.crops:
+        # box crops are cut already resized, the converter (and numpy with it) is loaded only in this mode
+        from ConvertCVATtoYolo8 import convert
+
+        convert(
+            script_options.input_annotations_files,
+            output_folder,
+            {
+                "train_val_percentage": 75,
+                "tasks": ["crops"],
+                "crop_size": IMAGE_SIZE,
+                "crop_padding": script_options.crop_padding,
+                "workers": 0,
+            },
+        )
+    else:
+        convert_annotations_to_yolo(script_options.input_annotations_files, output_folder)
+    return get_dataset_folder(script_options, output_folder)
+
+
+def get_dataset_folder(script_options, output_folder):
+    return os.path.join(output_folder, "crops") if script_options.crops else output_folder
+
+
 def parse_options():
     parser = argparse.ArgumentParser()
     parser.add_argument(
         "--inputAnnotationsFiles",
         help="Paths to CVAT 1.1 annotation file (annotations.xml)",
-        required=True,
         nargs="+",
     )
     parser.add_argument(
@@ -64,20 +125,75 @@ def parse_options():
         help="Use symbolic links instead of copying files",
         action="store_true"
     )
+    parser.add_argument(
+        "--crops",
+        help="Train on crops of box annotations sorted by their labels instead of whole images sorted by their tags",
+        action="store_true"
+    )
+    parser.add_argument(
+        "--cropPadding",
+        type=float,
+        default=0.1,
+        help="Box crops include this part of the box width and height around the box on every side",
+    )
+    parser.add_argument(
+        "--warmStart",
+        help="Start training from runs/train/weights/best.pt of the previous cycle in the output directory, "
+             f"from {PRETRAINED_MODEL} if there is none",
+        action="store_true"
+    )
+    parser.add_argument(
+        "--resume",
+        help="Resume an interrupted training from runs/train/weights/last.pt in the output directory, "
+             "the dataset is not converted again",
+        action="store_true"
+    )
+    parser.add_argument(
+        "--epochs",
+        type=int,
+        default=DEFAULT_EPOCHS,
+        help="Maximum number of training epochs",
+    )
+    parser.add_argument(
+        "--patience",
+        type=int,
+        default=DEFAULT_PATIENCE,
+        help="Stop training after this many epochs without improvement of validation accuracy, 0 disables early stopping",
+    )
+    add_export_arguments(parser)
     args = parser.parse_args()
+    if not args.resume and not args.inputAnnotationsFiles:
+        parser.error("the following arguments are required: --inputAnnotationsFiles")
+    if args.resume and args.warmStart:
+        parser.error("--resume conflicts with --warmStart, a resumed training continues from its own weights")
 
     return ScriptOptions(
         input_annotations_files=args.inputAnnotationsFiles,
         output_directory=args.outputDirectory,
-        use_symlinks=args.symlinks
+        use_symlinks=args.symlinks,
+        crops=args.crops,
+        crop_padding=args.cropPadding,
+        warm_start=args.warmStart,
+        resume=args.resume,
+        epochs=args.epochs,
+        patience=args.patience,
+        export_options=create_export_options(args)
     )
 
 
 class ScriptOptions:
-    def __init__(self, input_annotations_files, output_directory, use_symlinks):
+    def __init__(self, input_annotations_files, output_directory, use_symlinks, crops=False, crop_padding=0.1,
+                 warm_start=False, resume=False, epochs=DEFAULT_EPOCHS, patience=DEFAULT_PATIENCE, export_options=None):
         self.input_annotations_files = input_annotations_files
         self.output_directory = output_directory
         self.use_symlinks = use_symlinks
+        self.crops = crops
+        self.crop_padding = crop_padding
+        self.warm_start = warm_start
+        self.resume = resume
+        self.epochs = epochs
+        self.patience = patience
+        self.export_options = export_options or ExportOptions()
 
 
 if __name__ == "__main__":
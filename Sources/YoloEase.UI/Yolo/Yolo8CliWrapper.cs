@@ -5,6 +5,7 @@ using System.Threading;
 using CliWrap;
 using CliWrap.Builders;
 using CliWrap.EventStream;
+using Newtonsoft.Json;
 using YoloEase.UI.Prerequisites;
 
 namespace YoloEase.UI.Yolo;
@@ -18,6 +19,16 @@ public sealed record Yolo8ConvertAnnotationsArguments
     public FileInfo[] Annotations { get; init; }
     public bool UseSymlinks { get; init; }
     public int TrainValPercentage { get; init; } = 80;
+
+    /// <summary>
+    /// Updates an existing output directory in place instead of rebuilding it, only changed annotations are re-converted.
+    /// </summary>
+    public bool Incremental { get; init; }
+
+    /// <summary>
+    /// When set, the script writes wall time, CPU time and item counts of each conversion stage to this JSON file.
+    /// </summary>
+    public FileInfo? MetricsFile { get; init; }
 }
 
 /// <summary>
@@ -26,6 +37,7 @@ public sealed record Yolo8ConvertAnnotationsArguments
 public sealed partial class Yolo8CliWrapper : DisposableReactiveObjectWithLogger
 {
     private const string DefaultTrainingWorkersArgument = "workers=0";
+    private const string ConvertProgressEventPrefix = "{\"event\":\"progress\"";
 
     [GeneratedRegex("\\s*(?'EpochCurrent'\\d+)\\/(?'EpochMax'\\d+)\\s*(?'VideoRAM'[\\w\\.]+).*?(?'EpochProgressPercentage'\\d+)%", RegexOptions.Compiled | RegexOptions.IgnoreCase)]
     private static partial Regex TrainProgressParserRegex();
@@ -87,9 +99,10 @@ public sealed partial class Yolo8CliWrapper : DisposableReactiveObjectWithLogger
 
     public async Task ConvertAnnotationsToYolo8FromCvat(
         Yolo8ConvertAnnotationsArguments settings,
-        Action<YoloCommandOutput>? outputHandler = null)
+        Action<YoloCommandOutput>? outputHandler = null,
+        Action<Yolo8ConvertProgressUpdate>? updateHandler = null)
     {
-        if (settings.OutputDirectory.Exists)
+        if (settings.OutputDirectory.Exists && !settings.Incremental)
         {
             settings.OutputDirectory.Delete(recursive: true);
         }
@@ -115,6 +128,22 @@ public sealed partial class Yolo8CliWrapper : DisposableReactiveObjectWithLogger
                     x.Add($"--symlinks", escape: false);
                 }
 
+                if (settings.Incremental)
+                {
+                    x.Add($"--incremental", escape: false);
+                }
+
+                if (settings.MetricsFile != null)
+                {
+                    x.Add($"--metricsFile", escape: false);
+                    x.Add($"\"{settings.MetricsFile.FullName}\"", escape: false);
+                }
+
+                if (updateHandler != null)
+                {
+                    x.Add($"--progress json", escape: false);
+                }
+
                
                 x.Add($"--outputDirectory", escape: false);
                 x.Add($"\"{settings.OutputDirectory.FullName}\"", escape: false);
@@ -135,7 +164,34 @@ public sealed partial class Yolo8CliWrapper : DisposableReactiveObjectWithLogger
         ReportCommandStart(cmd, outputHandler);
         await foreach (var cmdEvent in cmd.ListenAndLogAsync())
         {
-            CaptureCommandEvent(cmdEvent, outputHandler);
+            var text = CaptureCommandEvent(cmdEvent, outputHandler);
+            if (updateHandler == null || cmdEvent is not StandardOutputCommandEvent || !text.StartsWith(ConvertProgressEventPrefix, StringComparison.Ordinal))
+            {
+                continue;
+            }
+
+            Yolo8ConvertProgressUpdate? progressUpdateRaw;
+            try
+            {
+                progressUpdateRaw = JsonConvert.DeserializeObject<Yolo8ConvertProgressUpdate>(text);
+            }
+            catch (JsonException e)
+            {
+                Log.Warn($"Failed to parse conversion progress event: {text}", e);
+                continue;
+            }
+
+            if (progressUpdateRaw == null)
+            {
+                continue;
+            }
+
+            var progressUpdate = progressUpdateRaw with
+            {
+                ProgressPercentage = progressUpdateRaw.Total > 0 ? (float) progressUpdateRaw.Done / progressUpdateRaw.Total.Value * 100 : null
+            };
+            Log.Debug($"Progress update: {progressUpdate}");
+            updateHandler(progressUpdate);
         }
 
         settings.OutputDirectory.Refresh();
@@ -0,0 +1,30 @@
+using Newtonsoft.Json;
+
+namespace YoloEase.UI.Yolo;
+
+/// <summary>
+/// Reports conversion progress parsed from JSON progress events of the conversion script.
+/// </summary>
+public sealed record Yolo8ConvertProgressUpdate
+{
+    [JsonProperty("stage")]
+    public string Stage { get; init; } = string.Empty;
+
+    [JsonProperty("done")]
+    public int Done { get; init; }
+
+    /// <summary>
+    /// Total number of items of the stage, null while the script does not know it yet.
+    /// </summary>
+    [JsonProperty("total")]
+    public int? Total { get; init; }
+
+    /// <summary>
+    /// Items per second since the stage has started.
+    /// </summary>
+    [JsonProperty("rate")]
+    public float Rate { get; init; }
+
+    [JsonIgnore]
+    public float? ProgressPercentage { get; init; }
+}